@@ -0,0 +1,84 @@
+"""
+Benchmark the client against the local modem emulator.
+
+Reports calls per second and p50/p99 latency for the main client calls, so
+throughput regressions in the client show up without a modem in the loop.
+"""
+import argparse
+import logging
+import os
+import sys
+
+# Push the parent directory onto PYTHONPATH before compal module is imported
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compal import (  # noqa
+    Compal, PortForwards, WifiSettings, BackupRestore, Proto, Get)
+from compal.emulator import ModemEmulator  # noqa
+from benchmarks.harness import measure, report  # noqa
+
+KEY = 'password'
+
+
+def run(iterations, latency, num_forwards):
+    """
+    Run all client benchmarks against a fresh emulator
+    """
+    results = []
+    with ModemEmulator(latency=latency, key=KEY) as emulator:
+        modem = Compal(emulator.router_ip, KEY)
+
+        def login_logout():
+            """
+            Full login/logout cycle
+            """
+            modem.login()
+            modem.logout()
+
+        results.append(measure('Compal.login+logout', login_logout,
+                               iterations))
+
+        modem.login()
+        results.append(measure(
+            'Compal.xml_getter(CM_SYSTEM_INFO)',
+            lambda: modem.xml_getter(Get.CM_SYSTEM_INFO, {}), iterations))
+
+        forwards = PortForwards(modem)
+        for idx in range(num_forwards):
+            forwards.add_forward('192.168.178.{}'.format(10 + idx % 200),
+                                 10000 + idx, 10000 + idx, Proto.tcp)
+        results.append(measure('PortForwards.rules',
+                               lambda: list(forwards.rules), iterations))
+
+        wifi = WifiSettings(modem)
+        results.append(measure('WifiSettings.wifi_settings',
+                               lambda: wifi.wifi_settings, iterations))
+
+        backup = BackupRestore(modem)
+        results.append(measure('BackupRestore.backup', backup.backup,
+                               iterations))
+
+        modem.logout()
+
+        if emulator.state.rejected:
+            print("[warning]: emulator rejected {} requests".format(
+                emulator.state.rejected))
+
+    report(results)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Client benchmark')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Simulated server latency per request [s]')
+    parser.add_argument('--forwards', type=int, default=32,
+                        help='Number of port forwards on the emulator')
+
+    args = parser.parse_args()
+
+    # Keep per-call logging out of the measurements
+    logging.getLogger('compal').setLevel(logging.WARNING)
+
+    run(args.iterations, args.latency, args.forwards)
@@ -0,0 +1,82 @@
+"""
+Guard the startup cost of `import compal`.
+
+Runs `python -X importtime -c 'import compal'` in fresh interpreters and
+reports the median cumulative import time of the package. Fails when the
+time exceeds `--max-ms`, or when one of the lazily loaded dependencies is
+imported at import time.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Loaded on first use, never by `import compal`
+LAZY_MODULES = ('lxml', 'requests', 'xml.dom.minidom')
+
+CHECK = ("import sys, compal; "
+         "print(','.join(m for m in {!r} if m in sys.modules))".format(
+             LAZY_MODULES))
+
+
+def run_python(*args):
+    """
+    Run a fresh interpreter in the repository root
+    """
+    env = dict(os.environ)
+    # Measure with bytecode caches, as an installed package would
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return subprocess.run([sys.executable] + list(args), cwd=ROOT, env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+
+def import_time_us():
+    """
+    Cumulative import time of the `compal` package [us]
+    """
+    stderr = run_python('-X', 'importtime', '-c', 'import compal').stderr
+    for line in stderr.splitlines():
+        _, cumulative, name = line.split('|')
+        if name.strip() == 'compal':
+            return int(cumulative)
+    raise ValueError("No import time reported for compal")
+
+
+def run(repeat):
+    """
+    @returns (median import time [ms], eagerly loaded lazy modules)
+    """
+    # Write the bytecode caches
+    run_python('-c', 'import compal')
+
+    samples = [import_time_us() / 1000.0 for _ in range(repeat)]
+    loaded = [m for m in run_python('-c', CHECK).stdout.strip().split(',')
+              if m]
+    return statistics.median(samples), loaded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import time benchmark')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='Fail when the median exceeds this')
+
+    args = parser.parse_args()
+
+    median, loaded = run(args.repeat)
+    print("import compal: {:.2f} ms (median of {})".format(
+        median, args.repeat))
+
+    failed = False
+    if loaded:
+        print("[error]: loaded at import time: {}".format(', '.join(loaded)))
+        failed = True
+    if args.max_ms is not None and median > args.max_ms:
+        print("[error]: exceeds {:.2f} ms".format(args.max_ms))
+        failed = True
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,95 @@
+"""
+Compare the HTTP transports of the client against the local modem emulator.
+
+Runs the same calls over the default `requests` transport and
+`HTTPClientTransport`, and reports calls per second, p50/p99 latency and
+the client CPU time per call. The CPU time is measured on the calling
+thread only, so the emulator's threads do not count.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+# Push the parent directory onto PYTHONPATH before compal module is imported
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compal import Compal, PortForwards, Proto, Get  # noqa
+from compal.emulator import ModemEmulator  # noqa
+from compal.transport import HTTPClientTransport  # noqa
+from benchmarks.harness import measure, report  # noqa
+
+KEY = 'password'
+
+TRANSPORTS = [
+    ('requests', lambda: None),
+    ('http', HTTPClientTransport),
+]
+
+
+def measure_cpu(name, func, iterations):
+    """
+    `measure` plus the CPU time of the calling thread per call [s]
+    """
+    cpu_start = time.thread_time()
+    timings = measure(name, func, iterations, warmup=0)
+    return timings, (time.thread_time() - cpu_start) / iterations
+
+
+def run(iterations, latency, num_forwards):
+    """
+    Run the benchmarks for every transport against a fresh emulator
+    """
+    results = []
+    cpu = []
+    for transport_name, transport in TRANSPORTS:
+        with ModemEmulator(latency=latency, key=KEY) as emulator:
+            modem = Compal(emulator.router_ip, KEY, transport=transport())
+            modem.login()
+            forwards = PortForwards(modem)
+            for idx in range(num_forwards):
+                forwards.add_forward('192.168.178.{}'.format(10 + idx % 200),
+                                     10000 + idx, 10000 + idx, Proto.tcp)
+
+            # Warm up the connection
+            modem.xml_getter(Get.CM_SYSTEM_INFO, {})
+            for name, func in [
+                    ('getter(CM_SYSTEM_INFO)',
+                     lambda: modem.xml_getter(Get.CM_SYSTEM_INFO, {})),
+                    ('getter(FORWARDING)',
+                     lambda: modem.xml_getter(Get.FORWARDING, {})),
+                    ('PortForwards.rules', lambda: list(forwards.rules)),
+            ]:
+                timings, cpu_per_call = measure_cpu(
+                    '{} {}'.format(transport_name, name), func, iterations)
+                results.append(timings)
+                cpu.append((timings.name, cpu_per_call))
+            modem.logout()
+
+            if emulator.state.rejected:
+                print("[warning]: emulator rejected {} requests".format(
+                    emulator.state.rejected))
+
+    report(results)
+    print()
+    print("{:<32} {:>10}".format('benchmark', 'CPU [us]'))
+    for name, cpu_per_call in cpu:
+        print("{:<32} {:>10.1f}".format(name, cpu_per_call * 1e6))
+    return results, cpu
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Transport benchmark')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Simulated server latency per request [s]')
+    parser.add_argument('--forwards', type=int, default=32,
+                        help='Number of port forwards on the emulator')
+
+    args = parser.parse_args()
+
+    # Keep per-call logging out of the measurements
+    logging.getLogger('compal').setLevel(logging.WARNING)
+
+    run(args.iterations, args.latency, args.forwards)
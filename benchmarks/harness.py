@@ -0,0 +1,65 @@
+"""
+Helpers to time client calls and report throughput and latency percentiles
+"""
+import time
+
+
+class Timings(object):
+    """
+    Latencies (in seconds) of the calls of a single benchmark
+    """
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+        self.elapsed = 0.0
+
+    @property
+    def calls_per_second(self):
+        """
+        Throughput over the wall time of the run
+        """
+        return len(self.samples) / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, pct):
+        """
+        Latency percentile (nearest rank)
+        """
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = int(round(pct / 100.0 * (len(ordered) - 1)))
+        return ordered[rank]
+
+    def __str__(self):
+        return "{:<32} {:>10.1f} {:>10.3f} {:>10.3f}".format(
+            self.name, self.calls_per_second,
+            self.percentile(50) * 1000, self.percentile(99) * 1000)
+
+
+def measure(name, func, iterations=200, warmup=10):
+    """
+    Call `func` `iterations` times after `warmup` untimed calls
+    """
+    for _ in range(warmup):
+        func()
+
+    timings = Timings(name)
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(iterations):
+        before = clock()
+        func()
+        timings.samples.append(clock() - before)
+    timings.elapsed = clock() - start
+
+    return timings
+
+
+def report(results):
+    """
+    Print a table of benchmark results
+    """
+    print("{:<32} {:>10} {:>10} {:>10}".format(
+        'benchmark', 'calls/s', 'p50 [ms]', 'p99 [ms]'))
+    for timings in results:
+        print(timings)
@@ -1,27 +1,48 @@
 """
 Client for the Compal CH7465LG/Ziggo Connect box cable modem
 """
-import io
-import itertools
 import logging
-import urllib
+import threading
+import time
 
-from xml.dom import minidom
 from enum import Enum
 from collections import OrderedDict
-from lxml import etree
 
 # recordclass is a mutable variation on `collections.NamedTuple
 from recordclass import recordclass
 
-import requests
-
+from . import schema, tracing
 from .functions import Set, Get
+from .protocol import (  # noqa
+    form_data, initial_setup_calls, login_params, login_sid)
 
 LOGGER = logging.getLogger(__name__)
-logging.basicConfig()
 
-LOGGER.setLevel(logging.INFO)
+
+# lxml, minidom and requests are imported on first use: a large share of a
+# short-lived CLI run was spent importing them.
+def _etree():
+    """
+    `lxml.etree`
+    """
+    from lxml import etree
+    return etree
+
+
+def _minidom():
+    """
+    `xml.dom.minidom`
+    """
+    from xml.dom import minidom
+    return minidom
+
+
+def _requests():
+    """
+    `requests`
+    """
+    import requests
+    return requests
 
 
 class NatMode(Enum):
@@ -36,30 +57,125 @@ class Compal(object):
     """
     Basic functionality for the router's API
     """
-    def __init__(self, router_ip, key=None, timeout=10):
+    def __init__(self, router_ip, key=None, timeout=10, cache=None,
+                 session_store=None, lazy=False, metrics=None, tracer=None,
+                 recovery=None, transport=None):
         self.router_ip = router_ip
         self.timeout = timeout
         self.key = key
+        # Optional `compal.cache.ResponseCache` for getter responses
+        self.cache = cache
+        # Optional `compal.session_store.SessionStore` to resume sessions
+        self.session_store = session_store
+        self.resumed = False
+        # Optional `compal.metrics.Metrics` recording every request
+        self.metrics = metrics
+        # Optional tracer, see `compal.tracing`; the global one otherwise
+        self.tracer = tracer
+        # Optional `compal.recovery.SessionRecovery`: log in again and replay
+        # getters when the session is lost
+        self.recovery = recovery
+        self.logged_in = False
+
+        # HTTP transport, see `compal.transport`; a `requests.Session` by
+        # default
+        if transport is None:
+            transport = _requests().Session()
+            # limit the number of redirects
+            transport.max_redirects = 3
+        self.session = transport
+        # Raised by the transport when the modem does not answer in time
+        self.timeout_errors = getattr(transport, 'timeout_errors', None) or \
+            (_requests().exceptions.ReadTimeout,)
 
-        self.session = requests.Session()
-        # limit the number of redirects
-        self.session.max_redirects = 3
-
-        # after a response is received, process the token field of the response
-        self.session.hooks['response'].append(self.token_handler)
         # session token is initially empty
         self.session_token = None
+        self.initial_res = None
+
+        # In lazy mode the connection is set up by the first request. The
+        # lock makes concurrent first requests wait for a single connect;
+        # `connecting` lets the requests of `connect` itself through.
+        self.connected = False
+        self.connecting = False
+        self.connect_lock = threading.RLock()
+        if not lazy:
+            self.ensure_connected()
+
+    def ensure_connected(self):
+        """
+        Resume the stored session or connect, unless this already happened
+        """
+        if self.connected:
+            return
+        with self.connect_lock:
+            if self.connected or self.connecting:
+                return
+            if not self.resume_session():
+                self.connect()
+
+    def connect(self):
+        """
+        Get the initial token. Performs the initial installation when the
+        modem redirects to it. A failed connect is retried by the next
+        request.
+
+        Blocking. In lazy mode, the connections to several modems can be set
+        up concurrently from asyncio with
+        `loop.run_in_executor(None, modem.connect)`.
+        """
+        with self.connect_lock:
+            LOGGER.debug("Getting initial token")
+            # check the initial URL. If it is redirected, perform the initial
+            # installation
+            self.connecting = True
+            try:
+                self.initial_res = self.get('/')
+            finally:
+                self.connecting = False
+            self.connected = True
+
+            url = self.initial_res.url
+            if url.endswith('common_page/FirstInstallation.html'):
+                self.initial_setup()
+            elif not url.endswith('common_page/login.html'):
+                LOGGER.error("Was not redirected to login page:"
+                             " concurrent session?")
+
+            return self.initial_res
 
-        LOGGER.debug("Getting initial token")
-        # check the initial URL. If it is redirected, perform the initial
-        # installation
-        self.initial_res = self.get('/')
+    def resume_session(self):
+        """
+        Restore the SID, token and Referer from the session store. The
+        session is validated on `login`.
+        """
+        if self.session_store is None:
+            return False
+
+        stored = self.session_store.load(self.router_ip)
+        if stored is None:
+            return False
 
-        if self.initial_res.url.endswith('common_page/FirstInstallation.html'):
-            self.initial_setup()
-        elif not self.initial_res.url.endswith('common_page/login.html'):
-            LOGGER.error("Was not redirected to login page:"
-                         " concurrent session?")
+        LOGGER.debug("Resuming session %s", stored.sid)
+        self.session.cookies.update({'SID': stored.sid,
+                                     'sessionToken': stored.token})
+        self.session.headers.update({'Referer': stored.referer})
+        self.session_token = stored.token
+        self.resumed = True
+        self.connected = True
+        return True
+
+    def suspend(self):
+        """
+        Store the session in the session store instead of logging out, so
+        that the next process can resume it.
+        """
+        if self.session_store is None:
+            raise ValueError("No session store configured")
+
+        self.session_store.save(self.router_ip,
+                                self.session.cookies.get('SID'),
+                                self.session_token,
+                                self.session.headers.get('Referer'))
 
     def initial_setup(self, new_key=None):
         """
@@ -73,26 +189,11 @@ class Compal(object):
         if not self.key:
             raise ValueError("No key/password availalbe")
 
-        self.xml_getter(Get.MULTILANG, {})
-        self.xml_getter(Get.LANGSETLIST, {})
-        self.xml_getter(Get.MULTILANG, {})
-
-        self.xml_setter(Set.LANGUAGE, {'lang': 'en'})
-        # Login or change password? Not sure.
-        self.xml_setter(Set.LOGIN, OrderedDict([
-            ('Username', 'admin'),
-            ('Password', self.key)
-        ]))
-        # Get current wifi settings (?)
-        self.xml_getter(Get.WIRELESSBASIC, {})
-
-        # Some sheets with hints, no request
-        # installation is done:
-        self.xml_setter(Set.INSTALL_DONE, {
-            'install': 0,
-            'iv': 1,
-            'en': 0
-        })
+        for getter, fun, params in initial_setup_calls(self.key):
+            if getter:
+                self.xml_getter(fun, params)
+            else:
+                self.xml_setter(fun, params)
 
     def url(self, path):
         """
@@ -126,25 +227,36 @@ class Compal(object):
         **The router is sensitive to the ordering of the fields**
         (Which is a code smell)
         """
-        data = OrderedDict()
-        data['token'] = self.session_token
-
-        if 'fun' in _data:
-            data['fun'] = _data.pop('fun')
-
-        data.update(_data)
+        self.ensure_connected()
+        with tracing.span(self, 'compal.encode'):
+            data = form_data(self.session_token, _data)
 
         LOGGER.debug("POST [%s]: %s", path, data)
 
-        res = self.session.post(self.url(path), data=data,
-                                allow_redirects=False, timeout=self.timeout,
-                                **kwargs)
+        start = time.perf_counter()
+        with tracing.span(self, 'compal.network', {
+                'http.method': 'POST', 'http.target': path,
+                'compal.function': data.get('fun')}) as span:
+            res = self.session.post(self.url(path), data=data,
+                                    allow_redirects=False,
+                                    timeout=self.timeout, **kwargs)
+            span.set_attribute('http.status_code', res.status_code)
+        # after a response is received, process the token field of the
+        # response
+        self.token_handler(res)
+        if self.metrics is not None:
+            self.metrics.record_response(res, path, data.get('fun'),
+                                         time.perf_counter() - start,
+                                         kwargs.get('stream', False))
 
         return res
 
     def post_binary(self, path, binary_data, filename, **kwargs):
         """
         Perform a post request with a file as form-data in it's body.
+
+        `binary_data` is bytes or a file-like object with a length (see
+        `UploadReader`), which is sent in chunks.
         """
 
         headers = {
@@ -152,8 +264,19 @@ class Compal(object):
                 'form-data; name="file"; filename="%s"' % filename,  # noqa
             'Content-Type': 'application/octet-stream'
         }
-        self.session.post(self.url(path), data=binary_data, headers=headers,
-                          **kwargs)
+        kwargs.setdefault('timeout', self.timeout)
+        self.ensure_connected()
+        start = time.perf_counter()
+        with tracing.span(self, 'compal.network', {
+                'http.method': 'POST', 'http.target': path}) as span:
+            res = self.session.post(self.url(path), data=binary_data,
+                                    headers=headers, **kwargs)
+            span.set_attribute('http.status_code', res.status_code)
+        self.token_handler(res)
+        if self.metrics is not None:
+            self.metrics.record_response(res, path, None,
+                                         time.perf_counter() - start)
+        return res
 
     def get(self, path, **kwargs):
         """
@@ -161,59 +284,115 @@ class Compal(object):
 
         Wraps `requests.get` and sets the required referer.
         """
-        res = self.session.get(self.url(path), timeout=self.timeout, **kwargs)
+        self.ensure_connected()
+        start = time.perf_counter()
+        with tracing.span(self, 'compal.network', {
+                'http.method': 'GET', 'http.target': path}) as span:
+            res = self.session.get(self.url(path), timeout=self.timeout,
+                                   **kwargs)
+            span.set_attribute('http.status_code', res.status_code)
+        self.token_handler(res)
+        if self.metrics is not None:
+            self.metrics.record_response(res, path, None,
+                                         time.perf_counter() - start,
+                                         kwargs.get('stream', False))
 
         self.session.headers.update({'Referer': res.url})
         return res
 
-    def xml_getter(self, fun, params):
+    def call(self, path, params, **kwargs):
+        """
+        Post a getter/setter call, through the session recovery if any
+        """
+        if self.recovery is None:
+            return self.post(path, params, **kwargs)
+        return self.recovery.call(self, path, params, **kwargs)
+
+    def xml_getter(self, fun, params, **kwargs):
         """
-        Call `/xml/getter.xml` for the given function and parameters
+        Call `/xml/getter.xml` for the given function and parameters.
+        Extra arguments (e.g. `stream=True`) are passed on to `post`, these
+        calls bypass the cache.
         """
+        cache = self.cache if not kwargs else None
+        if cache is not None:
+            key = cache.key(self.router_ip, fun, params)
+            res = cache.get(key)
+            if res is not None:
+                return res
+
         params['fun'] = fun
 
-        return self.post('/xml/getter.xml', params)
+        res = self.call('/xml/getter.xml', params, **kwargs)
+
+        if cache is not None:
+            cache.put(key, res)
+        return res
 
     def xml_setter(self, fun, params=None):
         """
         Call `/xml/setter.xml` for the given function and parameters.
         The params are optional
         """
+        params = params if params is not None else {}
         params['fun'] = fun
 
-        return self.post('/xml/setter.xml', params)
+        res = self.call('/xml/setter.xml', params)
+
+        if self.cache is not None:
+            self.cache.setter_called(self.router_ip, fun)
+        return res
 
     def login(self, key=None):
         """
         Login. Allow this function to override the key.
-        """
 
-        res = self.xml_setter(Set.LOGIN, OrderedDict([
-            ('Username', 'admin'),
-            ('Password', key if key else self.key)
-        ]))
-
-        if res.status_code != 200:
-            if res.headers['Location'].endswith(
-                    'common_page/Access-denied.html'):
-                raise ValueError('Access denied. '
-                                 'Still logged in somewhere else?')
-            else:
-                raise ValueError('Login failed for unknown reason!')
-
-        tokens = urllib.parse.parse_qs(res.text)
-
-        token_sids = tokens.get('SID')
-        if not token_sids:
-            raise ValueError('No valid session-Id received! Wrong password?')
-
-        token_sid = token_sids[0]
+        A session resumed from the session store is validated with a single
+        getter first; the login is only performed if it expired.
+        """
+        self.ensure_connected()
+        if self.resumed:
+            self.resumed = False
+            # Bypasses the cache: the modem has to answer
+            res = self.post('/xml/getter.xml', {'fun': Get.CM_SYSTEM_INFO})
+            if res.status_code == 200 and res.content:
+                LOGGER.info("[login] resumed SID %s",
+                            self.session.cookies.get('SID'))
+                self.logged_in = True
+                return res
+
+            LOGGER.info("[login] stored session expired")
+            self.session_store.delete(self.router_ip)
+            # Drop the stale cookies, the modem sets new ones
+            for name in ('SID', 'sessionToken'):
+                if name in self.session.cookies:
+                    del self.session.cookies[name]
+            self.session_token = None
+            self.connect()
+
+        res = self.xml_setter(Set.LOGIN, login_params(key if key else
+                                                      self.key))
+
+        token_sid = login_sid(res)
         LOGGER.info("[login] SID %s", token_sid)
 
         self.session.cookies.update({'SID': token_sid})
+        if self.metrics is not None:
+            self.metrics.record_login(self.logged_in)
+        self.logged_in = True
 
         return res
 
+    def snapshot(self, funs, login=True):
+        """
+        Log in once, fetch the getters in `funs` back-to-back, parse them
+        and log out.
+
+        @returns compal.snapshot.Snapshot, indexed by function id
+        """
+        from .snapshot import take_snapshot
+        return take_snapshot(self, funs, login)
+
     def reboot(self):
         """
         Reboot the router
@@ -221,7 +400,7 @@ class Compal(object):
         try:
             LOGGER.info("Performing a reboot - this will take a while")
             return self.xml_setter(Set.REBOOT, {})
-        except requests.exceptions.ReadTimeout:
+        except self.timeout_errors:
             return None
 
     def factory_reset(self):
@@ -233,7 +412,7 @@ class Compal(object):
         try:
             LOGGER.info("Initiating factory reset - this will take a while")
             self.xml_setter(Set.FACTORY_RESET, {})
-        except requests.exceptions.ReadTimeout:
+        except self.timeout_errors:
             pass
         return default_settings
 
@@ -242,6 +421,10 @@ class Compal(object):
         Logout of the router. This is required since only a single session can
         be active at any point in time.
         """
+        if self.session_store is not None:
+            self.session_store.delete(self.router_ip)
+        # The next login is a new session, not a re-login
+        self.logged_in = False
         return self.xml_setter(Set.LOGOUT, {})
 
     def set_modem_mode(self):
@@ -278,6 +461,25 @@ PortForward = recordclass('PortForward', [  # pylint: disable=invalid-name
 PortForward.__new__.__defaults__ = (False, None, None, None,)
 
 
+def port_range(port):
+    """
+    (start, end) for a port or a (start, end) range
+    """
+    if isinstance(port, (tuple, list)):
+        start, end = port
+        return start, end
+    return port, port
+
+
+def rule_key(rule):
+    """
+    Identity of a port forward: local ip, external and internal range and
+    protocol
+    """
+    return (rule.local_ip, port_range(rule.ext_port),
+            port_range(rule.int_port), Proto(rule.proto))
+
+
 class PortForwards(object):
     """
     Manage the port forwards on the modem
@@ -286,7 +488,7 @@ class PortForwards(object):
         # The modem sometimes returns invalid XML when 'strange' values are
         # present in the settings. The recovering parser from lxml is used to
         # handle this.
-        self.parser = etree.XMLParser(recover=True)
+        self.parser = _etree().XMLParser(recover=True)
 
         self.modem = modem
 
@@ -299,28 +501,49 @@ class PortForwards(object):
         """
         res = self.modem.xml_getter(Get.FORWARDING, {})
 
-        xml = etree.fromstring(res.content, parser=self.parser)
-        router_ip = xml.find('LanIP').text
+        return self.parse_rules(res.content)
 
-        def r_int(rule, attr):
-            """
-            integer value for rule's child's text
-            """
-            return int(rule.find(attr).text)
-
-        for rule in xml.findall('instance'):
-            yield PortForward(
-                local_ip=rule.find('local_IP').text,
-                lan_ip=router_ip,
-                id=r_int(rule, 'id'),
-                ext_port=(r_int(rule, 'start_port'),
-                          r_int(rule, 'end_port')),
-                int_port=(r_int(rule, 'start_portIn'),
-                          r_int(rule, 'end_portIn')),
-                proto=Proto(r_int(rule, 'protocol')),
-                enabled=bool(r_int(rule, 'enable')),
-                idd=bool(r_int(rule, 'idd'))
-            )
+    def parse_rules(self, content):
+        """
+        Parse the response to `Get.FORWARDING`
+
+        @returns iterator of PortForward rules
+        """
+        with tracing.span(self.modem, 'compal.parse',
+                          {'compal.function': Get.FORWARDING}) as span:
+            xml = _etree().fromstring(content, parser=self.parser)
+            values = schema.decode(Get.FORWARDING, xml)
+
+            rules = [PortForwards.rule_from_values(rule, values['LanIP'])
+                     for rule in values['instance']]
+            span.set_attribute('compal.records', len(rules))
+        return iter(rules)
+
+    @staticmethod
+    def rule_from_element(rule, router_ip):
+        """
+        PortForward for an `instance` element of the `Get.FORWARDING`
+        response
+        """
+        return PortForwards.rule_from_values(
+            schema.FORWARDING_RULE.decode(rule), router_ip)
+
+    @staticmethod
+    def rule_from_values(rule, router_ip):
+        """
+        PortForward for a decoded `instance` of the `Get.FORWARDING`
+        response
+        """
+        return PortForward(
+            local_ip=rule['local_IP'],
+            lan_ip=router_ip,
+            id=rule['id'],
+            ext_port=(rule['start_port'], rule['end_port']),
+            int_port=(rule['start_portIn'], rule['end_portIn']),
+            proto=Proto(rule['protocol']),
+            enabled=bool(rule['enable']),
+            idd=bool(rule['idd'])
+        )
 
     def update_firewall(self, enabled=False, fragment=False, port_scan=False,
                         ip_flood=False, icmp_flood=False, icmp_rate=15):
@@ -357,8 +580,8 @@ class PortForwards(object):
         Add a port forward. int_port and ext_port can be ranges. Deletion
         param is ignored for now.
         """
-        start_int, end_int = itertools.islice(itertools.repeat(int_port), 0, 2)
-        start_ext, end_ext = itertools.islice(itertools.repeat(ext_port), 0, 2)
+        start_int, end_int = port_range(int_port)
+        start_ext, end_ext = port_range(ext_port)
 
         return self.modem.xml_setter(Set.PORT_FORWARDING, OrderedDict([
             ('action', 'add'),
@@ -399,6 +622,25 @@ class PortForwards(object):
 
         return self.modem.xml_setter(Set.PORT_FORWARDING, params)
 
+    def add_forwards(self, rules):
+        """
+        Add several port forwards in one request, with the '*'-joined
+        encoding of `update_rules` (unverified, see `compal.forwarding`)
+        """
+        from .forwarding import add_forwards
+        return add_forwards(self, rules)
+
+    def bulk_update(self, add=(), delete=(), toggle=(), batch_size=None):
+        """
+        Add new rules and delete or toggle existing ones in few requests,
+        see `compal.forwarding.bulk_update`
+
+        @returns the rules on the modem after the update
+        @raises ValueError if the modem does not reflect the update
+        """
+        from .forwarding import bulk_update
+        return bulk_update(self, add, delete, toggle, batch_size)
+
 
 class FilterAction(Enum):
     """
@@ -483,7 +725,7 @@ class Filters(object):
             data = "EN,"
         else:
             LOGGER.error("No action supplied for MAC filter rule")
-            return
+            return None
 
         data += device_name + ","
         data += mac_addr + ","
@@ -556,147 +798,6 @@ class Filters(object):
         return self.modem.xml_setter(Set.FILTER_RULE, params)
 
 
-RadioSettings = recordclass('RadioSettings', [  # pylint: disable=invalid-name
-    'bss_coexistence', 'radio_2g', 'radio_5g', 'nv_country', 'channel_range'])
-BandSetting = recordclass('BandSetting', [  # pylint: disable=invalid-name
-    'mode', 'ssid', 'bss_enable', 'radio', 'bandwidth', 'tx_mode',
-    'multicast_rate', 'hidden', 'pre_shared_key', 'tx_rate', 're_key',
-    'channel', 'security', 'wpa_algorithm'])
-
-
-class WifiSettings(object):
-    """
-    Configures the WiFi settings
-    """
-
-    def __init__(self, modem):
-        # The modem sometimes returns invalid XML when 'strange' values are
-        # present in the settings. The recovering parser from lxml is used to
-        # handle this.
-        self.parser = etree.XMLParser(recover=True)
-
-        self.modem = modem
-
-    @property
-    def wifi_settings_xml(self):
-        """
-        Get the current wifi settings as XML
-        """
-        xml_content = self.modem.xml_getter(Get.WIRELESSBASIC, {}).content
-        return etree.fromstring(xml_content, parser=self.parser)
-
-    @staticmethod
-    def band_setting(xml, band):
-        """
-        Get the wifi settings for the given band (2g, 5g)
-        """
-        assert band in ('2g', '5g',)
-        band_number = int(band[0])
-
-        def xml_value(attr, coherce=True):
-            """
-            'XmlValue'
-
-            Coherce the value if requested. First the value is parsed as an
-            integer, if this fails it is returned as a string.
-            """
-            val = xml.find(attr).text
-            try:  # Try to coherce to int. If it fails, return string
-                if not coherce:
-                    return val
-                return int(val)
-            except (TypeError, ValueError):
-                return val
-
-        def band_xv(attr, coherce=True):
-            """
-            xml value for the given band
-            """
-            try:
-                return xml_value('{}{}'.format(attr, band.upper()), coherce)
-            except AttributeError:
-                return xml_value('{}{}'.format(attr, band), coherce)
-
-        return BandSetting(
-            radio=band,
-            mode=bool(xml_value('Bandmode') & band_number),
-            ssid=band_xv('SSID', False),
-            bss_enable=bool(band_xv('BssEnable')),
-            bandwidth=band_xv('BandWidth'),
-            tx_mode=band_xv('TransmissionMode'),
-            multicast_rate=band_xv('MulticastRate'),
-            hidden=band_xv('HideNetwork'),
-            pre_shared_key=band_xv('PreSharedKey'),
-            tx_rate=band_xv('TransmissionRate'),
-            re_key=band_xv('GroupRekeyInterval'),
-            channel=band_xv('CurrentChannel'),
-            security=band_xv('SecurityMode'),
-            wpa_algorithm=band_xv('WpaAlgorithm')
-        )
-
-    @property
-    def wifi_settings(self):
-        """
-        Read the wifi settings
-        """
-        xml = self.wifi_settings_xml
-
-        return RadioSettings(
-            radio_2g=WifiSettings.band_setting(xml, '2g'),
-            radio_5g=WifiSettings.band_setting(xml, '5g'),
-            nv_country=int(xml.find('NvCountry').text),
-            channel_range=int(xml.find('ChannelRange').text),
-            bss_coexistence=bool(xml.find('BssCoexistence').text)
-        )
-
-    def update_wifi_settings(self, settings):
-        """
-        Update the wifi settings
-        """
-        # Create the object.
-        def transform_radio(radio_settings):  # rs = radio_settings
-            """
-            Perpare radio settings object for the request.
-            Returns a OrderedDict with the correct keys for this band
-            """
-            # Create the dict
-            out = OrderedDict([
-                ('BandMode', int(radio_settings.mode)),
-                ('Ssid', radio_settings.ssid),
-                ('Bandwidth', radio_settings.bandwidth),
-                ('TxMode', radio_settings.tx_mode),
-                ('MCastRate', radio_settings.multicast_rate),
-                ('Hiden', int(radio_settings.hidden)),
-                ('PSkey', radio_settings.pre_shared_key),
-                ('Txrate', radio_settings.tx_rate),
-                ('Rekey', radio_settings.re_key),
-                ('Channel', radio_settings.channel),
-                ('Security', radio_settings.security),
-                ('Wpaalg', radio_settings.wpa_algorithm)
-            ])
-
-            # Prefix 'wl', Postfix the band
-            return OrderedDict([('wl{}{}'.format(k, radio_settings.radio), v)
-                                for (k, v) in out.items()])
-
-        # Alternate the two setting lists
-        out_s = []
-
-        for item_2g, item_5g in zip(
-                transform_radio(settings.radio_2g).items(),
-                transform_radio(settings.radio_5g).items()):
-            out_s.append(item_2g)
-            out_s.append(item_5g)
-
-            if item_2g[0] == 'wlHiden5g':
-                out_s.append(('wlCoexistence', settings.bss_coexistence))
-
-        # Join the settings
-        out_settings = OrderedDict(out_s)
-
-        return self.modem.xml_setter(Set.WIFI_SETTINGS, out_settings)
-
-
 class DHCPSettings(object):
     """
     Confgure the DHCP settings
@@ -838,7 +939,7 @@ class Diagnostics(object):
         Stop Ping-Test
         """
         return self.modem.xml_setter(Set.STOP_DIAGNOSTIC, {
-            'Ping': DiagToolName.ping
+            'Ping': DiagToolName.ping.value
         })
 
     def get_pingtest_result(self):
@@ -866,7 +967,7 @@ class Diagnostics(object):
         Stop Traceroute
         """
         return self.modem.xml_setter(Set.STOP_DIAGNOSTIC, {
-            'Traceroute': DiagToolName.traceroute
+            'Traceroute': DiagToolName.traceroute.value
         })
 
     def get_traceroute_result(self):
@@ -876,116 +977,11 @@ class Diagnostics(object):
         return self.modem.xml_getter(Get.TRACEROUTE_RESULT, {})
 
 
-class BackupRestore(object):
-    """
-    Configuration backup and restore
-    """
-    def __init__(self, modem):
-        # The modem sometimes returns invalid XML when 'strange' values are
-        # present in the settings. The recovering parser from lxml is used to
-        # handle this.
-        self.parser = etree.XMLParser(recover=True)
+# These build on the client above
+from .scanner import FuncScanner, scan_ids  # noqa pylint: disable=wrong-import-position
+from .wifi import BandSetting, RadioSettings, WifiSettings  # noqa pylint: disable=wrong-import-position
+from .backup import BackupRestore  # noqa pylint: disable=wrong-import-position
 
-        self.modem = modem
-
-    def backup(self, filename=None):
-        """
-        Backup the configuration and return it's content
-        """
-        res = self.modem.xml_getter(Get.GLOBALSETTINGS, {})
-        xml = etree.fromstring(res.content, parser=self.parser)
-
-        if not filename:
-            fname = xml.find('ConfigVenderModel').text + "-Cfg.bin"
-        else:
-            fname = filename
-
-        res = self.modem.get("/xml/getter.xml", params={'filename': fname},
-                             allow_redirects=False)
-        if res.status_code != 200:
-            LOGGER.error("Did not get configfile response!"
-                         " Wrong config file name?")
-            return None
-
-        return res.content
-
-    def restore(self, data):
-        """
-        Restore the configuration from the binary string in `data`
-        """
-        LOGGER.info("Restoring config. Modem will reboot after that")
-        return self.modem.post_binary("/xml/getter.xml",
-                                      data, "Cfg_Restore.bin",
-                                      params={'Restore': len(data)})
-
-
-class FuncScanner(object):
-    """
-    Scan the modem for existing function calls
-    """
-    def __init__(self, modem, pos, key):
-        self.modem = modem
-        self.current_pos = pos
-        self.key = key
-        self.last_login = -1
-
-    @property
-    def is_valid_session(self):
-        """
-        Is the current sesion valid?
-        """
-        LOGGER.debug("Last login %d", self.last_login)
-        res = self.modem.xml_getter(Get.CM_SYSTEM_INFO, {})
-        return res.status_code == 200
-
-    def scan(self, quiet=False):
-        """
-        Scan the modem for functions. This iterates of the function calls
-        """
-        res = None
-        while not res or res.text is '':
-            if not quiet:
-                LOGGER.info("func=%s", self.current_pos)
-
-            res = self.modem.xml_getter(self.current_pos, {})
-            if res.text == '':
-                if not self.is_valid_session:
-                    self.last_login = self.current_pos
-                    self.modem.login(self.key)
-                    if not quiet:
-                        LOGGER.info("Had to login at index %s",
-                                    self.current_pos)
-                    continue
-
-            if res.status_code == 200:
-                self.current_pos += 1
-            else:
-                raise ValueError("HTTP {}".format(res.status_code))
-
-        return res
-
-    def scan_to_file(self):
-        """
-        Scan and write results to `func_i.xml` for all indices
-        """
-        while True:
-            res = self.scan()
-            xmlstr = minidom.parseString(res.content).toprettyxml(indent="   ")
-            with io.open("func_%i.xml" % (self.current_pos - 1), "wt") as f:  # noqa pylint: disable=invalid-name
-                f.write("===== HEADERS =====\n")
-                f.write(str(res.headers))
-                f.write("\n===== DATA ======\n")
-                f.write(xmlstr)
-
-    def enumerate(self):
-        """
-        Enumerate the function calls, outputting id <=> response tag name pairs
-        """
-        while True:
-            res = self.scan(quiet=True)
-            xml = minidom.parseString(res.content)
-            LOGGER.info("%s = %d", xml.documentElement.tagName.upper(),
-                        self.current_pos - 1)
 
 # How to use?
 # modem = Compal('192.168.178.1', '1234567')
@@ -0,0 +1,578 @@
+"""
+asyncio client for the Compal CH7465LG/Ziggo Connect box cable modem
+
+`AsyncCompal` mirrors the surface of `Compal`, but talks HTTP/1.1 over
+asyncio streams. No thread is blocked per modem, so a single event loop can
+drive thousands of modems at once.
+"""
+import asyncio
+import http.client
+import io
+import logging
+import time
+import urllib.parse
+
+from . import PortForwards, WifiSettings, BackupRestore
+from .functions import Set, Get
+from .protocol import (
+    form_data, initial_setup_calls, login_params, login_sid)
+from .upload import open_upload
+
+LOGGER = logging.getLogger(__name__)
+
+# Same limit as the `requests.Session` used by `Compal`
+MAX_REDIRECTS = 3
+
+UPLOAD_CHUNK_SIZE = 65536
+
+
+class Response(object):
+    """
+    The parts of a `requests.Response` that the client uses
+    """
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.cookies = {}
+
+        for cookie in headers.get_all('Set-Cookie') or []:
+            name, _, value = cookie.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value.strip()
+
+    @property
+    def text(self):
+        """
+        Content of the response as unicode
+        """
+        return self.content.decode('utf-8', errors='replace')
+
+
+class HTTPConnection(object):
+    """
+    A single keep-alive HTTP/1.1 connection to the modem
+    """
+    def __init__(self, host, port=80):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        """
+        Send a request and read the response. A stale keep-alive connection
+        is re-opened once, unless the body is a file object that was
+        already (partly) sent.
+
+        The connection is closed when the request is cancelled or times out
+        (e.g. by `asyncio.wait_for`): the rest of the response would be
+        taken for the response to the next request.
+        """
+        reused = self.writer is not None
+        try:
+            try:
+                return await self._request(method, path, body, headers or {})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if not reused or hasattr(body, 'read'):
+                    raise
+                LOGGER.debug("Re-opening connection to %s", self.host)
+                return await self._request(method, path, body, headers or {})
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self.close()
+            raise
+
+    async def _request(self, method, path, body, headers):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port)
+
+        lines = ['{} {} HTTP/1.1'.format(method, path),
+                 'Host: {}'.format(self.host),
+                 'Content-Length: {}'.format(len(body))]
+        lines.extend('{}: {}'.format(k, v) for k, v in headers.items())
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        if hasattr(body, 'read'):
+            # File-like body (`UploadReader`): send it in chunks
+            self.writer.write(head)
+            chunk = body.read(UPLOAD_CHUNK_SIZE)
+            while chunk:
+                self.writer.write(chunk)
+                await self.writer.drain()
+                chunk = body.read(UPLOAD_CHUNK_SIZE)
+        else:
+            self.writer.write(head + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b'\r\n')
+        status_code = int(status_line.split(None, 2)[1])
+        header_bytes = await self.reader.readuntil(b'\r\n\r\n')
+        response_headers = http.client.parse_headers(
+            io.BytesIO(header_bytes))
+
+        if response_headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            content = await self._read_chunked()
+        elif 'Content-Length' in response_headers:
+            content = await self.reader.readexactly(
+                int(response_headers['Content-Length']))
+        else:
+            content = await self.reader.read()
+            self.close()
+
+        if response_headers.get('Connection', '').lower() == 'close':
+            self.close()
+
+        return status_code, response_headers, content
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0],
+                       16)
+            if not size:
+                await self.reader.readuntil(b'\r\n')
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+    def close(self):
+        """
+        Close the connection
+        """
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class AsyncCompal(object):
+    """
+    Basic functionality for the router's API, on asyncio.
+
+    The constructor does no I/O. The first request connects, or call
+    `connect` (or use the object as an async context manager) explicitly.
+
+    Concurrent calls from several tasks are sent one at a time, each with
+    the token of the previous response. Use an `AsyncRequestScheduler` to
+    prioritise or coalesce them.
+    """
+    def __init__(self, router_ip, key=None, timeout=10, cache=None):
+        self.router_ip = router_ip
+        self.timeout = timeout
+        self.key = key
+        # Optional `compal.cache.ResponseCache` for getter responses
+        self.cache = cache
+
+        host, _, port = router_ip.partition(':')
+        self.connection = HTTPConnection(host, int(port) if port else 80)
+        self.cookies = {}
+        self.headers = {}
+        # session token is initially empty
+        self.session_token = None
+        self.initial_res = None
+        self.connected = False
+        # Serialises the requests on the connection and the token chain;
+        # created on the running loop by the first request
+        self.lock = None
+
+    def request_lock(self):
+        """
+        The `asyncio.Lock` held while a request is sent and its response
+        read
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        return self.lock
+
+    async def ensure_connected(self):
+        """
+        Connect, unless this already happened
+        """
+        if not self.connected:
+            await self._connect(reconnect=False)
+
+    async def connect(self):
+        """
+        Get the initial token, like `Compal.connect` does. Performs the
+        initial installation when the modem redirects to it.
+        """
+        return await self._connect(reconnect=True)
+
+    async def _connect(self, reconnect):
+        """
+        `connect`; without `reconnect` only if no other task connected
+        while this one waited for the request lock
+        """
+        async with self.request_lock():
+            if self.connected and not reconnect:
+                return self.initial_res
+            LOGGER.debug("Getting initial token")
+            self.connected = False
+            # Requests of other tasks wait for the lock until the redirects
+            # are followed and the token is set. On errors (also after a
+            # cancellation) the next request connects again.
+            self.initial_res = await self._get('/', True)
+            self.connected = True
+
+        if self.initial_res.url.endswith('common_page/FirstInstallation.html'):
+            await self.initial_setup()
+        elif not self.initial_res.url.endswith('common_page/login.html'):
+            LOGGER.error("Was not redirected to login page:"
+                         " concurrent session?")
+        return self.initial_res
+
+    async def initial_setup(self, new_key=None):
+        """
+        Replay the settings made during initial setup, see
+        `Compal.initial_setup`
+        """
+        LOGGER.info("Initial setup: english.")
+
+        if new_key:
+            self.key = new_key
+
+        if not self.key:
+            raise ValueError("No key/password availalbe")
+
+        for getter, fun, params in initial_setup_calls(self.key):
+            if getter:
+                await self.xml_getter(fun, params)
+            else:
+                await self.xml_setter(fun, params)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Close the connection to the modem
+        """
+        self.connection.close()
+
+    def url(self, path):
+        """
+        Calculate the absolute URL for the request
+        """
+        while path.startswith('/'):
+            path = path[1:]
+
+        return "http://{ip}/{path}".format(ip=self.router_ip, path=path)
+
+    def token_handler(self, res):
+        """
+        Handle the anti-replace token system
+        """
+        self.cookies.update(res.cookies)
+        self.session_token = res.cookies.get('sessionToken')
+
+        if res.status_code == 302:
+            LOGGER.info("302 [%s] => '%s' [token: %s]", res.url,
+                        res.headers['Location'], self.session_token)
+        else:
+            LOGGER.debug("%s [%s] [token: %s]", res.status_code, res.url,
+                         self.session_token)
+
+    async def request(self, method, path, body=b'', headers=None):
+        """
+        Perform a single request, without following redirects
+        """
+        async with self.request_lock():
+            return await self._request(method, path, body, headers)
+
+    async def _request(self, method, path, body, headers):
+        """
+        Perform a single request; the caller holds the request lock
+        """
+        all_headers = dict(self.headers)
+        all_headers.update(headers or {})
+        if self.cookies:
+            all_headers['Cookie'] = '; '.join(
+                '{}={}'.format(k, v) for k, v in self.cookies.items())
+
+        status_code, res_headers, content = await asyncio.wait_for(
+            self.connection.request(method, path, body, all_headers),
+            self.timeout)
+
+        res = Response(self.url(path), status_code, res_headers, content)
+        self.token_handler(res)
+        return res
+
+    async def post(self, path, _data, params=None):
+        """
+        Prepare and send a POST request to the router
+
+        Sets the 'token' and 'fun' fields at the correct position in the
+        post data, see `form_data`.
+        """
+        await self.ensure_connected()
+        if params:
+            path = '{}?{}'.format(path, urllib.parse.urlencode(params))
+
+        # The token must be the one of the last response when the request
+        # is sent
+        async with self.request_lock():
+            data = form_data(self.session_token, _data)
+            LOGGER.debug("POST [%s]: %s", path, data)
+            return await self._request(
+                'POST', path, urllib.parse.urlencode(data).encode('utf-8'),
+                {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    async def get(self, path, params=None, allow_redirects=True):
+        """
+        Perform a GET request to the router and set the required referer
+        """
+        await self.ensure_connected()
+        if params:
+            path = '{}?{}'.format(path, urllib.parse.urlencode(params))
+
+        async with self.request_lock():
+            return await self._get(path, allow_redirects)
+
+    async def _get(self, path, allow_redirects):
+        """
+        GET `path`, following redirects; the caller holds the request lock
+        """
+        res = await self._request('GET', path, b'', None)
+        redirects = 0
+        while allow_redirects and res.status_code in (301, 302, 303, 307):
+            redirects += 1
+            if redirects > MAX_REDIRECTS:
+                raise ValueError("Exceeded {} redirects.".format(
+                    MAX_REDIRECTS))
+            location = urllib.parse.urlsplit(res.headers['Location'])
+            path = urllib.parse.urljoin(
+                urllib.parse.urlsplit(res.url).path, location.path)
+            if location.query:
+                path = '{}?{}'.format(path, location.query)
+            res = await self._request('GET', path, b'', None)
+
+        self.headers['Referer'] = res.url
+        return res
+
+    async def xml_getter(self, fun, params):
+        """
+        Call `/xml/getter.xml` for the given function and parameters
+        """
+        if self.cache is not None:
+            key = self.cache.key(self.router_ip, fun, params)
+            res = self.cache.get(key)
+            if res is not None:
+                return res
+
+        params['fun'] = fun
+
+        res = await self.post('/xml/getter.xml', params)
+
+        if self.cache is not None:
+            self.cache.put(key, res)
+        return res
+
+    async def xml_setter(self, fun, params=None):
+        """
+        Call `/xml/setter.xml` for the given function and parameters.
+        The params are optional
+        """
+        params = params if params is not None else {}
+        params['fun'] = fun
+
+        res = await self.post('/xml/setter.xml', params)
+
+        if self.cache is not None:
+            self.cache.setter_called(self.router_ip, fun)
+        return res
+
+    async def login(self, key=None):
+        """
+        Login. Allow this function to override the key.
+        """
+        res = await self.xml_setter(Set.LOGIN, login_params(key if key else
+                                                            self.key))
+
+        token_sid = login_sid(res)
+        LOGGER.info("[login] SID %s", token_sid)
+
+        self.cookies['SID'] = token_sid
+
+        return res
+
+    async def logout(self):
+        """
+        Logout of the router. This is required since only a single session can
+        be active at any point in time.
+        """
+        res = await self.xml_setter(Set.LOGOUT, {})
+        self.cookies.pop('SID', None)
+        return res
+
+
+class AsyncPortForwards(object):
+    """
+    Manage the port forwards on the modem, on an `AsyncCompal`.
+
+    Read the rules with `await forwards.rules`.
+    """
+    def __init__(self, modem):
+        self.modem = modem
+        # Parses the responses; its blocking requests are not used
+        self.forwards = PortForwards(modem)
+
+    @property
+    def rules(self):
+        """
+        Retrieve the current port forwarding rules
+
+        @returns awaitable list of PortForward rules
+        """
+        return self._rules()
+
+    async def _rules(self):
+        res = await self.modem.xml_getter(Get.FORWARDING, {})
+        return list(self.forwards.parse_rules(res.content))
+
+
+class AsyncWifiSettings(object):
+    """
+    Read the WiFi settings of an `AsyncCompal`.
+
+    Read the settings with `await wifi.wifi_settings`.
+    """
+    def __init__(self, modem):
+        self.modem = modem
+        # Parses the responses; its blocking requests are not used
+        self.settings = WifiSettings(modem)
+
+    @property
+    def wifi_settings_xml(self):
+        """
+        Get the current wifi settings as XML (awaitable)
+        """
+        return self._wifi_settings_xml()
+
+    async def _wifi_settings_xml(self):
+        res = await self.modem.xml_getter(Get.WIRELESSBASIC, {})
+        return self.settings.parse_xml(res.content)
+
+    @property
+    def wifi_settings(self):
+        """
+        Read the wifi settings (awaitable)
+        """
+        return self._wifi_settings()
+
+    async def _wifi_settings(self):
+        return WifiSettings.radio_settings(await self.wifi_settings_xml,
+                                           self.modem)
+
+
+class AsyncBackupRestore(object):
+    """
+    Configuration backup of an `AsyncCompal`
+    """
+    def __init__(self, modem):
+        self.modem = modem
+        # Parses the responses; its blocking requests are not used
+        self.backup_restore = BackupRestore(modem)
+
+    async def backup(self, filename=None):
+        """
+        Backup the configuration and return it's content
+        """
+        res = await self.modem.xml_getter(Get.GLOBALSETTINGS, {})
+        fname = self.backup_restore.config_filename(res.content, filename)
+
+        res = await self.modem.get("/xml/getter.xml",
+                                   params={'filename': fname},
+                                   allow_redirects=False)
+        if res.status_code != 200:
+            LOGGER.error("Did not get configfile response!"
+                         " Wrong config file name?")
+            return None
+
+        return res.content
+
+    async def restore(self, data, progress=None, timeout=None, wait=True,
+                      reboot_timeout=300):
+        """
+        Restore the configuration from `data` (bytes, a path or a file
+        object), streaming the upload. With `wait`, wait for the modem to
+        reboot, see `wait_for_reboot`.
+
+        @returns the response to the upload
+        """
+        LOGGER.info("Restoring config. Modem will reboot after that")
+        await self.modem.ensure_connected()
+        async with self.modem.request_lock():
+            with open_upload(data, progress) as upload:
+                path = '/xml/getter.xml?{}'.format(urllib.parse.urlencode(
+                    {'Restore': len(upload)}))
+                status_code, res_headers, content = await asyncio.wait_for(
+                    self.modem.connection.request('POST', path, upload, {
+                        'Content-Disposition': 'form-data; name="file"; '
+                                               'filename="Cfg_Restore.bin"',
+                        'Content-Type': 'application/octet-stream',
+                        'Cookie': '; '.join(
+                            '{}={}'.format(k, v)
+                            for k, v in self.modem.cookies.items()),
+                    }), timeout or self.modem.timeout)
+
+            res = Response(self.modem.url(path), status_code, res_headers,
+                           content)
+            self.modem.token_handler(res)
+            # The session does not survive the reboot
+            self.modem.close()
+            self.modem.cookies.pop('SID', None)
+            self.modem.connected = False
+
+        if wait and status_code == 200:
+            await wait_for_reboot(self.modem.router_ip,
+                                  timeout=reboot_timeout)
+        return res
+
+
+async def probe(router_ip, timeout):
+    """
+    Does the modem answer a GET / within `timeout` seconds?
+    """
+    host, _, port = router_ip.partition(':')
+    connection = HTTPConnection(host, int(port) if port else 80)
+    try:
+        await asyncio.wait_for(connection.request('GET', '/'), timeout)
+        return True
+    except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError,
+            ValueError):
+        return False
+    finally:
+        connection.close()
+
+
+async def wait_for_reboot(router_ip, timeout=300, interval=2,
+                          down_timeout=60):
+    """
+    Wait for the modem to go down (at most `down_timeout` seconds; it may
+    have rebooted already) and to answer again, polling every `interval`
+    seconds.
+
+    @returns the seconds waited
+    @raises asyncio.TimeoutError if the modem is not back within `timeout`
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+
+    while time.monotonic() - start < down_timeout and \
+            await probe(router_ip, interval):
+        await asyncio.sleep(interval)
+    LOGGER.info("%s is rebooting", router_ip)
+
+    while not await probe(router_ip, interval):
+        if time.monotonic() > deadline:
+            raise asyncio.TimeoutError(
+                "{} did not come back within {}s".format(router_ip, timeout))
+        await asyncio.sleep(interval)
+
+    LOGGER.info("%s is back after %.1fs", router_ip,
+                time.monotonic() - start)
+    return time.monotonic() - start
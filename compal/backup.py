@@ -0,0 +1,97 @@
+"""
+Configuration backup and restore
+"""
+import logging
+
+from . import _etree, tracing
+from .functions import Get
+
+LOGGER = logging.getLogger(__name__)
+
+
+class BackupRestore(object):
+    """
+    Configuration backup and restore
+    """
+    def __init__(self, modem):
+        # The modem sometimes returns invalid XML when 'strange' values are
+        # present in the settings. The recovering parser from lxml is used to
+        # handle this.
+        self.parser = _etree().XMLParser(recover=True)
+
+        self.modem = modem
+
+    def backup(self, filename=None):
+        """
+        Backup the configuration and return it's content
+        """
+        with tracing.span(self.modem, 'compal.backup'):
+            res = self.backup_response(filename)
+            return res.content if res is not None else None
+
+    def backup_response(self, filename=None, **kwargs):
+        """
+        The response carrying the configuration, None if there is none.
+        Extra arguments (e.g. `stream=True`) are passed on to `Compal.get`.
+        """
+        res = self.modem.xml_getter(Get.GLOBALSETTINGS, {})
+        fname = self.config_filename(res.content, filename)
+
+        res = self.modem.get("/xml/getter.xml", params={'filename': fname},
+                             allow_redirects=False, **kwargs)
+        if res.status_code != 200:
+            LOGGER.error("Did not get configfile response!"
+                         " Wrong config file name?")
+            res.close()
+            return None
+
+        return res
+
+    def backup_to(self, fileobj, filename=None, chunk_size=65536):
+        """
+        Stream the configuration into the binary file object `fileobj`
+
+        @returns the number of bytes written, None if no configuration was
+                 received
+        """
+        res = self.backup_response(filename, stream=True)
+        if res is None:
+            return None
+
+        size = 0
+        with res:
+            for chunk in res.iter_content(chunk_size):
+                fileobj.write(chunk)
+                size += len(chunk)
+        return size
+
+    def config_filename(self, content, filename=None):
+        """
+        Name of the config file, derived from the `Get.GLOBALSETTINGS`
+        response unless `filename` is given
+        """
+        if filename:
+            return filename
+
+        with tracing.span(self.modem, 'compal.parse',
+                          {'compal.function': Get.GLOBALSETTINGS}):
+            xml = _etree().fromstring(content, parser=self.parser)
+            return xml.find('ConfigVenderModel').text + "-Cfg.bin"
+
+    def restore(self, data, progress=None, timeout=None):
+        """
+        Restore the configuration from `data`: bytes, a path or a file
+        object. The upload is streamed, see `compal.upload.open_upload`.
+
+        The modem reboots afterwards, `compal.aio.wait_for_reboot` waits for
+        it to come back.
+
+        @returns the response to the upload
+        """
+        from .upload import open_upload
+        LOGGER.info("Restoring config. Modem will reboot after that")
+        with open_upload(data, progress) as upload:
+            return self.modem.post_binary(
+                "/xml/getter.xml", upload, "Cfg_Restore.bin",
+                params={'Restore': len(upload)},
+                timeout=timeout or self.modem.timeout)
@@ -0,0 +1,199 @@
+"""
+Content-addressed store for configuration backups.
+
+Nightly backups of many modems are mostly identical to the previous night.
+`BackupStore` streams each backup to disk while hashing it, keeps every
+distinct configuration once under its SHA-256 and appends a small record
+to the modem's history:
+
+    store = BackupStore('/srv/backups')
+    record = store.backup(modem)
+    store.history(modem.router_ip)
+    store.diff(store.versions(modem.router_ip)[0].digest, record.digest)
+
+Layout of the store directory:
+
+    objects/<first two hex digits>/<sha256>   configuration blobs
+    modems/<router ip>.jsonl                  one record per backup
+"""
+import collections
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+
+from . import BackupRestore
+
+BackupRecord = collections.namedtuple('BackupRecord', [
+    'router_ip', 'timestamp', 'digest', 'size', 'filename'])
+
+CHUNK_SIZE = 65536
+# Differing blocks are compared in slices of this size before scanning the
+# differing slices byte by byte
+DIFF_SLICE = 256
+
+
+def add_range(ranges, offset, length):
+    """
+    Append the byte range to `ranges`, merging it with an adjacent last one
+    """
+    if ranges and sum(ranges[-1]) == offset:
+        ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+    else:
+        ranges.append((offset, length))
+
+
+def diff_block(block_a, block_b, offset, ranges):
+    """
+    Add the ranges in which two blocks starting at `offset` differ to
+    `ranges`
+    """
+    common = min(len(block_a), len(block_b))
+    for start in range(0, common, DIFF_SLICE):
+        slice_a = block_a[start:start + DIFF_SLICE]
+        slice_b = block_b[start:start + DIFF_SLICE]
+        if slice_a == slice_b:
+            continue
+        for idx, (byte_a, byte_b) in enumerate(zip(slice_a, slice_b)):
+            if byte_a != byte_b:
+                add_range(ranges, offset + start + idx, 1)
+    if len(block_a) != len(block_b):
+        add_range(ranges, offset + common, abs(len(block_a) - len(block_b)))
+
+
+class BackupStore(object):
+    """
+    Configuration backups, deduplicated across runs and modems
+    """
+    def __init__(self, root):
+        self.root = os.path.expanduser(root)
+        for directory in ('objects', 'modems'):
+            os.makedirs(os.path.join(self.root, directory), exist_ok=True)
+
+    def object_path(self, digest):
+        """
+        Path of the blob with the given SHA-256 hex digest
+        """
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def history_path(self, router_ip):
+        """
+        Path of the backup records of a modem
+        """
+        return os.path.join(self.root, 'modems', '{}.jsonl'.format(
+            router_ip.replace(':', '_').replace(os.sep, '_')))
+
+    def put(self, chunks):
+        """
+        Store the blob made up of `chunks` (bytes), hashing it while it is
+        written to a temporary file. Nothing is kept if the blob is stored
+        already.
+
+        @returns (digest, size)
+        """
+        digest, size = hashlib.sha256(), 0
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root,
+                                                             'objects'))
+        try:
+            with io.open(tmp_fd, 'wb') as f:  # pylint: disable=invalid-name
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+
+            path = self.object_path(digest.hexdigest())
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest.hexdigest(), size
+
+    def add(self, router_ip, chunks, filename=None):
+        """
+        Store a backup of the modem at `router_ip` and record it in the
+        modem's history
+        """
+        digest, size = self.put(chunks)
+        record = BackupRecord(router_ip, time.time(), digest, size, filename)
+        # Single appends of short lines; one process per modem at a time
+        with io.open(self.history_path(router_ip), 'at', encoding='utf-8') as f:  # noqa pylint: disable=invalid-name
+            f.write(json.dumps(record._asdict()) + '\n')
+        return record
+
+    def backup(self, modem, filename=None, chunk_size=CHUNK_SIZE):
+        """
+        Stream a backup of the (logged in) modem into the store
+
+        @returns the BackupRecord
+        @raises ValueError if the modem did not return a configuration
+        """
+        restore = BackupRestore(modem)
+        res = restore.backup_response(filename, stream=True)
+        if res is None:
+            raise ValueError("No backup received")
+        with res:
+            return self.add(modem.router_ip, res.iter_content(chunk_size),
+                            filename)
+
+    def history(self, router_ip):
+        """
+        The BackupRecords of a modem, oldest first
+        """
+        try:
+            with io.open(self.history_path(router_ip), 'rt', encoding='utf-8') as f:  # noqa pylint: disable=invalid-name
+                return [BackupRecord(**json.loads(line))
+                        for line in f if line.strip()]
+        except IOError:
+            return []
+
+    def versions(self, router_ip):
+        """
+        The records of a modem at which its configuration changed
+        """
+        versions = []
+        for record in self.history(router_ip):
+            if not versions or versions[-1].digest != record.digest:
+                versions.append(record)
+        return versions
+
+    def modems(self):
+        """
+        The router ips with backups, with ':' replaced by '_'
+        """
+        return sorted(name[:-len('.jsonl')] for name in
+                      os.listdir(os.path.join(self.root, 'modems'))
+                      if name.endswith('.jsonl'))
+
+    def open(self, digest):
+        """
+        The blob with the given digest, as a binary file object
+        """
+        return io.open(self.object_path(digest), 'rb')
+
+    def diff(self, digest_a, digest_b, block_size=CHUNK_SIZE):
+        """
+        The (offset, length) byte ranges in which two blobs differ; a size
+        difference is reported as a range at the end of the shorter one
+        """
+        if digest_a == digest_b:
+            return []
+
+        ranges = []
+        offset = 0
+        with self.open(digest_a) as file_a, self.open(digest_b) as file_b:
+            while True:
+                block_a = file_a.read(block_size)
+                block_b = file_b.read(block_size)
+                if not block_a and not block_b:
+                    break
+                if block_a != block_b:
+                    diff_block(block_a, block_b, offset, ranges)
+                offset += max(len(block_a), len(block_b))
+        return ranges
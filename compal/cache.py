@@ -0,0 +1,163 @@
+"""
+TTL/LRU cache for getter responses.
+
+The modem's web server takes hundreds of milliseconds per call. Pass a
+`ResponseCache` to `Compal` (or `AsyncCompal`) to serve repeated getters
+from memory:
+
+    modem = Compal('192.168.178.1', key, cache=ResponseCache())
+
+Entries are keyed by router, so one cache can be shared by the clients of
+several modems. Setters invalidate the getters they affect on their modem,
+as declared in `INVALIDATES`. Setters that are not listed there invalidate
+all responses of the modem.
+"""
+import collections
+import logging
+import threading
+import time
+
+from .functions import Set, Get
+
+LOGGER = logging.getLogger(__name__)
+
+# Setter => getters whose response it changes
+INVALIDATES = {
+    Set.LOGIN: (),
+    Set.LOGOUT: (),
+    Set.CHANGE_PASSWORD: (),
+    Set.SET_EMAIL: (),
+    Set.SEND_EMAIL: (),
+    Set.LANGUAGE: (Get.MULTILANG, Get.LANGSETLIST),
+    Set.UPNP_STATUS: (Get.LANSETTING,),
+    Set.DHCP_V6: (Get.DHCPV6INFO, Get.LANSETTING),
+    Set.DHCP_V4: (Get.BASICDHCP, Get.LANSETTING, Get.LANUSERTABLE),
+    Set.STATIC_DHCP_LEASE: (Get.BASICDHCP, Get.LANUSERTABLE),
+    Set.FILTER_RULE: (Get.IPFILTERING,),
+    Set.IPV6_FILTER_RULE: (Get.IPV6FILTERING,),
+    Set.MACFILTER: (Get.MACFILTERING,),
+    Set.PARENTAL_CONTROL: (Get.PARENTALCTL, Get.WEBFILTER),
+    Set.PORT_FORWARDING: (Get.FORWARDING,),
+    Set.PING_TEST: (Get.PING_RESULT,),
+    Set.TRACEROUTE: (Get.TRACEROUTE_RESULT,),
+    Set.STOP_DIAGNOSTIC: (Get.PING_RESULT, Get.TRACEROUTE_RESULT),
+    Set.REMOTE_ACCESS: (Get.REMOTEACCESS,),
+    Set.MTU_SIZE: (Get.MTUSIZE,),
+    Set.WIFI_SETTINGS: (Get.WIRELESSBASIC, Get.WIRELESSBASIC_2,
+                        Get.WIFISTATE),
+}
+
+# Time to live [s] per getter. 0 disables caching for the getter.
+DEFAULT_TTLS = {
+    # Polled for progress, never cache
+    Get.PING_RESULT: 0,
+    Get.TRACEROUTE_RESULT: 0,
+    Get.LOGIN_TIMER: 0,
+    # Counters
+    Get.DOWNSTREAM_TABLE: 1,
+    Get.UPSTREAM_TABLE: 1,
+    Get.SIGNAL_TABLE: 1,
+    Get.EVENTLOG_TABLE: 5,
+    Get.FIREWALLLOG_TABLE: 5,
+    # Rarely changes unless set through this client
+    Get.GLOBALSETTINGS: 300,
+    Get.MULTILANG: 300,
+    Get.LANGSETLIST: 300,
+    Get.DEFAULTVALUE: 300,
+}
+
+
+class ResponseCache(object):
+    """
+    Cache of getter responses with a TTL per function id and LRU eviction
+    """
+    def __init__(self, ttls=None, default_ttl=10, max_entries=128,
+                 clock=time.monotonic):
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        # key => (expiry, response), least recently used first
+        self.entries = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(router_ip, fun, params):
+        """
+        Cache key for a getter call to a router, None if it can not be cached
+        """
+        try:
+            return (router_ip, fun, frozenset(params.items()))
+        except TypeError:
+            return None
+
+    def ttl(self, fun):
+        """
+        Time to live for the responses of `fun`
+        """
+        return self.ttls.get(fun, self.default_ttl)
+
+    def get(self, key):
+        """
+        Cached response for the key, None on a miss
+        """
+        if key is None:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, res):
+        """
+        Store a response. Only successful, non-empty responses are stored:
+        an empty body means an invalid function or an expired session.
+        """
+        if key is None or res.status_code != 200 or not res.content:
+            return
+        ttl = self.ttl(key[1])
+        if ttl <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (self.clock() + ttl, res)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, router_ip=None, fun=None):
+        """
+        Drop the responses of getter `fun`, or of all getters, of a router
+        or of all routers
+        """
+        with self.lock:
+            for key in [k for k in self.entries
+                        if router_ip in (None, k[0]) and fun in (None, k[1])]:
+                del self.entries[key]
+
+    def setter_called(self, router_ip, fun):
+        """
+        Invalidate the getters of the router affected by setter `fun`
+        """
+        affected = INVALIDATES.get(fun)
+        if affected is None:
+            LOGGER.debug("Setter %s invalidates the cache of %s", fun,
+                         router_ip)
+            self.invalidate(router_ip)
+            return
+
+        for getter in affected:
+            self.invalidate(router_ip, getter)
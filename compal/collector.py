@@ -0,0 +1,242 @@
+"""
+Bounded time-series collection of DOCSIS channel statistics.
+
+`ChannelCollector` samples a modem's channel tables and appends them to
+fixed-size ring buffers, one row per sample and one column per channel.
+All buffers are allocated up front and written in place, so memory use is
+bounded by `capacity` no matter how long the collector runs, and recording a
+sample allocates no arrays.
+
+The codeword counters are delta-encoded: each sample stores the increase
+since the previous sample. A counter that goes down (modem reboot) stores
+the new raw value. Channels or values missing from a sample are NaN in the
+gauges and `compal.docsis.MISSING` in the counters. Rows without a channel
+id, or with one of `MAX_CHANNEL_ID` or above, are dropped.
+
+Requires numpy (`pip install compal[docsis]`).
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+
+from .docsis import MISSING, DocsisTables
+
+LOGGER = logging.getLogger(__name__)
+
+# Channel ids are 8 bit in DOCSIS 3.0
+MAX_CHANNEL_ID = 256
+
+DOWNSTREAM_GAUGES = ('power', 'snr', 'rx_mer')
+DOWNSTREAM_COUNTERS = ('unerrored', 'corrected', 'uncorrectable')
+UPSTREAM_GAUGES = ('power',)
+
+
+class RingBuffer(object):
+    """
+    Preallocated (capacity x channels) buffer of samples
+    """
+    def __init__(self, capacity, channels, dtype):
+        self.data = np.zeros((capacity, channels), dtype=dtype)
+        # Channels that were not present in a sample stay at `fill`
+        self.fill = np.nan if self.data.dtype.kind == 'f' else MISSING
+
+    def row(self, index):
+        """
+        The row for sample `index`, reset to the fill value
+        """
+        row = self.data[index % len(self.data)]
+        row.fill(self.fill)
+        return row
+
+    def ordered(self, head, count):
+        """
+        Copy of the last `count` rows, oldest first
+        """
+        capacity = len(self.data)
+        start = (head - count) % capacity
+        return np.roll(self.data, -start, axis=0)[:count]
+
+
+class ChannelTable(object):
+    """
+    Ring buffers for the metrics of one channel table (up- or downstream)
+    """
+    def __init__(self, capacity, max_channels, gauges, counters=()):
+        self.max_channels = max_channels
+        # Channels beyond `max_channels` are written to an extra last
+        # column that is never returned
+        self.overflow = max_channels
+        columns = max_channels + 1
+        # channel id => column
+        self.slot_of = np.full(MAX_CHANNEL_ID, self.overflow, dtype=np.intp)
+        self.channel_ids = np.zeros(max_channels, dtype=np.int16)
+        self.num_slots = 0
+
+        self.gauges = {name: RingBuffer(capacity, columns, np.float32)
+                       for name in gauges}
+        self.counters = {name: RingBuffer(capacity, columns, np.int64)
+                         for name in counters}
+        # Raw value of the counters at the previous sample they were in
+        self.last = {name: np.zeros(columns, dtype=np.int64)
+                     for name in counters}
+        self.seen = {name: np.zeros(columns, dtype=np.bool_)
+                     for name in counters}
+
+        # Scratch space of `record`, one entry per table row
+        self.row_ids = np.zeros(MAX_CHANNEL_ID, dtype=np.intp)
+        self.row_slots = np.zeros(MAX_CHANNEL_ID, dtype=np.intp)
+        self.row_last = np.zeros(MAX_CHANNEL_ID, dtype=np.int64)
+        self.row_delta = np.zeros(MAX_CHANNEL_ID, dtype=np.int64)
+        self.row_reset = np.zeros(MAX_CHANNEL_ID, dtype=np.bool_)
+        self.row_new = np.zeros(MAX_CHANNEL_ID, dtype=np.bool_)
+        self.row_seen = np.zeros(MAX_CHANNEL_ID, dtype=np.bool_)
+
+    def slots(self, channel_ids, out=None):
+        """
+        Columns for the given channel ids, new channels get a free column.
+        Channels beyond `max_channels` get the overflow column.
+        """
+        slots = np.take(self.slot_of, channel_ids, out=out)
+        new = np.equal(slots, self.overflow, out=self.row_new[:len(slots)])
+        if not new.any():
+            return slots
+        for channel_id in channel_ids[new]:
+            if self.slot_of[channel_id] != self.overflow:
+                continue
+            if self.num_slots == self.max_channels:
+                LOGGER.warning("No room for channel %d", channel_id)
+                continue
+            self.slot_of[channel_id] = self.num_slots
+            self.channel_ids[self.num_slots] = channel_id
+            self.num_slots += 1
+        return np.take(self.slot_of, channel_ids, out=slots)
+
+    def record(self, index, table):
+        """
+        Write the rows of a parsed table into sample `index`. Rows without
+        a channel id (`MISSING`) or with one out of range are dropped.
+        """
+        table = table[:MAX_CHANNEL_ID]
+        invalid = np.less(table['channel_id'], 0,
+                          out=self.row_new[:len(table)])
+        np.logical_or(invalid, np.greater_equal(
+            table['channel_id'], MAX_CHANNEL_ID,
+            out=self.row_reset[:len(table)]), out=invalid)
+        if invalid.any():
+            LOGGER.warning("Dropping %d channels without a channel id below "
+                           "%d", np.count_nonzero(invalid), MAX_CHANNEL_ID)
+            table = table[~invalid]
+        rows = len(table)
+        ids = self.row_ids[:rows]
+        np.copyto(ids, table['channel_id'])
+        slots = self.slots(ids, out=self.row_slots[:rows])
+
+        for name, buf in self.gauges.items():
+            buf.row(index)[slots] = table[name]
+
+        for name, buf in self.counters.items():
+            values = table[name]
+            last = np.take(self.last[name], slots, out=self.row_last[:rows])
+            delta = np.subtract(values, last, out=self.row_delta[:rows])
+            seen = np.take(self.seen[name], slots, out=self.row_seen[:rows])
+            # First sample of a channel and counter resets store the raw value
+            reset = np.less(delta, 0, out=self.row_reset[:rows])
+            np.logical_or(reset, np.logical_not(seen, out=self.row_new[:rows]),
+                          out=reset)
+            np.copyto(delta, values, where=reset)
+
+            # Values that were not reported stay missing and are not the
+            # previous value of the next sample
+            missing = np.equal(values, MISSING, out=self.row_new[:rows])
+            np.copyto(delta, MISSING, where=missing)
+            buf.row(index)[slots] = delta
+            present = np.logical_not(missing, out=missing)
+            np.copyto(last, values, where=present)
+            self.last[name][slots] = last
+            self.seen[name][slots] = np.logical_or(seen, present, out=seen)
+
+
+class ChannelCollector(object):
+    """
+    Sample the channel tables of a modem every `interval` seconds into ring
+    buffers holding the last `capacity` samples.
+    """
+    def __init__(self, modem, interval=60, capacity=1440, max_channels=32):
+        self.tables = DocsisTables(modem)
+        self.interval = interval
+        self.capacity = capacity
+
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.downstream = ChannelTable(capacity, max_channels,
+                                       DOWNSTREAM_GAUGES, DOWNSTREAM_COUNTERS)
+        self.upstream = ChannelTable(capacity, max_channels, UPSTREAM_GAUGES)
+        # Total number of samples, the next sample goes to head % capacity
+        self.head = 0
+
+    @property
+    def count(self):
+        """
+        Number of samples in the buffers
+        """
+        return min(self.head, self.capacity)
+
+    def record(self, timestamp, downstream, upstream):
+        """
+        Append a sample from parsed tables (see `compal.docsis`)
+        """
+        index = self.head
+        self.timestamps[index % self.capacity] = timestamp
+        self.downstream.record(index, downstream)
+        self.upstream.record(index, upstream)
+        self.head += 1
+
+    def sample(self):
+        """
+        Fetch the channel tables from the modem and append them
+        """
+        timestamp = time.time()
+        self.record(timestamp, self.tables.downstream, self.tables.upstream)
+
+    def run(self, stop=None):
+        """
+        Sample until the `threading.Event` `stop` is set. Failed samples are
+        logged and skipped, as are the ticks missed by a slow sample.
+        """
+        stop = stop or threading.Event()
+        deadline = time.monotonic()
+        while not stop.is_set():
+            try:
+                self.sample()
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Sampling failed")
+            deadline += self.interval
+            now = time.monotonic()
+            if deadline < now:
+                missed = int((now - deadline) // self.interval) + 1
+                LOGGER.warning("Sampling fell behind, skipping %d samples",
+                               missed)
+                deadline += missed * self.interval
+            stop.wait(deadline - now)
+
+    def series(self, metric, upstream=False):
+        """
+        (timestamps, channel ids, values) of a metric, oldest sample first.
+        Values has one column per channel id.
+
+        Counters are returned as deltas per sample, with `MISSING` (-1) for
+        samples without a value. Mask those before summing, e.g.
+        `numpy.ma.masked_equal(values, MISSING).cumsum(axis=0)` for running
+        totals; a plain `numpy.cumsum` would subtract one per missing value.
+        """
+        table = self.upstream if upstream else self.downstream
+        buf = table.gauges.get(metric) or table.counters.get(metric)
+        if buf is None:
+            raise ValueError("Unknown metric {!r}".format(metric))
+
+        count, slots = self.count, table.num_slots
+        timestamps = np.roll(self.timestamps,
+                             -((self.head - count) % self.capacity))[:count]
+        return (timestamps, table.channel_ids[:slots].copy(),
+                buf.ordered(self.head, count)[:, :slots])
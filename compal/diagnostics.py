@@ -0,0 +1,270 @@
+"""
+Queued ping and traceroute jobs with parsed results.
+
+The modem runs one diagnostic at a time and only reports progress through
+`Get.PING_RESULT`/`Get.TRACEROUTE_RESULT`. `DiagnosticsRunner` queues jobs
+per modem and runs them back-to-back on a worker thread. Each job returns a
+`concurrent.futures.Future` of the parsed result:
+
+    runner = DiagnosticsRunner(modem)
+    futures = [runner.ping(target, num_ping=5) for target in targets]
+    for future in futures:
+        result = future.result()
+        print(result.target, result.received, ping_loss(result))
+    runner.close()
+
+From asyncio, await `asyncio.wrap_future(future)`.
+
+Instead of sleeping for a fixed time, a job polls when its next result is
+due: first after one expected ping period (`num_ping * interval` spread
+over the pings), then at the rate at which replies or hops actually
+arrived. Polls without progress back off up to `max_poll` seconds.
+
+The runner uses the modem from its worker thread: do not use the same
+`Compal` from other threads while jobs are queued.
+"""
+import collections
+import concurrent.futures
+import logging
+import re
+import time
+
+from lxml import etree
+
+from . import Diagnostics
+
+LOGGER = logging.getLogger(__name__)
+
+PingReply = collections.namedtuple('PingReply', ['seq', 'ttl', 'rtt'])
+PingResult = collections.namedtuple('PingResult', [
+    'target', 'replies', 'transmitted', 'received', 'done'])
+Hop = collections.namedtuple('Hop', ['hop', 'host', 'address', 'rtts'])
+TracerouteResult = collections.namedtuple('TracerouteResult', [
+    'target', 'hops', 'done'])
+
+PING_HEADER = re.compile(r'^PING (\S+)', re.MULTILINE)
+PING_REPLY = re.compile(r'(?:icmp_)?seq=(\d+)\s+ttl=(\d+)\s+time=([\d.]+)')
+PING_STATISTICS = re.compile(r'(\d+) packets transmitted, (\d+) (?:packets )?'
+                             r'received')
+TRACEROUTE_HEADER = re.compile(r'^traceroute to (\S+) \(([^)]+)\)',
+                               re.MULTILINE)
+HOP_LINE = re.compile(r'^\s*(\d+)\s+(.*)$')
+HOP_RTT = re.compile(r'([\d.]+)\s*ms')
+HOP_HOST = re.compile(r'^([^\s(*]+)(?:\s+\(([^)]+)\))?')
+
+# The modem sometimes returns invalid XML, recover from it.
+PARSER = etree.XMLParser(recover=True)
+
+
+def result_text(content):
+    """
+    The text of a result response, whatever elements it is wrapped in
+    """
+    if not content:
+        return ''
+    root = etree.fromstring(content, parser=PARSER)
+    return ''.join(root.itertext()) if root is not None else ''
+
+
+def parse_ping(content, target, num_ping, stale=None):
+    """
+    PingResult from a `Get.PING_RESULT` response (busybox ping output)
+
+    Output of an earlier test (the modem keeps serving it until the new test
+    starts) is treated as no output yet: output for another target, and the
+    `stale` text that was served before the test was started.
+    """
+    text = result_text(content)
+    header = PING_HEADER.search(text)
+    if (header and header.group(1) != target) or text == stale:
+        text = ''
+    replies = [PingReply(int(seq), int(ttl), float(rtt))
+               for seq, ttl, rtt in PING_REPLY.findall(text)]
+
+    statistics = PING_STATISTICS.search(text)
+    if statistics:
+        transmitted, received = (int(value) for value in statistics.groups())
+    else:
+        transmitted, received = None, len(replies)
+    return PingResult(target, replies, transmitted, received,
+                      statistics is not None or len(replies) >= num_ping)
+
+
+def ping_loss(result):
+    """
+    Fraction of lost pings, None while unknown
+    """
+    if not result.transmitted:
+        return None
+    return 1 - result.received / result.transmitted
+
+
+def parse_hop(line):
+    """
+    Hop from a line of traceroute output, None for other lines
+    """
+    match = HOP_LINE.match(line)
+    if not match:
+        return None
+    hop, rest = match.groups()
+    host = address = None
+    host_match = HOP_HOST.match(rest)
+    if host_match and not HOP_RTT.match(rest):
+        host, address = host_match.groups()
+        address = address or host
+    # A lost probe is reported as '*'
+    rtts = [float(rtt) for rtt in HOP_RTT.findall(rest)]
+    rtts.extend([None]*rest.count('*'))
+    return Hop(int(hop), host, address, rtts)
+
+
+def parse_traceroute(content, target, max_hops, stale=None):
+    """
+    TracerouteResult from a `Get.TRACEROUTE_RESULT` response (busybox
+    traceroute output)
+
+    The destination is reached when the last hop answers from `target` or
+    the address it resolved to (from the 'traceroute to NAME (ADDR)' line).
+    Output of an earlier traceroute is treated as no output yet, see
+    `parse_ping`.
+    """
+    text = result_text(content)
+    header = TRACEROUTE_HEADER.search(text)
+    if (header and header.group(1) != target) or text == stale:
+        text = ''
+    destinations = {target}
+    if header:
+        destinations.add(header.group(2))
+
+    hops = [hop for hop in map(parse_hop, text.splitlines())
+            if hop is not None]
+    done = bool(hops) and (hops[-1].address in destinations or
+                           hops[-1].hop >= max_hops)
+    return TracerouteResult(target, hops, done)
+
+
+class DiagnosticsRunner(object):
+    """
+    Run ping and traceroute jobs on a modem one after the other
+    """
+    def __init__(self, modem, min_poll=0.5, max_poll=10, backoff=1.5,
+                 interval_seconds=1.0):
+        self.diagnostics = Diagnostics(modem)
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.backoff = backoff
+        # Seconds per unit of the `interval` of a ping test
+        self.interval_seconds = interval_seconds
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def close(self, wait=True):
+        """
+        Stop accepting jobs; with `wait`, finish the queued ones
+        """
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def clamp(self, delay):
+        """
+        Delay limited to [min_poll, max_poll]
+        """
+        return min(max(delay, self.min_poll), self.max_poll)
+
+    def ping(self, target, ping_size=64, num_ping=3, interval=10,
+             timeout=None):
+        """
+        Queue a ping test
+
+        @returns Future of the PingResult; its `done` is False when the test
+                 was stopped after `timeout` seconds (default: twice the
+                 expected duration plus 10 s)
+        """
+        return self.executor.submit(self._ping, target, ping_size, num_ping,
+                                    interval, timeout)
+
+    def ping_all(self, targets, **kwargs):
+        """
+        Queue a ping test per target, see `ping`
+        """
+        return [self.ping(target, **kwargs) for target in targets]
+
+    def traceroute(self, target, max_hops=30, data_size=32, base_port=33434,
+                   resolve_host=False, timeout=120):
+        """
+        Queue a traceroute
+
+        @returns Future of the TracerouteResult; its `done` is False when
+                 the traceroute was stopped after `timeout` seconds
+        """
+        return self.executor.submit(self._traceroute, target, max_hops,
+                                    data_size, base_port, resolve_host,
+                                    timeout)
+
+    def _poll(self, fetch, parse, count, total, first_delay, timeout,
+              stop):
+        """
+        Poll until the result is done or `timeout` expires.
+
+        `count(result)` is the number of items (replies, hops) received,
+        `total` the number expected if known. The next poll is due when the
+        missing items (or the next one) should have arrived at the rate
+        observed so far.
+        """
+        start = time.monotonic()
+        delay = self.clamp(first_delay)
+        seen = 0
+        while True:
+            time.sleep(delay)
+            result = parse(fetch().content)
+            if result.done:
+                return result
+
+            elapsed = time.monotonic() - start
+            if elapsed > timeout:
+                LOGGER.warning("Diagnostic for %s timed out after %.1fs",
+                               result.target, elapsed)
+                stop()
+                return result
+
+            received = count(result)
+            if received > seen:
+                missing = total - received if total else 1
+                delay = self.clamp(elapsed / received * max(missing, 1))
+            else:
+                delay = self.clamp(delay * self.backoff)
+            # Poll once more when the timeout expires
+            delay = min(delay, max(timeout - elapsed, 0) + self.min_poll)
+            seen = received
+
+    def _ping(self, target, ping_size, num_ping, interval, timeout):
+        period = interval * self.interval_seconds
+        if timeout is None:
+            timeout = 2 * num_ping * period + 10
+
+        # The output of the previous test, served until this one starts
+        stale = result_text(self.diagnostics.get_pingtest_result().content)
+        self.diagnostics.start_pingtest(target, ping_size, num_ping, interval)
+        return self._poll(self.diagnostics.get_pingtest_result,
+                          lambda content: parse_ping(content, target,
+                                                     num_ping, stale),
+                          lambda result: len(result.replies), num_ping,
+                          period, timeout,
+                          self.diagnostics.stop_pingtest)
+
+    def _traceroute(self, target, max_hops, data_size, base_port,
+                    resolve_host, timeout):
+        stale = result_text(
+            self.diagnostics.get_traceroute_result().content)
+        self.diagnostics.start_traceroute(target, max_hops, data_size,
+                                          base_port, resolve_host)
+        return self._poll(self.diagnostics.get_traceroute_result,
+                          lambda content: parse_traceroute(content, target,
+                                                           max_hops, stale),
+                          lambda result: len(result.hops), None,
+                          self.min_poll, timeout,
+                          self.diagnostics.stop_traceroute)
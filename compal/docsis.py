@@ -0,0 +1,262 @@
+"""
+Columnar parsers for the DOCSIS channel tables.
+
+Decodes `Get.DOWNSTREAM_TABLE`, `Get.UPSTREAM_TABLE` and `Get.SIGNAL_TABLE`
+responses into NumPy structured arrays. The parsers accept the responses of
+many modems at once: every column is collected as text for all modems and
+converted in a single vectorised `astype`, the `modem` column holds the index
+of the response a row came from.
+
+Values a row does not report are NaN in float columns, `MISSING` in integer
+columns, False in flags and empty in text columns, so they can not be
+mistaken for readings of zero.
+
+Text columns hold up to 16 characters (e.g. '256QAM/OFDM'); longer values
+are cut off with a warning.
+
+Requires numpy (`pip install compal[docsis]`).
+"""
+import logging
+
+import numpy as np
+
+from lxml import etree
+
+from .functions import Get
+
+LOGGER = logging.getLogger(__name__)
+
+DOWNSTREAM_DTYPE = np.dtype([
+    ('modem', np.int32),
+    ('channel_id', np.int16),
+    ('frequency', np.int64),
+    ('power', np.float32),
+    ('snr', np.float32),
+    ('rx_mer', np.float32),
+    ('modulation', 'U16'),
+    ('pre_rs', np.int64),
+    ('post_rs', np.int64),
+    ('locked', np.bool_),
+    ('unerrored', np.int64),
+    ('corrected', np.int64),
+    ('uncorrectable', np.int64),
+])
+
+UPSTREAM_DTYPE = np.dtype([
+    ('modem', np.int32),
+    ('channel_id', np.int16),
+    ('frequency', np.int64),
+    ('power', np.float32),
+    ('symbol_rate', np.float32),
+    ('modulation', 'U16'),
+    ('channel_type', 'U16'),
+    ('t1_timeouts', np.int32),
+    ('t2_timeouts', np.int32),
+    ('t3_timeouts', np.int32),
+    ('t4_timeouts', np.int32),
+])
+
+SIGNAL_DTYPE = np.dtype([
+    ('modem', np.int32),
+    ('channel', np.int16),
+    ('unerrored', np.int64),
+    ('corrected', np.int64),
+    ('uncorrectable', np.int64),
+])
+
+# (row element, [(column, xml tag)]) per table
+DOWNSTREAM_COLUMNS = ('downstream', [
+    ('channel_id', 'chid'), ('frequency', 'freq'), ('power', 'pow'),
+    ('snr', 'snr'), ('rx_mer', 'RxMER'), ('modulation', 'mod'),
+    ('pre_rs', 'PreRs'), ('post_rs', 'PostRs'), ('locked', 'IsQamLocked'),
+])
+UPSTREAM_COLUMNS = ('upstream', [
+    ('channel_id', 'usid'), ('frequency', 'freq'), ('power', 'power'),
+    ('symbol_rate', 'srate'), ('modulation', 'mod'),
+    ('channel_type', 'channeltype'), ('t1_timeouts', 't1Timeouts'),
+    ('t2_timeouts', 't2Timeouts'), ('t3_timeouts', 't3Timeouts'),
+    ('t4_timeouts', 't4Timeouts'),
+])
+SIGNAL_COLUMNS = ('signal', [
+    ('unerrored', 'unerrored'), ('corrected', 'correctable'),
+    ('uncorrectable', 'uncorrectable'),
+])
+
+# The modem sometimes returns invalid XML, recover from it.
+PARSER = etree.XMLParser(recover=True)
+
+# Integer columns of values that were not reported
+MISSING = -1
+# dtype kind => value of the values that were not reported
+MISSING_VALUES = {'f': np.nan, 'i': MISSING, 'b': False, 'U': ''}
+CODEWORD_COLUMNS = ('unerrored', 'corrected', 'uncorrectable')
+
+
+def _documents(contents):
+    """
+    A single response (bytes, None without content) or an iterable of
+    responses
+    """
+    if contents is None or isinstance(contents, (bytes, str)):
+        return [contents]
+    return list(contents)
+
+
+def _column_text(root, row_tag, tag, num_rows):
+    """
+    The text of `tag` for all rows of one document. Uses a single XPath
+    query; falls back to a per-row walk when an element is missing or empty,
+    those rows are None.
+    """
+    values = root.xpath('{}/{}/text()'.format(row_tag, tag))
+    if len(values) == num_rows:
+        return values
+    return [row.findtext(tag) or None for row in root.iterfind(row_tag)]
+
+
+def parse_table(contents, layout, dtype):
+    """
+    Parse the responses in `contents` into a structured array of `dtype`.
+    `layout` is a (row element, [(column, xml tag)]) pair.
+    """
+    row_tag, columns = layout
+    texts = {column: [] for column, _ in columns}
+    # column => rows without a value
+    missing = {column: [] for column, _ in columns}
+    modems = []
+
+    for idx, content in enumerate(_documents(contents)):
+        if not content:
+            continue
+        root = etree.fromstring(content, parser=PARSER)
+        if root is None:
+            continue
+        num_rows = int(root.xpath('count({})'.format(row_tag)))
+        modems.append(np.full(num_rows, idx, dtype=np.int32))
+        for column, tag in columns:
+            values = _column_text(root, row_tag, tag, num_rows)
+            if None in values:
+                start = len(texts[column])
+                missing[column].extend(start + pos for pos, value
+                                       in enumerate(values) if value is None)
+                # Parsed as '0' and replaced below
+                values = ['0' if value is None else value
+                          for value in values]
+            texts[column].extend(values)
+
+    table = np.zeros(sum(len(m) for m in modems), dtype=dtype)
+    if not table.size:
+        return table
+
+    table['modem'] = np.concatenate(modems)
+    for column, _ in columns:
+        values = np.array(texts[column])
+        # Through `fields`: pylint takes `dtype[column]` for unsubscriptable
+        kind = table.dtype.fields[column][0].kind
+        if kind == 'b':
+            table[column] = values.astype(np.float64) != 0
+        elif kind in 'iu':
+            try:
+                table[column] = values.astype(np.int64)
+            except ValueError:
+                # Some firmwares format integers as floats, e.g. '1.000'
+                table[column] = values.astype(np.float64)
+        else:
+            width = table.dtype.fields[column][0].itemsize
+            if values.dtype.itemsize > width:
+                # Both are unicode, 4 bytes per character
+                LOGGER.warning("Values of %s cut off at %d characters",
+                               column, width // 4)
+            table[column] = values
+        if missing[column]:
+            table[column][missing[column]] = MISSING_VALUES[kind]
+    return table
+
+
+def parse_signal(contents):
+    """
+    Parse `Get.SIGNAL_TABLE` responses: codeword counters per downstream
+    channel, `channel` is the position in the downstream table.
+    """
+    table = parse_table(contents, SIGNAL_COLUMNS, SIGNAL_DTYPE)
+    table['channel'] = _positions(table['modem'])
+    return table
+
+
+def parse_downstream(contents, signal_contents=None):
+    """
+    Parse `Get.DOWNSTREAM_TABLE` responses. When the matching
+    `Get.SIGNAL_TABLE` responses are given, the codeword counters are filled
+    in (the signal table lists channels in the same order); they are
+    `MISSING` otherwise.
+    """
+    table = parse_table(contents, DOWNSTREAM_COLUMNS, DOWNSTREAM_DTYPE)
+    for column in CODEWORD_COLUMNS:
+        table[column] = MISSING
+    if signal_contents is None:
+        return table
+
+    signal = parse_signal(signal_contents)
+    # Rows are identified by (modem, position); both tables are sorted by it
+    positions = _positions(table['modem'])
+    keys = table['modem'].astype(np.int64) << 16 | positions
+    signal_keys = signal['modem'].astype(np.int64) << 16 | signal['channel']
+    if len(signal_keys):
+        idx = np.minimum(np.searchsorted(signal_keys, keys),
+                         len(signal_keys) - 1)
+        matches = signal_keys[idx] == keys
+        for column in CODEWORD_COLUMNS:
+            table[column][matches] = signal[column][idx[matches]]
+    return table
+
+
+def parse_upstream(contents):
+    """
+    Parse `Get.UPSTREAM_TABLE` responses
+    """
+    return parse_table(contents, UPSTREAM_COLUMNS, UPSTREAM_DTYPE)
+
+
+def _positions(modems):
+    """
+    Position of every row within its modem's rows (rows are grouped by modem)
+    """
+    if not modems.size:
+        return np.zeros(0, dtype=np.int16)
+    starts = np.flatnonzero(np.r_[True, modems[1:] != modems[:-1]])
+    counts = np.diff(np.r_[starts, len(modems)])
+    return (np.arange(len(modems)) -
+            np.repeat(starts, counts)).astype(np.int16)
+
+
+class DocsisTables(object):
+    """
+    Read the DOCSIS channel tables of a modem
+    """
+    def __init__(self, modem):
+        self.modem = modem
+
+    @property
+    def downstream(self):
+        """
+        Downstream channels, including the codeword counters
+        """
+        content = self.modem.xml_getter(Get.DOWNSTREAM_TABLE, {}).content
+        signal = self.modem.xml_getter(Get.SIGNAL_TABLE, {}).content
+        return parse_downstream(content, signal)
+
+    @property
+    def upstream(self):
+        """
+        Upstream channels
+        """
+        return parse_upstream(
+            self.modem.xml_getter(Get.UPSTREAM_TABLE, {}).content)
+
+    @property
+    def signal(self):
+        """
+        Codeword counters per downstream channel
+        """
+        return parse_signal(
+            self.modem.xml_getter(Get.SIGNAL_TABLE, {}).content)
@@ -0,0 +1,808 @@
+"""
+Local stand-in for the CH7465LG web interface.
+
+Serves `/`, `/xml/getter.xml` and `/xml/setter.xml` from an in-process HTTP
+server and follows the rules that `Compal` relies on:
+ * every response rotates the `sessionToken` cookie,
+ * every POST must start with the `token` and `fun` fields (in that order)
+   and carry the last issued token,
+ * `Set.LOGIN` issues a `SID`; only a single session can be active.
+
+Used to benchmark the client without a (slow) modem in the loop.
+"""
+import http.server
+import itertools
+import logging
+import random
+import socketserver
+import threading
+import time
+import urllib.parse
+
+from xml.sax.saxutils import escape
+
+from .functions import Set, Get
+
+LOGGER = logging.getLogger(__name__)
+
+LOGIN_PAGE = '/common_page/login.html'
+ACCESS_DENIED_PAGE = '/common_page/Access-denied.html'
+FIRST_INSTALL_PAGE = '/common_page/FirstInstallation.html'
+
+# Getters that the web interface calls before login
+PUBLIC_GETTERS = frozenset([Get.MULTILANG, Get.LANGSETLIST])
+
+XML_HEADER = '<?xml version="1.0" encoding="utf-8"?>'
+
+
+def xml_element(tag, children):
+    """
+    Serialize a flat element: `children` is an iterable of (tag, value) pairs
+    """
+    return '<{tag}>{body}</{tag}>'.format(tag=tag, body=''.join(
+        '<{0}>{1}</{0}>'.format(k, escape(str(v))) for k, v in children))
+
+
+class ModemState(object):
+    """
+    Mutable state of the emulated modem.
+
+    All access happens with `lock` held; the server handles requests on
+    multiple threads.
+    """
+    def __init__(self, key='password', num_downstream=24, num_upstream=4,
+                 num_events=64, num_clients=8, first_install=False,
+                 reboot_time=0, diag_scale=0.01):
+        self.lock = threading.RLock()
+        self.key = key
+        self.first_install = first_install
+
+        self.token = None
+        self.sid = None
+        self.tokens = itertools.count(random.randint(10**8, 10**9))
+
+        self.started = time.time()
+        # Seconds the modem is unreachable after a restore or reboot
+        self.reboot_time = reboot_time
+        self.down_until = 0
+        self.config_model = 'CH7465LG'
+        self.config_blob = bytes(random.getrandbits(8) for _ in range(16384))
+
+        self.lan_ip = '192.168.178.1'
+        self.upnp = 1
+        self.mtu = 1500
+        self.remote_access = 2
+        self.remote_port = 8443
+        self.static_leases = []
+        self.forwards = []
+        self.forward_ids = itertools.count(1)
+
+        # Running/last diagnostics: (start time, parameters). `diag_scale`
+        # is the duration of a ping interval unit / traceroute hop [s].
+        self.diag_scale = diag_scale
+        self.ping = None
+        self.traceroute = None
+        # Host name => address for the diagnostics; other targets are
+        # addresses already
+        self.hosts = {}
+
+        self.wifi = {
+            'Bandmode': 3, 'BssCoexistence': 1, 'NvCountry': 1,
+            'ChannelRange': 1,
+        }
+        for band in ('2g', '5g'):
+            self.wifi.update({
+                'SSID' + band: 'Ziggo' + band, 'BssEnable' + band: 1,
+                'BandWidth' + band: 2 if band == '2g' else 3,
+                'TransmissionMode' + band: 6 if band == '2g' else 14,
+                'MulticastRate' + band: 1, 'HideNetwork' + band: 2,
+                'PreSharedKey' + band: 'secret' + band,
+                'TransmissionRate' + band: 0,
+                'GroupRekeyInterval' + band: 0,
+                'CurrentChannel' + band: 13 if band == '2g' else 0,
+                'SecurityMode' + band: 8, 'WpaAlgorithm' + band: 3,
+            })
+
+        self.num_downstream = num_downstream
+        self.num_upstream = num_upstream
+        self.num_events = num_events
+        self.num_clients = num_clients
+
+        # Counters for the emulator itself
+        self.requests = 0
+        self.rejected = 0
+
+    def next_token(self):
+        """
+        Rotate the session token
+        """
+        self.token = str(next(self.tokens))
+        return self.token
+
+    def reboot(self):
+        """
+        Drop the session; the modem is down for `reboot_time` seconds
+        """
+        self.sid = None
+        self.down_until = self.started = time.time() + self.reboot_time
+
+
+class ModemEmulator(object):
+    """
+    In-process HTTP server emulating a Connect Box.
+
+    Use as a context manager or call `start`/`stop`. `router_ip` is the
+    `host:port` string to pass to `Compal`.
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, **kwargs):
+        self.state = ModemState(**kwargs)
+        self.latency = latency
+        self.getters = {
+            Get.GLOBALSETTINGS: self.get_globalsettings,
+            Get.CM_SYSTEM_INFO: self.get_cm_system_info,
+            Get.MULTILANG: self.get_multilang,
+            Get.LANGSETLIST: self.get_langsetlist,
+            Get.STATUS: self.get_status,
+            Get.CMSTATUS: self.get_cmstatus,
+            Get.DOWNSTREAM_TABLE: self.get_downstream_table,
+            Get.UPSTREAM_TABLE: self.get_upstream_table,
+            Get.SIGNAL_TABLE: self.get_signal_table,
+            Get.EVENTLOG_TABLE: self.get_eventlog_table,
+            Get.FIREWALLLOG_TABLE: self.get_firewalllog_table,
+            Get.FORWARDING: self.get_forwarding,
+            Get.LANUSERTABLE: self.get_lanusertable,
+            Get.WIRELESSBASIC: self.get_wirelessbasic,
+            Get.LANSETTING: self.get_lansetting,
+            Get.MTUSIZE: self.get_mtusize,
+            Get.REMOTEACCESS: self.get_remoteaccess,
+            Get.PING_RESULT: self.get_ping_result,
+            Get.TRACEROUTE_RESULT: self.get_traceroute_result,
+        }
+        self.setters = {
+            Set.LOGIN: self.set_login,
+            Set.LOGOUT: self.set_logout,
+            Set.PORT_FORWARDING: self.set_port_forwarding,
+            Set.WIFI_SETTINGS: self.set_wifi_settings,
+            Set.INSTALL_DONE: self.set_install_done,
+            Set.UPNP_STATUS: self.set_upnp_status,
+            Set.MTU_SIZE: self.set_mtu_size,
+            Set.REMOTE_ACCESS: self.set_remote_access,
+            Set.STATIC_DHCP_LEASE: self.set_static_dhcp_lease,
+            Set.PING_TEST: self.set_ping_test,
+            Set.TRACEROUTE: self.set_traceroute,
+            Set.STOP_DIAGNOSTIC: self.set_stop_diagnostic,
+            Set.REBOOT: self.set_reboot,
+            Set.FACTORY_RESET: self.set_logout,
+        }
+
+        self.server = _ThreadingHTTPServer((host, port), _Handler)
+        self.server.emulator = self
+        self.thread = None
+
+    @property
+    def router_ip(self):
+        """
+        `host:port` of the running server
+        """
+        host, port = self.server.server_address[:2]
+        return '{}:{}'.format(host, port)
+
+    def start(self):
+        """
+        Serve requests on a background thread
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name='compal-emulator', daemon=True)
+        self.thread.start()
+        LOGGER.debug("Emulator listening on %s", self.router_ip)
+        return self
+
+    def stop(self):
+        """
+        Stop the server and wait for the thread to finish
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Request handling. Each handler returns (status, headers, body)
+    def handle_get(self, path, query, cookies):
+        """
+        Handle a GET request
+        """
+        state = self.state
+        if path == '/':
+            if state.first_install:
+                return 302, {'Location': FIRST_INSTALL_PAGE}, b''
+            if state.sid is not None:
+                return 302, {'Location': ACCESS_DENIED_PAGE}, b''
+            return 302, {'Location': LOGIN_PAGE}, b''
+
+        if path.startswith('/common_page/'):
+            return 200, {'Content-Type': 'text/html'}, b'<html></html>'
+
+        if path == '/xml/getter.xml' and 'filename' in query:
+            if not self.valid_session(cookies):
+                return 302, {'Location': LOGIN_PAGE}, b''
+            if query['filename'] != state.config_model + '-Cfg.bin':
+                return 404, {}, b''
+            return 200, {'Content-Type': 'application/octet-stream'}, \
+                state.config_blob
+
+        return 404, {}, b''
+
+    def handle_post(self, path, query, cookies, body):
+        """
+        Handle a POST request to the getter or setter
+        """
+        state = self.state
+        if path == '/xml/getter.xml' and 'Restore' in query:
+            if not self.valid_session(cookies):
+                return 302, {'Location': LOGIN_PAGE}, b''
+            state.config_blob = body
+            state.reboot()
+            return 200, {}, b''
+
+        if path not in ('/xml/getter.xml', '/xml/setter.xml'):
+            return 404, {}, b''
+
+        fields = urllib.parse.parse_qsl(body.decode('utf-8'),
+                                        keep_blank_values=True)
+        # The modem is sensitive to the ordering of the fields
+        if len(fields) < 2 or [k for k, _ in fields[:2]] != ['token', 'fun']:
+            state.rejected += 1
+            return 200, {}, b''
+        if fields[0][1] != state.token:
+            state.rejected += 1
+            return 200, {}, b''
+
+        try:
+            fun = int(fields[1][1])
+        except ValueError:
+            state.rejected += 1
+            return 200, {}, b''
+        params = fields[2:]
+
+        # The first installation runs without a session
+        authorized = state.first_install or self.valid_session(cookies)
+        if path == '/xml/setter.xml':
+            if fun != Set.LOGIN and not authorized:
+                return 302, {'Location': LOGIN_PAGE}, b''
+            handler = self.setters.get(fun)
+            if handler is None:
+                return 200, {}, b''
+            return handler(params)
+
+        if fun not in PUBLIC_GETTERS and not authorized:
+            return 302, {'Location': LOGIN_PAGE}, b''
+        handler = self.getters.get(fun)
+        if handler is None:
+            # Unknown functions return an empty body
+            return 200, {}, b''
+        return 200, {'Content-Type': 'text/xml'}, \
+            (XML_HEADER + handler()).encode('utf-8')
+
+    def valid_session(self, cookies):
+        """
+        Does the request carry the SID of the active session?
+        """
+        return self.state.sid is not None and \
+            cookies.get('SID') == self.state.sid
+
+    # Setters
+    def set_login(self, params):
+        """
+        Login: Username and Password, in that order
+        """
+        state = self.state
+        if [k for k, _ in params] != ['Username', 'Password']:
+            state.rejected += 1
+            return 200, {}, b''
+        if state.first_install:
+            # The first installation sets the password
+            state.key = params[1][1]
+            return 200, {}, b''
+        if state.sid is not None:
+            return 302, {'Location': ACCESS_DENIED_PAGE}, b''
+        if params[1][1] != state.key:
+            return 200, {}, b'idloginincorrect'
+
+        state.sid = str(random.randint(10**8, 10**9))
+        return 200, {}, 'successful;SID={}'.format(state.sid).encode()
+
+    def set_logout(self, _params):
+        """
+        Logout (and factory reset): drop the active session
+        """
+        self.state.sid = None
+        return 200, {}, b''
+
+    def set_reboot(self, _params):
+        """
+        Reboot
+        """
+        self.state.reboot()
+        return 200, {}, b''
+
+    def set_install_done(self, _params):
+        """
+        Finish the first installation
+        """
+        self.state.first_install = False
+        return 200, {}, b''
+
+    def set_upnp_status(self, params):
+        """
+        Enable (1) or disable (2) UPnP
+        """
+        self.state.upnp = int(dict(params)['UPnP'])
+        return 200, {}, b''
+
+    def set_mtu_size(self, params):
+        """
+        Change the MTU
+        """
+        self.state.mtu = int(dict(params)['MTUSize'])
+        return 200, {}, b''
+
+    def set_remote_access(self, params):
+        """
+        Enable (1) or disable (2) remote access
+        """
+        values = dict(params)
+        self.state.remote_access = int(values['RemoteAccess'])
+        self.state.remote_port = int(values['Port'])
+        return 200, {}, b''
+
+    def set_static_dhcp_lease(self, params):
+        """
+        Add static leases: 'ADD,<ip>,<mac>;'
+        """
+        for entry in dict(params)['data'].split(';'):
+            parts = entry.split(',')
+            if parts[0] == 'ADD' and len(parts) == 3:
+                self.state.static_leases.append((parts[1], parts[2]))
+        return 200, {}, b''
+
+    def set_ping_test(self, params):
+        """
+        Start a ping test
+        """
+        self.state.ping = (time.time(), dict(params))
+        return 200, {}, b''
+
+    def set_traceroute(self, params):
+        """
+        Start a traceroute
+        """
+        self.state.traceroute = (time.time(), dict(params))
+        return 200, {}, b''
+
+    def set_stop_diagnostic(self, params):
+        """
+        Stop the ping test or traceroute
+        """
+        values = dict(params)
+        if 'Ping' in values:
+            self.state.ping = None
+        if 'Traceroute' in values:
+            self.state.traceroute = None
+        return 200, {}, b''
+
+    def set_port_forwarding(self, params):
+        """
+        Add forwards, or enable/disable/delete existing ones
+        """
+        state = self.state
+        values = dict(params)
+        if values.get('action') == 'add':
+            # Only single adds are known. The '*'-joined encoding of several
+            # adds is unverified (see `compal.forwarding.add_forwards`), so
+            # such requests change nothing.
+            if '*' in str(values['local_IP']):
+                return 200, {}, b''
+            fields = ('local_IP', 'start_port', 'end_port', 'start_portIn',
+                      'end_portIn', 'protocol', 'enable')
+            rule = {field: str(values[field]) for field in fields}
+            rule.update(id=next(state.forward_ids), idd=0)
+            state.forwards.append(rule)
+        elif values.get('action') == 'apply':
+            instances = values['instance'].split('*')
+            enables = values['enable'].split('*')
+            deletes = values['delete'].split('*')
+            by_id = {str(rule['id']): rule for rule in state.forwards}
+            for idx, instance in enumerate(instances):
+                rule = by_id.get(instance)
+                if rule is None:
+                    continue
+                rule['enable'] = enables[idx]
+                if deletes[idx] == '1':
+                    state.forwards.remove(rule)
+        return 200, {}, b''
+
+    def set_wifi_settings(self, params):
+        """
+        Update the wifi settings
+        """
+        mapping = {
+            'BandMode': None, 'Ssid': 'SSID', 'Bandwidth': 'BandWidth',
+            'TxMode': 'TransmissionMode', 'MCastRate': 'MulticastRate',
+            'Hiden': 'HideNetwork', 'PSkey': 'PreSharedKey',
+            'Txrate': 'TransmissionRate', 'Rekey': 'GroupRekeyInterval',
+            'Channel': 'CurrentChannel', 'Security': 'SecurityMode',
+            'Wpaalg': 'WpaAlgorithm',
+        }
+        wifi = self.state.wifi
+        bandmode = 0
+        for key, value in params:
+            if key == 'wlCoexistence':
+                wifi['BssCoexistence'] = value
+                continue
+            name, band = key[2:-2], key[-2:]
+            if name == 'BandMode':
+                bandmode |= int(value or 0) * int(band[0])
+            elif name in mapping:
+                wifi[mapping[name] + band] = value
+        wifi['Bandmode'] = bandmode
+        return 200, {}, b''
+
+    # Getters
+    def get_globalsettings(self):
+        """
+        Global settings, contains the config file model
+        """
+        return xml_element('GlobalSettings', [
+            ('AccessLevel', 0),
+            ('SwVersion', 'CH7465LG-NCIP-6.12.18.25-2p8-NOSH'),
+            ('CmProvisionMode', 'IPv4'),
+            ('GwProvisionMode', 'IPv4'),
+            ('OperatorId', 'ZIGGO'),
+            ('Lang', 'en'),
+            ('ConfigVenderModel', self.state.config_model),
+        ])
+
+    def get_cm_system_info(self):
+        """
+        Cable modem system information
+        """
+        return xml_element('cm_system_info', [
+            ('cm_docsis_mode', 'DOCSIS 3.0'),
+            ('cm_hardware_version', '5.01'),
+            ('cm_mac_addr', '38:43:7D:00:00:01'),
+            ('cm_serial_number', 'EMULATED0000001'),
+            ('cm_system_uptime', int(time.time() - self.state.started)),
+            ('cm_network_access', 'Allowed'),
+        ])
+
+    @staticmethod
+    def get_multilang():
+        """
+        Language of the interface
+        """
+        return xml_element('multilang', [('Lang', 'en')])
+
+    @staticmethod
+    def get_langsetlist():
+        """
+        Available languages
+        """
+        return xml_element('langsetlist', [('Lang', 'en'), ('Lang', 'nl')])
+
+    def get_status(self):
+        """
+        Gateway status
+        """
+        return xml_element('status', [
+            ('cm_provision_mode', 'IPv4'),
+            ('cm_ipaddr', '10.0.0.2'),
+            ('lan_ipaddr', self.state.lan_ip),
+        ])
+
+    @staticmethod
+    def get_cmstatus():
+        """
+        Cable modem provisioning status
+        """
+        return xml_element('cmstatus', [
+            ('provisioning_st', 'Online'),
+            ('cm_comment', 'Operational'),
+            ('ds_num', 24),
+            ('us_num', 4),
+        ])
+
+    def _elapsed(self):
+        return int(time.time() - self.state.started)
+
+    def get_downstream_table(self):
+        """
+        DOCSIS downstream channels
+        """
+        num = self.state.num_downstream
+        return '<downstream_table><ds_num>{}</ds_num>{}</downstream_table>' \
+            .format(num, ''.join(xml_element('downstream', [
+                ('freq', 114000000 + idx * 8000000),
+                ('pow', 3 + idx % 5),
+                ('snr', 38 + idx % 3),
+                ('mod', '256qam'),
+                ('chid', idx + 1),
+                ('RxMER', '{:.3f}'.format(38.5 + idx % 3)),
+                ('PreRs', self._elapsed() * (idx + 1)),
+                ('PostRs', self._elapsed() // 60),
+                ('IsQamLocked', 1),
+                ('IsFECLocked', 1),
+                ('IsMpegLocked', 1),
+            ]) for idx in range(num)))
+
+    def get_upstream_table(self):
+        """
+        DOCSIS upstream channels
+        """
+        num = self.state.num_upstream
+        return '<upstream_table><us_num>{}</us_num>{}</upstream_table>' \
+            .format(num, ''.join(xml_element('upstream', [
+                ('freq', 30000000 + idx * 6400000),
+                ('power', 100 + idx),
+                ('srate', '5.120'),
+                ('usid', idx + 1),
+                ('mod', '64qam'),
+                ('ustype', 3),
+                ('t1Timeouts', 0),
+                ('t2Timeouts', 0),
+                ('t3Timeouts', idx),
+                ('t4Timeouts', 0),
+                ('channeltype', 'ATDMA'),
+                ('messageType', 29),
+            ]) for idx in range(num)))
+
+    def get_signal_table(self):
+        """
+        Codeword counters per downstream channel
+        """
+        num = self.state.num_downstream
+        elapsed = self._elapsed()
+        return '<signal_table><sig_num>{}</sig_num>{}</signal_table>' \
+            .format(num, ''.join(xml_element('signal', [
+                ('unerrored', elapsed * 1000 * (idx + 1)),
+                ('correctable', elapsed * (idx + 1)),
+                ('uncorrectable', elapsed // 60),
+            ]) for idx in range(num)))
+
+    def get_eventlog_table(self):
+        """
+        Event log
+        """
+        return '<eventlog_table>{}</eventlog_table>'.format(''.join(
+            xml_element('eventlog', [
+                ('prior', 'Notice'),
+                ('text', 'Emulated event {}'.format(idx)),
+                ('time', '01/01/2018 00:00:{:02d}'.format(idx % 60)),
+                ('t', 1514764800 + idx),
+            ]) for idx in range(self.state.num_events)))
+
+    def get_firewalllog_table(self):
+        """
+        Firewall log
+        """
+        return '<firewalllog_table>{}</firewalllog_table>'.format(''.join(
+            xml_element('firewalllog', [
+                ('prior', 'Warning'),
+                ('text', 'Blocked port scan from 10.0.0.{}'.format(idx % 250)),
+                ('time', '01/01/2018 00:00:{:02d}'.format(idx % 60)),
+                ('t', 1514764800 + idx),
+            ]) for idx in range(self.state.num_events)))
+
+    def get_forwarding(self):
+        """
+        Port forwarding rules
+        """
+        state = self.state
+        return '<Forwarding><LanIP>{}</LanIP>' \
+            '<subnetmask>255.255.255.0</subnetmask>{}</Forwarding>'.format(
+                state.lan_ip, ''.join(xml_element('instance', [
+                    ('local_IP', rule['local_IP']),
+                    ('start_port', rule['start_port']),
+                    ('end_port', rule['end_port']),
+                    ('start_portIn', rule['start_portIn']),
+                    ('end_portIn', rule['end_portIn']),
+                    ('protocol', rule['protocol']),
+                    ('enable', rule['enable']),
+                    ('idd', rule['idd']),
+                    ('id', rule['id']),
+                ]) for rule in state.forwards))
+
+    def get_lanusertable(self):
+        """
+        Connected clients, static leases have method 2
+        """
+        clients = [('192.168.178.{}'.format(10 + idx),
+                    '00:00:00:00:00:{:02x}'.format(idx), 1)
+                   for idx in range(self.state.num_clients)]
+        clients.extend((ip, mac, 2) for ip, mac in self.state.static_leases)
+        rows = ''.join(xml_element('clientinfo', [
+            ('interface', 'Ethernet 1'),
+            ('IPv4Addr', '{}/24'.format(ip)),
+            ('index', idx),
+            ('interfaceid', 2),
+            ('hostname', 'client-{}'.format(idx)),
+            ('MACAddr', mac),
+            ('method', method),
+            ('leaseTime', '00:01:00:00'),
+            ('speed', 1000),
+        ]) for idx, (ip, mac, method) in enumerate(clients))
+        return '<LanUserTable><Ethernet>{}</Ethernet><WIFI></WIFI>' \
+            '<totalClient>{}</totalClient><Customer>ziggo</Customer>' \
+            '</LanUserTable>'.format(rows, len(clients))
+
+    def get_lansetting(self):
+        """
+        LAN settings. The tags are guessed, see `compal.schema`.
+        """
+        state = self.state
+        return xml_element('LanSetting', [
+            ('LanIP', state.lan_ip),
+            ('subnetmask', '255.255.255.0'),
+            ('UPnP', state.upnp),
+            ('DHCP_addr_s', '192.168.178.10'),
+            ('DHCP_addr_e', '192.168.178.254'),
+        ])
+
+    def get_mtusize(self):
+        """
+        MTU. The tags are guessed, see `compal.schema`.
+        """
+        return xml_element('mtusize', [('MTUSize', self.state.mtu)])
+
+    def get_remoteaccess(self):
+        """
+        Remote access settings. The tags are guessed, see `compal.schema`.
+        """
+        return xml_element('RemoteAccess', [
+            ('RemoteAccess', self.state.remote_access),
+            ('Port', self.state.remote_port),
+        ])
+
+    def get_ping_result(self):
+        """
+        Output of the ping test so far, in the format of busybox ping
+        """
+        if self.state.ping is None:
+            return xml_element('Ping_Result', [('Result', '')])
+        started, params = self.state.ping
+        target, count = params['Target_IP'], int(params['Num_Ping'])
+        period = int(params['Ping_Interval']) * self.state.diag_scale
+
+        sent = min(int((time.time() - started) / period), count)
+        lines = ['PING {0} ({0}): {1} data bytes'.format(
+            target, params['Ping_Size'])]
+        lines.extend('{} bytes from {}: seq={} ttl=117 time={:.3f} ms'.format(
+            int(params['Ping_Size']) + 8, target, seq, 10 + seq * 0.5)
+                     for seq in range(sent))
+        if sent == count:
+            lines.extend([
+                '', '--- {} ping statistics ---'.format(target),
+                '{0} packets transmitted, {0} packets received, '
+                '0% packet loss'.format(count),
+            ])
+        return xml_element('Ping_Result', [('Result', '\n'.join(lines))])
+
+    def get_traceroute_result(self):
+        """
+        Output of the traceroute so far, in the format of busybox traceroute.
+        The target is 4 hops away, the third hop does not answer.
+        """
+        if self.state.traceroute is None:
+            return xml_element('Traceroute_Result', [('Result', '')])
+        started, params = self.state.traceroute
+        target, max_hops = params['Tracert_IP'], int(params['MaxHops'])
+        destination = self.state.hosts.get(target, target)
+
+        hops = min(int((time.time() - started) / self.state.diag_scale),
+                   max_hops, 4)
+        lines = ['traceroute to {} ({}), {} hops max, {} byte packets'.format(
+            target, destination, max_hops, params['DataSize'])]
+        for hop in range(1, hops + 1):
+            if hop == 3:
+                lines.append(' 3  * * *')
+                continue
+            address = destination if hop == 4 else '10.0.{}.1'.format(hop)
+            lines.append(' {0}  {1} ({1})  {2:.3f} ms  {3:.3f} ms  '
+                         '{4:.3f} ms'.format(hop, address, hop * 2.0,
+                                             hop * 2.1, hop * 2.2))
+        return xml_element('Traceroute_Result',
+                           [('Result', '\n'.join(lines))])
+
+    def get_wirelessbasic(self):
+        """
+        Wifi settings. The firmware mixes '2G' and '2g' suffixes.
+        """
+        def tag(key):
+            """
+            SSID uses an upper case band suffix
+            """
+            if key.startswith('SSID'):
+                return key.upper()
+            return key
+
+        return xml_element('WirelessBasic', [
+            (tag(k), v) for k, v in sorted(self.state.wifi.items())])
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Dispatch requests to the emulator, handling the token/cookie protocol
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'Compal-Emulator'
+    # Headers and body are written separately; don't wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        LOGGER.debug(format, *args)
+
+    def _cookies(self):
+        cookies = {}
+        for part in self.headers.get('Cookie', '').split(';'):
+            if '=' in part:
+                key, value = part.strip().split('=', 1)
+                cookies[key] = value
+        return cookies
+
+    def _dispatch(self, method):
+        emulator = self.server.emulator
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+
+        if method == 'POST':
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length)
+
+        if emulator.latency:
+            time.sleep(emulator.latency)
+
+        if time.time() < emulator.state.down_until:
+            # Rebooting: drop the connection without an answer
+            self.close_connection = True  # noqa pylint: disable=attribute-defined-outside-init
+            return
+
+        with emulator.state.lock:
+            emulator.state.requests += 1
+            if method == 'POST':
+                status, headers, content = emulator.handle_post(
+                    url.path, query, self._cookies(), body)
+            else:
+                status, headers, content = emulator.handle_get(
+                    url.path, query, self._cookies())
+            token = emulator.state.next_token()
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Set-Cookie', 'sessionToken={}; path=/'.format(token))
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        GET request
+        """
+        self._dispatch('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """
+        POST request
+        """
+        self._dispatch('POST')
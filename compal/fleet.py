@@ -0,0 +1,185 @@
+"""
+Run a job against many modems on a process pool.
+
+A job is a picklable callable that receives a logged in `Compal` instance.
+Each host runs at most one job at a time (the modem only supports a single
+session), the global parallelism is the size of the pool. Failures are
+isolated per modem and reported in the results:
+
+    fleet = Fleet([('192.168.178.1', 'key1'), ('192.168.179.1', 'key2')])
+    for result in fleet.run(BackupJob('/srv/backups')):
+        print(result.target.router_ip, result.error or result.value)
+"""
+import collections
+import concurrent.futures
+import io
+import logging
+import os
+
+from . import Compal, PortForwards, BackupRestore
+from .recovery import SessionRecovery
+
+LOGGER = logging.getLogger(__name__)
+
+Target = collections.namedtuple('Target', ['router_ip', 'key'])
+Result = collections.namedtuple('Result', ['target', 'value', 'error'])
+
+
+def run_job(job, target, timeout, recovery=None):
+    """
+    Log in to the target, run the job and log out. Runs in the worker.
+
+    Exceptions are returned instead of raised so that one modem's failure is
+    reported with its own result. A session lost during the job is recovered
+    with `recovery` (a `SessionRecovery`), if any.
+    """
+    try:
+        modem = Compal(target.router_ip, target.key, timeout=timeout,
+                       recovery=recovery)
+        modem.login()
+    except Exception as err:  # pylint: disable=broad-except
+        return None, err
+
+    try:
+        return job(modem), None
+    except Exception as err:  # pylint: disable=broad-except
+        return None, err
+    finally:
+        try:
+            modem.logout()
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.warning("Logout from %s failed", target.router_ip)
+
+
+class Fleet(object):
+    """
+    A set of modems to run jobs against.
+
+    `recovery` is the `SessionRecovery` of the jobs, a new one by default.
+    The jobs on a thread pool share its circuit breakers; a process pool
+    sends each job a copy, with closed circuits.
+    """
+    def __init__(self, targets, max_workers=None, timeout=10, recovery=None):
+        self.targets = [Target(*target) for target in targets]
+        self.max_workers = max_workers or os.cpu_count()
+        self.timeout = timeout
+        self.recovery = recovery or SessionRecovery()
+
+    def executor(self):
+        """
+        The pool that runs the jobs
+        """
+        return concurrent.futures.ProcessPoolExecutor(self.max_workers)
+
+    def run(self, job):
+        """
+        Run `job` on every target
+
+        @returns generator of Result, in order of completion
+        """
+        # Hosts that occur more than once run their jobs one after another
+        per_host = collections.OrderedDict()
+        for target in self.targets:
+            per_host.setdefault(target.router_ip,
+                                collections.deque()).append(target)
+
+        with self.executor() as executor:
+            running = {}
+
+            def submit(router_ip):
+                """
+                Submit the next job for the host
+                """
+                target = per_host[router_ip].popleft()
+                future = executor.submit(run_job, job, target, self.timeout,
+                                         self.recovery)
+                running[future] = target
+
+            for router_ip in per_host:
+                submit(router_ip)
+
+            while running:
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    target = running.pop(future)
+                    try:
+                        value, error = future.result()
+                    except Exception as err:  # pylint: disable=broad-except
+                        # The worker died or the result was not picklable
+                        value, error = None, err
+
+                    if error is not None:
+                        LOGGER.error("[%s] %s failed: %s", target.router_ip,
+                                     job, error)
+                    yield Result(target, value, error)
+
+                    if per_host[target.router_ip]:
+                        submit(target.router_ip)
+
+
+class PortForwardJob(object):
+    """
+    Apply a list of port forwards, optionally deleting the existing rules.
+
+    `forwards` contains (local_ip, ext_port, int_port, proto) tuples.
+    """
+    def __init__(self, forwards, delete_existing=False):
+        self.forwards = list(forwards)
+        self.delete_existing = delete_existing
+
+    def __call__(self, modem):
+        port_forwards = PortForwards(modem)
+
+        if self.delete_existing:
+            rules = list(port_forwards.rules)
+            for rule in rules:
+                rule.delete = True
+            if rules:
+                port_forwards.update_rules(rules)
+
+        for local_ip, ext_port, int_port, proto in self.forwards:
+            port_forwards.add_forward(local_ip, ext_port, int_port, proto)
+
+        return len(self.forwards)
+
+    def __repr__(self):
+        return 'PortForwardJob({} forwards)'.format(len(self.forwards))
+
+
+class BackupJob(object):
+    """
+    Take a configuration backup and store it as `<router_ip>-Cfg.bin` in
+    `directory`. Returns the path of the file.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __call__(self, modem):
+        path = os.path.join(self.directory, '{}-Cfg.bin'.format(
+            modem.router_ip.replace(':', '_')))
+        with io.open(path, 'wb') as f:  # pylint: disable=invalid-name
+            size = BackupRestore(modem).backup_to(f)
+        if size is None:
+            os.remove(path)
+            raise ValueError("No backup received")
+        return path
+
+    def __repr__(self):
+        return 'BackupJob({!r})'.format(self.directory)
+
+
+class StoreBackupJob(object):
+    """
+    Take a configuration backup into the `compal.backup_store.BackupStore`
+    at `root`. Returns the BackupRecord.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def __call__(self, modem):
+        from .backup_store import BackupStore
+        return BackupStore(self.root).backup(modem)
+
+    def __repr__(self):
+        return 'StoreBackupJob({!r})'.format(self.root)
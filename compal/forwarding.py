@@ -0,0 +1,332 @@
+"""
+Indexed port forwarding tables.
+
+`PortForwards.rules` is a flat list. `PortForwardTable` indexes the rules by
+external port range, by internal port range per local IP and by local IP, so
+conflict checks take O(log n) instead of a scan over all rules:
+
+    table = PortForwardTable.fetch(modem)
+    table.is_forwarded(443, Proto.tcp)
+    table.conflicts(PortForward('192.168.178.17', 8080, 80, Proto.tcp, True))
+
+    plan = table.plan(desired_rules)
+    plan.add, plan.delete, plan.toggle
+
+`bulk_update` applies such changes in a few requests (`PortForwards`
+delegates `add_forwards` and `bulk_update` to this module).
+
+The encoding of several adds in one request (`add_forwards`) is unverified:
+it follows the '*'-joined encoding of `PortForwards.update_rules`, but no
+firmware is known to accept it. `bulk_update` checks the result and falls
+back to single adds.
+"""
+import bisect
+import collections
+import copy
+import logging
+
+from . import PortForward, PortForwards, Proto, port_range, rule_key
+from .functions import Set
+
+LOGGER = logging.getLogger(__name__)
+
+# Transport protocols matched by a rule's protocol
+TRANSPORTS = {
+    Proto.tcp: ('tcp',),
+    Proto.udp: ('udp',),
+    Proto.both: ('tcp', 'udp'),
+}
+
+ForwardPlan = collections.namedtuple('ForwardPlan', [
+    'add', 'delete', 'toggle'])
+
+
+class IntervalIndex(object):
+    """
+    Static index of closed (start, end) intervals.
+
+    The intervals are sorted by start and form an implicit balanced tree
+    (the middle of a slice is the root of its subtree), each node holding
+    the largest end in its subtree. Overlap queries take O(log n + k).
+    """
+    def __init__(self, items):
+        # items: iterable of ((start, end), value)
+        self.items = sorted(items, key=lambda item: item[0])
+        self.starts = [start for (start, _), _ in self.items]
+        self.max_end = [None]*len(self.items)
+        self._build(0, len(self.items))
+
+        # largest end of the intervals [0, i]
+        self.prefix_end = []
+        for (_, end), _ in self.items:
+            self.prefix_end.append(
+                max(end, self.prefix_end[-1]) if self.prefix_end else end)
+
+    def _build(self, low, high):
+        if low >= high:
+            return -1
+        mid = (low + high) // 2
+        self.max_end[mid] = max(self.items[mid][0][1],
+                                self._build(low, mid),
+                                self._build(mid + 1, high))
+        return self.max_end[mid]
+
+    def __len__(self):
+        return len(self.items)
+
+    def overlaps(self, start, end):
+        """
+        Whether an interval overlaps [start, end], in O(log n)
+        """
+        # Only intervals starting at or before `end` can overlap
+        count = bisect.bisect_right(self.starts, end)
+        return count > 0 and self.prefix_end[count - 1] >= start
+
+    def overlapping(self, start, end):
+        """
+        Values of the intervals overlapping [start, end], by start
+        """
+        found = []
+        self._collect(0, len(self.items), start, end, found)
+        return found
+
+    def _collect(self, low, high, start, end, found):
+        if low >= high:
+            return
+        mid = (low + high) // 2
+        # Nothing in this subtree ends at or after `start`
+        if self.max_end[mid] < start:
+            return
+        self._collect(low, mid, start, end, found)
+        # This and the intervals after it start after `end`
+        if self.starts[mid] > end:
+            return
+        if self.items[mid][0][1] >= start:
+            found.append(self.items[mid][1])
+        self._collect(mid + 1, high, start, end, found)
+
+
+class PortForwardTable(object):
+    """
+    Port forwarding rules with indexes for conflict queries
+    """
+    def __init__(self, rules):
+        self.rules = list(rules)
+
+        self.by_local_ip = collections.defaultdict(list)
+        ext_ranges = collections.defaultdict(list)
+        int_ranges = collections.defaultdict(list)
+        for rule in self.rules:
+            self.by_local_ip[rule.local_ip].append(rule)
+            for transport in TRANSPORTS[rule.proto]:
+                ext_ranges[transport].append(
+                    (port_range(rule.ext_port), rule))
+                int_ranges[rule.local_ip, transport].append(
+                    (port_range(rule.int_port), rule))
+
+        # transport => index of external ranges
+        self.ext_index = {transport: IntervalIndex(items)
+                          for transport, items in ext_ranges.items()}
+        # (local ip, transport) => index of internal ranges
+        self.int_index = {key: IntervalIndex(items)
+                          for key, items in int_ranges.items()}
+
+    @classmethod
+    def fetch(cls, modem):
+        """
+        Table of the rules currently on the modem
+        """
+        return cls(PortForwards(modem).rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def for_local_ip(self, local_ip):
+        """
+        The rules forwarding to `local_ip`
+        """
+        return list(self.by_local_ip.get(local_ip, []))
+
+    @staticmethod
+    def _query(indexes, keys, port):
+        found, seen = [], set()
+        start, end = port_range(port)
+        for key in keys:
+            for rule in indexes[key].overlapping(start, end) \
+                    if key in indexes else ():
+                if id(rule) not in seen:
+                    seen.add(id(rule))
+                    found.append(rule)
+        return found
+
+    def is_forwarded(self, ext_port, proto=Proto.both):
+        """
+        Whether a rule forwards an external port (or any port of a range)
+        for one of the transports of `proto`
+        """
+        start, end = port_range(ext_port)
+        return any(self.ext_index[transport].overlaps(start, end)
+                   for transport in TRANSPORTS[proto]
+                   if transport in self.ext_index)
+
+    def ext_conflicts(self, ext_port, proto=Proto.both):
+        """
+        The rules whose external range overlaps `ext_port`
+        """
+        return self._query(self.ext_index, TRANSPORTS[proto], ext_port)
+
+    def int_conflicts(self, local_ip, int_port, proto=Proto.both):
+        """
+        The rules forwarding to an overlapping internal range of `local_ip`
+        """
+        return self._query(self.int_index, [
+            (local_ip, transport) for transport in TRANSPORTS[proto]],
+                           int_port)
+
+    def conflicts(self, rule):
+        """
+        The rules, other than `rule` itself, that overlap with it on the
+        external side or on the internal side of the same host
+        """
+        found = self.ext_conflicts(rule.ext_port, rule.proto)
+        seen = set(id(other) for other in found)
+        found.extend(other for other in self.int_conflicts(
+            rule.local_ip, rule.int_port, rule.proto)
+                     if id(other) not in seen)
+        return [other for other in found if other is not rule]
+
+    def plan(self, desired):
+        """
+        The changes that turn this table into the `desired` rules.
+
+        Rules are matched by `rule_key`. Rules that are not desired are
+        deleted, rules that only differ in `enabled` are toggled.
+
+        @returns ForwardPlan of the PortForwards to add and copies of the
+                 existing rules to delete and toggle (with `delete`/`enabled`
+                 set); the table itself is not changed
+        @raises ValueError if the resulting rules conflict
+        """
+        wanted = collections.OrderedDict()
+        for rule in desired:
+            wanted.setdefault(rule_key(rule), rule)
+
+        delete, toggle, kept = [], [], {}
+        for rule in self.rules:
+            key = rule_key(rule)
+            if key not in wanted or key in kept:
+                rule = copy.copy(rule)
+                rule.delete = True
+                delete.append(rule)
+                continue
+            if bool(rule.enabled) != bool(wanted[key].enabled):
+                rule = copy.copy(rule)
+                rule.enabled = wanted[key].enabled
+                toggle.append(rule)
+            kept[key] = rule
+
+        add = [PortForward(*key, enabled=rule.enabled)
+               for key, rule in wanted.items() if key not in kept]
+
+        result = PortForwardTable(list(kept.values()) + add)
+        for rule in add:
+            conflicting = result.conflicts(rule)
+            if conflicting:
+                raise ValueError("{} conflicts with {}".format(
+                    rule, conflicting))
+
+        return ForwardPlan(add, delete, toggle)
+
+
+def add_forwards(forwards, rules):
+    """
+    Add several port forwards in one request through the `PortForwards`
+    `forwards`, with the '*'-joined encoding of `update_rules`. Unverified,
+    see the module documentation.
+    """
+    rules = list(rules)
+    ranges = [(port_range(r.ext_port), port_range(r.int_port))
+              for r in rules]
+
+    def join(values):
+        """
+        '*'-joined values
+        """
+        return '*'.join(str(value) for value in values)
+
+    params = collections.OrderedDict([
+        ('action', 'add'),
+        ('instance', '*'*(len(rules) - 1)),
+        ('local_IP', join(r.local_ip for r in rules)),
+        ('start_port', join(ext[0] for ext, _ in ranges)),
+        ('end_port', join(ext[1] for ext, _ in ranges)),
+        ('start_portIn', join(int_[0] for _, int_ in ranges)),
+        ('end_portIn', join(int_[1] for _, int_ in ranges)),
+        ('protocol', join(Proto(r.proto).value for r in rules)),
+        ('enable', join(int(r.enabled) for r in rules)),
+        ('delete', join(0 for _ in rules)),
+        ('idd', '*'*(len(rules) - 1))
+    ])
+
+    LOGGER.info("Adding %d port forwards", len(rules))
+    LOGGER.debug(params)
+
+    return forwards.modem.xml_setter(Set.PORT_FORWARDING, params)
+
+
+def bulk_update(forwards, add=(), delete=(), toggle=(), batch_size=None):
+    """
+    Add new rules and delete or toggle existing ones through the
+    `PortForwards` `forwards` in few requests: one for the deletes and
+    toggles, one per `batch_size` new rules (all of them by default). New
+    rules missing from the verification read afterwards are added one by
+    one, for firmware that only accepts single adds.
+
+    @returns the rules on the modem after the update
+    @raises ValueError if the modem does not reflect the update
+    """
+    add = list(add)
+    changed = [copy.copy(rule) for rule in delete if rule.id is not None]
+    for rule in changed:
+        rule.delete = True
+    changed.extend(rule for rule in toggle if not rule.delete)
+
+    if changed:
+        forwards.update_rules(changed)
+
+    batch_size = batch_size or max(len(add), 1)
+    for start in range(0, len(add), batch_size):
+        batch = add[start:start + batch_size]
+        if len(batch) == 1:
+            forwards.add_forward(batch[0].local_ip, batch[0].ext_port,
+                                 batch[0].int_port, Proto(batch[0].proto),
+                                 batch[0].enabled)
+        else:
+            add_forwards(forwards, batch)
+
+    rules = list(forwards.rules)
+    present = set(rule_key(rule) for rule in rules)
+    missing = [rule for rule in add if rule_key(rule) not in present]
+    if missing and batch_size > 1:
+        LOGGER.warning("%d port forwards missing after the bulk add, "
+                       "adding them one by one", len(missing))
+        for rule in missing:
+            forwards.add_forward(rule.local_ip, rule.ext_port, rule.int_port,
+                                 Proto(rule.proto), rule.enabled)
+        rules = list(forwards.rules)
+        present = set(rule_key(rule) for rule in rules)
+        missing = [rule for rule in add if rule_key(rule) not in present]
+
+    # By id: a duplicate of a deleted rule has the same key. The id of a
+    # deleted rule may be reused by one of the new rules.
+    deleted = set(rule.id for rule in changed if rule.delete)
+    added = set(rule_key(rule) for rule in add)
+    remaining = [rule for rule in rules
+                 if rule.id in deleted and rule_key(rule) not in added]
+    if missing or remaining:
+        raise ValueError("Port forward update failed: {} not added, "
+                         "{} not deleted".format(missing, remaining))
+    return rules
@@ -0,0 +1,260 @@
+"""
+Per-function request metrics.
+
+Pass a `Metrics` instance to `Compal` to record, per getter/setter function
+(and per path for plain GETs): a latency histogram, request and response
+bytes, status codes, redirects to the login and access-denied pages, and
+logins/re-logins:
+
+    metrics = Metrics()
+    modem = Compal('192.168.178.1', key, metrics=metrics)
+    ...
+    metrics.snapshot()[('get', 'CM_SYSTEM_INFO')].latency_sum
+    print(metrics.prometheus())
+    start_http_server(metrics, 9465)  # serves /metrics
+
+Recording a request takes a lock, a bisect into preallocated bucket counts
+and a few additions; nothing is formatted or logged per call, so the
+metrics can stay on in production. One `Metrics` can be shared by many
+`Compal` instances (e.g. the modems of a fleet on a thread pool); label
+them with `labels` to keep them apart.
+"""
+import bisect
+import collections
+import http.server
+import threading
+
+from .functions import Get, Set
+
+# Upper bounds of the latency buckets [s]; the modem answers in 10s of ms
+# up to seconds when it is busy
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LOGIN_PAGE = 'common_page/login.html'
+ACCESS_DENIED_PAGE = 'common_page/Access-denied.html'
+
+GET_NAMES = {value: name for name, value in vars(Get).items()
+             if isinstance(value, int)}
+SET_NAMES = {value: name for name, value in vars(Set).items()
+             if isinstance(value, int)}
+
+FunctionStats = collections.namedtuple('FunctionStats', [
+    'kind', 'function', 'count', 'latency_sum', 'latency_buckets',
+    'request_bytes', 'response_bytes', 'status_codes', 'login_redirects',
+    'access_denied'])
+
+
+def function_key(path, fun):
+    """
+    (kind, function) label of a request: ('get'|'set', function name) for
+    getter/setter calls, ('http', path) otherwise
+    """
+    if fun is not None:
+        fun = int(fun)
+        if path.endswith('setter.xml'):
+            return 'set', SET_NAMES.get(fun, str(fun))
+        return 'get', GET_NAMES.get(fun, str(fun))
+    return 'http', path
+
+
+class _Stats(object):
+    """
+    Mutable counters of one function, updated under the `Metrics` lock
+    """
+    __slots__ = ('count', 'latency_sum', 'buckets', 'request_bytes',
+                 'response_bytes', 'status_codes', 'login_redirects',
+                 'access_denied')
+
+    def __init__(self):
+        self.count = 0
+        self.latency_sum = 0.0
+        # Last bucket: above the largest bound
+        self.buckets = [0]*(len(LATENCY_BUCKETS) + 1)
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.status_codes = collections.Counter()
+        self.login_redirects = 0
+        self.access_denied = 0
+
+
+class Metrics(object):
+    """
+    Thread-safe request metrics, see the module documentation
+    """
+    def __init__(self, labels=None):
+        # Constant labels of all series, e.g. {'modem': '192.168.178.1'}
+        self.labels = dict(labels or {})
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.logins = 0
+        self.relogins = 0
+
+    def record(self, path, fun, latency, status_code, request_bytes,
+               response_bytes, location=None):
+        """
+        Record a request
+        """
+        key = function_key(path, fun)
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = _Stats()
+            stats.count += 1
+            stats.latency_sum += latency
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            stats.status_codes[status_code] += 1
+            if location:
+                if location.endswith(LOGIN_PAGE):
+                    stats.login_redirects += 1
+                elif location.endswith(ACCESS_DENIED_PAGE):
+                    stats.access_denied += 1
+
+    def record_response(self, res, path, fun, latency, stream=False):
+        """
+        Record a `requests` response. Streamed responses are counted with
+        their Content-Length, their body is not read.
+        """
+        body = res.request.body if res.request is not None else None
+        if stream:
+            response_bytes = int(res.headers.get('Content-Length') or 0)
+        else:
+            response_bytes = len(res.content)
+        self.record(path, fun, latency, res.status_code,
+                    len(body) if hasattr(body, '__len__') else 0,
+                    response_bytes, res.headers.get('Location'))
+
+    def record_login(self, relogin):
+        """
+        Record a login; `relogin` if the client had logged in before
+        """
+        with self.lock:
+            self.logins += 1
+            if relogin:
+                self.relogins += 1
+
+    def snapshot(self):
+        """
+        Consistent copy of the metrics: (kind, function) => FunctionStats
+        """
+        with self.lock:
+            return {key: FunctionStats(
+                key[0], key[1], stats.count, stats.latency_sum,
+                tuple(stats.buckets), stats.request_bytes,
+                stats.response_bytes, dict(stats.status_codes),
+                stats.login_redirects, stats.access_denied)
+                    for key, stats in self.stats.items()}
+
+    def reset(self):
+        """
+        Clear all metrics
+        """
+        with self.lock:
+            self.stats = {}
+            self.logins = self.relogins = 0
+
+    def _labels(self, **labels):
+        merged = dict(self.labels)
+        merged.update(labels)
+        return '{' + ','.join('{}="{}"'.format(
+            name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                              for name, value in sorted(merged.items())) + '}'
+
+    def prometheus(self):
+        """
+        The metrics in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        with self.lock:
+            logins, relogins = self.logins, self.relogins
+
+        lines = [
+            '# HELP compal_request_duration_seconds Modem request latency',
+            '# TYPE compal_request_duration_seconds histogram',
+        ]
+        for (kind, function), stats in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',),
+                                    stats.latency_buckets):
+                cumulative += count
+                lines.append('compal_request_duration_seconds_bucket{} '
+                             '{}'.format(self._labels(kind=kind,
+                                                      function=function,
+                                                      le=bound), cumulative))
+            labels = self._labels(kind=kind, function=function)
+            lines.append('compal_request_duration_seconds_sum{} {}'.format(
+                labels, stats.latency_sum))
+            lines.append('compal_request_duration_seconds_count{} {}'.format(
+                labels, stats.count))
+
+        counters = [
+            ('compal_request_bytes_total', 'Request body bytes',
+             'request_bytes'),
+            ('compal_response_bytes_total', 'Response body bytes',
+             'response_bytes'),
+            ('compal_login_redirects_total', 'Redirects to the login page',
+             'login_redirects'),
+            ('compal_access_denied_total',
+             'Redirects to the access-denied page', 'access_denied'),
+        ]
+        for name, description, field in counters:
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} counter'.format(name))
+            for (kind, function), stats in sorted(snapshot.items()):
+                lines.append('{}{} {}'.format(
+                    name, self._labels(kind=kind, function=function),
+                    getattr(stats, field)))
+
+        lines.append('# HELP compal_responses_total Responses by status code')
+        lines.append('# TYPE compal_responses_total counter')
+        for (kind, function), stats in sorted(snapshot.items()):
+            for status_code, count in sorted(stats.status_codes.items()):
+                lines.append('compal_responses_total{} {}'.format(
+                    self._labels(kind=kind, function=function,
+                                 code=status_code), count))
+
+        for name, description, value in [
+                ('compal_logins_total', 'Logins', logins),
+                ('compal_relogins_total', 'Logins after the first one',
+                 relogins)]:
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} counter'.format(name))
+            lines.append('{}{} {}'.format(name, self._labels(), value))
+        return '\n'.join(lines) + '\n'
+
+
+def start_http_server(metrics, port, addr=''):
+    """
+    Serve `metrics.prometheus()` on http://addr:port/metrics from a daemon
+    thread
+
+    @returns the server; call `shutdown()` to stop it
+    """
+    class Handler(http.server.BaseHTTPRequestHandler):
+        """
+        GET /metrics
+        """
+        def do_GET(self):  # pylint: disable=invalid-name
+            """
+            Prometheus scrape
+            """
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # noqa pylint: disable=redefined-builtin
+            pass
+
+    server = http.server.ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='compal-metrics',
+                     daemon=True).start()
+    return server
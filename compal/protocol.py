@@ -0,0 +1,85 @@
+"""
+Protocol helpers shared by the blocking and the asyncio client: the POST
+body of a call, the login and the initial setup
+"""
+import urllib.parse
+
+from collections import OrderedDict
+
+from .functions import Set, Get
+
+
+def form_data(token, _data):
+    """
+    Build the POST body for a getter/setter call.
+
+    **The router is sensitive to the ordering of the fields**: 'token' comes
+    first, followed by 'fun' and the parameters.
+    """
+    data = OrderedDict()
+    data['token'] = token
+
+    if 'fun' in _data:
+        data['fun'] = _data.pop('fun')
+
+    data.update(_data)
+    return data
+
+
+def login_params(key):
+    """
+    Parameters for `Set.LOGIN`
+    """
+    return OrderedDict([
+        ('Username', 'admin'),
+        ('Password', key)
+    ])
+
+
+def login_sid(res):
+    """
+    Extract the session id from the response to `Set.LOGIN`
+    """
+    if res.status_code != 200:
+        if res.headers['Location'].endswith(
+                'common_page/Access-denied.html'):
+            raise ValueError('Access denied. '
+                             'Still logged in somewhere else?')
+        raise ValueError('Login failed for unknown reason!')
+
+    # The body looks like 'successful;SID=<sid>'. `parse_qs` no longer
+    # splits on ';' (Python 3.9.2+), so normalise the separator.
+    tokens = urllib.parse.parse_qs(res.text.replace(';', '&'))
+
+    token_sids = tokens.get('SID')
+    if not token_sids:
+        raise ValueError('No valid session-Id received! Wrong password?')
+
+    return token_sids[0]
+
+
+def initial_setup_calls(key):
+    """
+    The calls of the initial setup in the web interface, in order:
+    (getter, fun, params) with `getter` False for setters
+    """
+    return [
+        (True, Get.MULTILANG, {}),
+        (True, Get.LANGSETLIST, {}),
+        (True, Get.MULTILANG, {}),
+        (False, Set.LANGUAGE, {'lang': 'en'}),
+        # Login or change password? Not sure.
+        (False, Set.LOGIN, OrderedDict([
+            ('Username', 'admin'),
+            ('Password', key)
+        ])),
+        # Get current wifi settings (?)
+        (True, Get.WIRELESSBASIC, {}),
+        # Some sheets with hints, no request
+        # installation is done:
+        (False, Set.INSTALL_DONE, {
+            'install': 0,
+            'iv': 1,
+            'en': 0
+        }),
+    ]
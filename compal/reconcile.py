@@ -0,0 +1,217 @@
+"""
+Reconcile a modem with a desired-state document.
+
+The current state is read through the getters, compared with the desired
+state and only the setters that change something are issued. Setters are
+slow, and some restart services on the modem.
+
+    desired = {
+        'port_forwards': [
+            {'local_ip': '192.168.178.17', 'ext_port': 443, 'proto': 'tcp'},
+            {'local_ip': '192.168.178.17', 'ext_port': 1022, 'int_port': 22,
+             'proto': 'tcp'},
+        ],
+        'wifi': {'2g': {'ssid': 'home'}, '5g': {'ssid': 'home-5g'}},
+        'dhcp_leases': [{'ip': '192.168.178.17', 'mac': 'd0:50:99:0a:65:52'}],
+        'upnp': False,
+        'mtu': 1500,
+        'remote_access': {'enabled': False},
+        'firewall': {'enabled': True},
+    }
+    changes = Reconciler(modem).apply(desired)
+
+All sections are optional. `port_forwards` lists the complete set of
+forwards: rules that are not listed are deleted. `dhcp_leases` can only add
+leases. There is no known getter for the firewall settings, so a `firewall`
+section is always applied.
+"""
+import collections
+import functools
+import logging
+
+from lxml import etree
+
+from . import (
+    PortForward, PortForwards, WifiSettings, DHCPSettings, MiscSettings,
+    BandSetting, Proto, schema)
+from .forwarding import PortForwardTable
+from .functions import Get
+
+LOGGER = logging.getLogger(__name__)
+
+Change = collections.namedtuple('Change', ['section', 'description', 'apply'])
+
+# Sections in the order in which they are applied. WiFi is last: changing it
+# restarts the radios.
+SECTIONS = ('firewall', 'port_forwards', 'dhcp_leases', 'upnp', 'mtu',
+            'remote_access', 'wifi')
+
+
+class Reconciler(object):
+    """
+    Compute and apply the changes between the modem and a desired state
+    """
+    def __init__(self, modem):
+        self.modem = modem
+        # The modem sometimes returns invalid XML, recover from it.
+        self.parser = etree.XMLParser(recover=True)
+
+        self.port_forwards = PortForwards(modem)
+        self.wifi = WifiSettings(modem)
+        self.dhcp = DHCPSettings(modem)
+        self.misc = MiscSettings(modem)
+
+    def current(self, fun):
+        """
+        Decoded response of getter `fun`, None if there is none
+        """
+        content = self.modem.xml_getter(fun, {}).content
+        if not content:
+            return None
+        root = etree.fromstring(content, parser=self.parser)
+        if root is None:
+            return None
+        values = schema.decode(fun, root)
+        if not schema.SCHEMAS[fun].verified and \
+                all(value is None for value in values.values()):
+            LOGGER.warning("The response to getter %d does not match its "
+                           "unverified schema: %s", fun, content[:200])
+        return values
+
+    def plan(self, desired):
+        """
+        The changes needed to reach the desired state
+        """
+        unknown = set(desired) - set(SECTIONS)
+        if unknown:
+            raise ValueError("Unknown sections: {}".format(
+                ', '.join(sorted(unknown))))
+
+        changes = []
+        for section in SECTIONS:
+            if section in desired:
+                changes.extend(getattr(self, 'plan_' + section)(
+                    desired[section]))
+        return changes
+
+    def apply(self, desired, dry_run=False):
+        """
+        Apply the changes needed to reach the desired state
+
+        @returns the list of changes
+        """
+        changes = self.plan(desired)
+        for change in changes:
+            LOGGER.info("[%s] %s", change.section, change.description)
+            if not dry_run:
+                change.apply()
+
+        if not changes:
+            LOGGER.info("Nothing to change")
+        return changes
+
+    def plan_firewall(self, spec):
+        """
+        Firewall: keyword arguments of `PortForwards.update_firewall`
+        """
+        return [Change('firewall', 'update firewall {}'.format(spec),
+                       functools.partial(self.port_forwards.update_firewall,
+                                         **spec))]
+
+    def plan_port_forwards(self, spec):
+        """
+        Port forwards: the complete list of rules
+        """
+        plan = PortForwardTable.fetch(self.modem).plan(
+            PortForward(rule['local_ip'], rule['ext_port'],
+                        rule.get('int_port', rule['ext_port']),
+                        Proto[rule.get('proto', 'both')],
+                        rule.get('enabled', True))
+            for rule in spec)
+
+        if not (plan.add or plan.delete or plan.toggle):
+            return []
+        return [Change('port_forwards', 'add {}, delete {}, toggle {} '
+                       'rules'.format(len(plan.add), len(plan.delete),
+                                      len(plan.toggle)),
+                       functools.partial(self.port_forwards.bulk_update,
+                                         plan.add, plan.delete, plan.toggle))]
+
+    def plan_dhcp_leases(self, spec):
+        """
+        Static DHCP leases: list of {'ip', 'mac'}
+        """
+        lan_users = self.current(Get.LANUSERTABLE) or {}
+        present = set()
+        for interface in ('Ethernet', 'WIFI'):
+            for client in (lan_users.get(interface) or {}).get(
+                    'clientinfo', []):
+                # method 2 => static lease
+                if client['method'] == 2 and client['IPv4Addr']:
+                    present.add((client['IPv4Addr'].split('/')[0],
+                                 (client['MACAddr'] or '').lower()))
+
+        return [Change('dhcp_leases', 'add lease {ip} => {mac}'.format(
+            **lease), functools.partial(self.dhcp.add_static_lease,
+                                        lease['ip'], lease['mac']))
+                for lease in spec
+                if (lease['ip'], lease['mac'].lower()) not in present]
+
+    def plan_upnp(self, enabled):
+        """
+        UPnP: bool
+        """
+        current = (self.current(Get.LANSETTING) or {}).get('UPnP')
+        if current == (1 if enabled else 2):
+            return []
+        return [Change('upnp', 'set UPnP {}'.format(enabled),
+                       functools.partial(self.dhcp.set_upnp_status, enabled))]
+
+    def plan_mtu(self, mtu_size):
+        """
+        MTU: int
+        """
+        current = (self.current(Get.MTUSIZE) or {}).get('MTUSize')
+        if current == mtu_size:
+            return []
+        return [Change('mtu', 'set MTU {} => {}'.format(current, mtu_size),
+                       functools.partial(self.misc.set_mtu, mtu_size))]
+
+    def plan_remote_access(self, spec):
+        """
+        Remote access: {'enabled', 'port' (default 8443)}
+        """
+        enabled, port = spec['enabled'], spec.get('port', 8443)
+        current = self.current(Get.REMOTEACCESS) or {}
+        if current.get('RemoteAccess') == (1 if enabled else 2) and \
+                (not enabled or current.get('Port') == port):
+            return []
+        return [Change('remote_access',
+                       'set remote access {} (port {})'.format(enabled, port),
+                       functools.partial(self.misc.set_remoteaccess, enabled,
+                                         port))]
+
+    def plan_wifi(self, spec):
+        """
+        WiFi: {'2g': {BandSetting field: value}, '5g': {...}}
+        """
+        if 'bss_coexistence' in spec:
+            # update_wifi_settings does not send it
+            raise ValueError("The BSS coexistence can not be set")
+        settings = self.wifi.wifi_settings
+        changed = []
+
+        for band in ('2g', '5g'):
+            radio = getattr(settings, 'radio_' + band)
+            for attr, value in spec.get(band, {}).items():
+                if attr not in BandSetting._fields or attr == 'radio':
+                    raise ValueError("Unknown wifi setting {!r}".format(attr))
+                if getattr(radio, attr) != value:
+                    setattr(radio, attr, value)
+                    changed.append('{}.{}'.format(band, attr))
+
+        if not changed:
+            return []
+        return [Change('wifi', 'update {}'.format(', '.join(changed)),
+                       functools.partial(self.wifi.update_wifi_settings,
+                                         settings))]
@@ -0,0 +1,271 @@
+"""
+Transparent session recovery with a per-modem circuit breaker.
+
+An expired session shows up as a redirect to the login page. With
+`Compal(..., recovery=SessionRecovery())` getter and setter calls detect
+this and log in again (without a full reconnect). Getters are idempotent
+and replayed once. Setters are not: the first attempt may have been
+applied, so `SessionLostError` is raised after the login.
+
+Some firmware versions answer with an empty body instead. Many getters
+legitimately return nothing (unimplemented functions, `Get.DEFAULTVALUE`),
+so an empty body is only suspicious for the getters in `KNOWN_GETTERS`,
+which always answer with content. The session is then checked with a
+single `Get.CM_SYSTEM_INFO` first: logging in while it is still valid
+would be denied by the modem.
+
+Redirects to the access-denied page (another session holds the modem),
+server errors and the exceptions of a call, e.g. connection errors, count as
+failures of the modem. After `failure_threshold` failures in a row, the
+modem's circuit opens: calls fail fast with `CircuitOpenError` for
+`cooldown` seconds, then a single trial call is let through. Each failed
+trial doubles the cooldown, up to `max_cooldown`. Share one
+`SessionRecovery` between the clients of a process to share the breakers of
+each modem. A pickled copy (e.g. sent to a worker process) starts with
+closed circuits.
+"""
+import logging
+import threading
+import time
+
+from .functions import Get, Set
+from .metrics import ACCESS_DENIED_PAGE, LOGIN_PAGE
+
+LOGGER = logging.getLogger(__name__)
+
+# Getters that always answer with a body while the session is valid
+KNOWN_GETTERS = frozenset([
+    Get.GLOBALSETTINGS, Get.CM_SYSTEM_INFO, Get.STATUS, Get.CMSTATUS,
+    Get.DOWNSTREAM_TABLE, Get.UPSTREAM_TABLE, Get.LANSETTING, Get.FORWARDING,
+    Get.WIRELESSBASIC])
+# Calls that are part of the session handling itself
+SESSION_SETTERS = frozenset([Set.LOGIN, Set.LOGOUT])
+# Function ids of the getters, the calls that can be replayed
+GETTERS = frozenset(value for name, value in vars(Get).items()
+                    if name.isupper())
+
+
+class CircuitOpenError(ValueError):
+    """
+    The modem's circuit is open: it failed repeatedly, calls are refused
+    until the cooldown expires
+    """
+
+
+class SessionLostError(ValueError):
+    """
+    The session was lost during a setter call. The session is recovered,
+    the setter is not replayed: it may have been applied.
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker of one modem
+    """
+    def __init__(self, failure_threshold=3, cooldown=5.0, max_cooldown=300.0,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        self.failures = 0
+        self.cooldown = cooldown
+        # Time until which calls are refused, None while closed
+        self.open_until = None
+        self.trial_running = False
+
+    @property
+    def state(self):
+        """
+        'closed', 'open' or 'half-open'
+        """
+        if self.open_until is None:
+            return 'closed'
+        return 'open' if self.clock() < self.open_until else 'half-open'
+
+    def before(self):
+        """
+        Raise CircuitOpenError unless a call may proceed
+
+        @returns whether the call is the trial of a half-open circuit; end it
+                 with `end_trial`
+        """
+        with self.lock:
+            if self.open_until is None:
+                return False
+            remaining = self.open_until - self.clock()
+            if remaining > 0 or self.trial_running:
+                raise CircuitOpenError("Circuit open, retry in {:.1f}s".format(
+                    max(remaining, 0)))
+            # Half-open: let a single trial call through
+            self.trial_running = True
+            return True
+
+    def end_trial(self):
+        """
+        The trial call is over, whatever its outcome
+        """
+        with self.lock:
+            self.trial_running = False
+
+    def success(self):
+        """
+        Record a successful call; closes the circuit
+        """
+        with self.lock:
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+            self.open_until = None
+            self.trial_running = False
+
+    def failure(self):
+        """
+        Record a failed call; opens the circuit at the threshold
+        """
+        with self.lock:
+            self.failures += 1
+            if self.trial_running:
+                # The trial failed: back off further
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            elif self.failures < self.failure_threshold:
+                return
+            self.trial_running = False
+            self.open_until = self.clock() + self.cooldown
+            LOGGER.warning("Circuit opened for %.1fs after %d failures",
+                           self.cooldown, self.failures)
+
+
+def session_problem(res, fun, setter, stream=False):
+    """
+    What is wrong with the session according to a response: 'expired',
+    'empty' (a known getter without body), 'denied', 'overloaded' or None
+    """
+    if res.status_code in (301, 302, 303, 307):
+        location = res.headers.get('Location', '')
+        if location.endswith(ACCESS_DENIED_PAGE):
+            return 'denied'
+        if location.endswith(LOGIN_PAGE):
+            return 'expired'
+    elif res.status_code >= 500:
+        return 'overloaded'
+    elif not setter and not stream and fun is not None and \
+            int(fun) in KNOWN_GETTERS and not res.content:
+        return 'empty'
+    return None
+
+
+class SessionRecovery(object):
+    """
+    Session recovery for `Compal`, see the module documentation
+    """
+    def __init__(self, failure_threshold=3, cooldown=5.0, max_cooldown=300.0,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.lock = threading.Lock()
+        # router ip => CircuitBreaker
+        self.breakers = {}
+        # Set while a thread logs in again: its login bypasses the breaker
+        self.local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in ('lock', 'breakers', 'local'):
+            del state[attr]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.local = threading.local()
+
+    def breaker(self, router_ip):
+        """
+        The circuit breaker of a modem
+        """
+        with self.lock:
+            breaker = self.breakers.get(router_ip)
+            if breaker is None:
+                breaker = self.breakers[router_ip] = CircuitBreaker(
+                    self.failure_threshold, self.cooldown, self.max_cooldown,
+                    self.clock)
+            return breaker
+
+    def call(self, modem, path, params, **kwargs):
+        """
+        Post a getter/setter call, recovering the session once
+        """
+        if getattr(self.local, 'recovering', False):
+            return modem.post(path, params, **kwargs)
+        breaker = self.breaker(modem.router_ip)
+        trial = breaker.before()
+        try:
+            return self._call(breaker, modem, path, params, kwargs)
+        except SessionLostError:
+            raise
+        except Exception:
+            breaker.failure()
+            raise
+        finally:
+            if trial:
+                breaker.end_trial()
+
+    def _call(self, breaker, modem, path, params, kwargs):
+        """
+        `call` past the breaker; exceptions are recorded by the caller
+        """
+        fun = params.get('fun')
+        setter = path.endswith('setter.xml')
+        stream = kwargs.get('stream', False)
+
+        res = self._post(modem, path, params, kwargs)
+        problem = session_problem(res, fun, setter, stream)
+        if problem is None:
+            breaker.success()
+            return res
+        if problem == 'empty':
+            if self.session_valid(modem):
+                breaker.success()
+                return res
+        elif problem != 'expired' or fun in SESSION_SETTERS:
+            breaker.failure()
+            return res
+
+        LOGGER.info("Session lost at fun=%s, logging in again", fun)
+        self.local.recovering = True
+        try:
+            modem.login()
+        finally:
+            self.local.recovering = False
+
+        if setter or fun is None or int(fun) not in GETTERS:
+            breaker.success()
+            raise SessionLostError(
+                "Session lost at fun={}, not replayed".format(fun))
+        res = self._post(modem, path, params, kwargs)
+        if session_problem(res, fun, setter, stream) is None:
+            breaker.success()
+        else:
+            breaker.failure()
+        return res
+
+    def session_valid(self, modem):
+        """
+        Does the session still answer a cheap getter? Bypasses the cache.
+        """
+        res = self._post(modem, '/xml/getter.xml',
+                         {'fun': Get.CM_SYSTEM_INFO}, {})
+        return res.status_code == 200 and bool(res.content)
+
+    @staticmethod
+    def _post(modem, path, params, kwargs):
+        """
+        Post a copy of `params` (`form_data` consumes 'fun')
+        """
+        return modem.post(path, params.copy(), **kwargs)
@@ -0,0 +1,346 @@
+"""
+Compact archive of FuncScanner results.
+
+All scans go into a single file: every distinct response body is stored
+once, zlib compressed and addressed by its SHA-256, and an index maps each
+scan (e.g. a firmware version or modem) and function id to the status, root
+tag and content hash of the response. Identical payloads across scans are
+stored only once, and comparing scans only needs the index:
+
+    with ScanArchive('scans.archive') as archive:
+        FuncScanner(modem, key=key, ids=[(0, 600)]).scan_to_archive(
+            archive, 'CH7465LG-NCIP-6.12.18.25-2p6-NOSH')
+
+    with ScanArchive('scans.archive') as archive:
+        archive.diff('firmware-a', 'firmware-b')
+        archive.content('firmware-a', 3)
+
+File layout: a header (magic, offset of the last index segment) followed by
+compressed payloads and index segments. `flush`/`close` append a segment
+with only the entries added since the previous one: the offset of the
+previous segment, the new scan labels and root tags, and two fixed-width
+tables sorted by key, digest => payload and (scan, function id) => entry.
+Nothing is rewritten, so an interrupted write leaves the previous index
+intact. Opening an archive only reads the labels and tags; entries and
+payloads are looked up by binary search in the tables through a memory
+map, the newest segment first.
+
+A lookup bisects every segment, so `close` merges them once there are
+`MERGE_SEGMENTS`: the new segment holds all entries and does not point to
+the older ones, which stay in the file unused. `compact` merges them
+explicitly.
+"""
+import bisect
+import collections
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+import zlib
+
+MAGIC = b'CMPSCAN2'
+# magic, offset of the last segment
+HEADER = struct.Struct('<8sQ')
+# previous segment, length of the names, number of blobs and of records
+SEGMENT = struct.Struct('<QIII')
+# digest, offset and length of the compressed payload
+BLOB = struct.Struct('<32sQI')
+# scan, function id, status, root tag, digest, offset and length of the
+# compressed payload
+RECORD = struct.Struct('<IiHI32sQI')
+# Number of segments from which `close` merges them into one
+MERGE_SEGMENTS = 8
+
+Entry = collections.namedtuple('Entry', ['status', 'tag', 'digest'])
+
+
+class Table(object):
+    """
+    Sorted fixed-width table in a memory map, a sequence of tuples for
+    `bisect`
+    """
+    def __init__(self, data, offset, count, layout):
+        self.data = data
+        self.offset = offset
+        self.count = count
+        self.layout = layout
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < self.count:
+            raise IndexError(idx)
+        return self.layout.unpack_from(
+            self.data, self.offset + idx * self.layout.size)
+
+    def find(self, key):
+        """
+        The row starting with `key`, None if there is none
+        """
+        idx = bisect.bisect_left(self, key)
+        if idx < self.count and self[idx][:len(key)] == key:
+            return self[idx]
+        return None
+
+    def rows(self, low, high):
+        """
+        The rows with `low` <= row < `high`
+        """
+        return (self[idx] for idx in range(bisect.bisect_left(self, low),
+                                           bisect.bisect_left(self, high)))
+
+
+class ScanArchive(object):
+    """
+    Append-only archive of scan results, see the module documentation
+    """
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        if not os.path.exists(self.path):
+            with io.open(self.path, 'wb') as f:  # noqa pylint: disable=invalid-name
+                f.write(HEADER.pack(MAGIC, 0))
+        # Open for the lifetime of the archive, see `close`
+        self.file = io.open(self.path, 'r+b')  # noqa pylint: disable=consider-using-with
+
+        # Scan labels and root tags, numbered in the records
+        self.label_names = []
+        self.tag_names = []
+        self.label_ids = {}
+        self.tag_ids = {}
+        # Number of labels and tags in the flushed segments
+        self.flushed_names = (0, 0)
+        # (blob table, record table) of the segments, newest first
+        self.segments = []
+        self.last_segment = 0
+        # Added since the last flush: digest => (offset, length) and
+        # (scan, function id) => record
+        self.new_blobs = {}
+        self.new_records = {}
+        self._map = None
+        self._load_index()
+
+    def _load_index(self):
+        magic, offset = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("{} is not a scan archive".format(self.path))
+        self.last_segment = offset
+        data = self._mapped(0)
+        names = []
+        while offset:
+            previous, names_length, blobs, records = \
+                SEGMENT.unpack_from(data, offset)
+            start = offset + SEGMENT.size
+            names.append(json.loads(zlib.decompress(
+                data[start:start + names_length]).decode()))
+            start += names_length
+            self.segments.append((
+                Table(data, start, blobs, BLOB),
+                Table(data, start + blobs * BLOB.size, records, RECORD)))
+            offset = previous
+
+        for labels, tags in reversed(names):
+            for label in labels:
+                self._name(self.label_names, self.label_ids, label)
+            for tag in tags:
+                self._name(self.tag_names, self.tag_ids, tag)
+        self.flushed_names = (len(self.label_names), len(self.tag_names))
+
+    def _mapped(self, end):
+        """
+        The memory map of the file, remapped if it ends before `end`
+        """
+        if self._map is None or end > len(self._map):
+            self.file.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self.file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            for blobs, records in self.segments:
+                blobs.data = records.data = self._map
+        return self._map
+
+    @staticmethod
+    def _name(names, ids, name):
+        """
+        The number of `name`, added if it is new
+        """
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        return ids[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _blob(self, digest):
+        """
+        (offset, length) of the payload with a raw SHA-256, None if new
+        """
+        if digest in self.new_blobs:
+            return self.new_blobs[digest]
+        for blobs, _ in self.segments:
+            row = blobs.find((digest,))
+            if row is not None:
+                return row[1:]
+        return None
+
+    def _record(self, label, fun):
+        """
+        The newest record of function `fun` in scan `label`
+        """
+        label_id = self.label_ids[label]
+        record = self.new_records.get((label_id, fun))
+        if record is not None:
+            return record
+        for _, records in self.segments:
+            record = records.find((label_id, fun))
+            if record is not None:
+                return record
+        raise KeyError(fun)
+
+    def _entry(self, record):
+        return Entry(record[2], self.tag_names[record[3]],
+                     record[4].hex())
+
+    def add(self, label, fun, status, tag, content):
+        """
+        Record the response to function `fun` in scan `label`
+        """
+        digest = hashlib.sha256(content).digest()
+        blob = self._blob(digest)
+        if blob is None:
+            data = zlib.compress(content)
+            offset = self.file.seek(0, io.SEEK_END)
+            self.file.write(data)
+            blob = self.new_blobs[digest] = (offset, len(data))
+        label_id = self._name(self.label_names, self.label_ids, label)
+        self.new_records[label_id, fun] = (
+            label_id, fun, status,
+            self._name(self.tag_names, self.tag_ids, tag), digest) + blob
+
+    def flush(self, merge=False):
+        """
+        Append a segment with the new entries and point the header to it.
+        With `merge`, the segment holds all entries and replaces the
+        previous segments.
+        """
+        new = bool(self.new_records or self.new_blobs)
+        merge = merge and len(self.segments) + new > 1
+        if not new and not merge:
+            return
+        blobs, records = dict(self.new_blobs), dict(self.new_records)
+        if merge:
+            labels, tags, previous = 0, 0, 0
+            # Newest first: newer records replace older ones
+            for blob_table, record_table in self.segments:
+                for row in blob_table:
+                    blobs.setdefault(row[0], row[1:])
+                for row in record_table:
+                    records.setdefault(row[:2], row)
+        else:
+            (labels, tags), previous = self.flushed_names, self.last_segment
+        names = zlib.compress(json.dumps(
+            [self.label_names[labels:], self.tag_names[tags:]]).encode())
+        blobs = sorted(blobs.items())
+        records = sorted(records.values())
+
+        offset = self.file.seek(0, io.SEEK_END)
+        self.file.write(SEGMENT.pack(previous, len(names),
+                                     len(blobs), len(records)))
+        self.file.write(names)
+        self.file.write(b''.join(BLOB.pack(digest, *blob)
+                                 for digest, blob in blobs))
+        self.file.write(b''.join(RECORD.pack(*record)
+                                 for record in records))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, offset))
+        self.file.flush()
+
+        start = offset + SEGMENT.size + len(names)
+        data = self._mapped(start + len(blobs) * BLOB.size +
+                            len(records) * RECORD.size)
+        if merge:
+            self.segments = []
+        self.segments.insert(0, (
+            Table(data, start, len(blobs), BLOB),
+            Table(data, start + len(blobs) * BLOB.size, len(records),
+                  RECORD)))
+        self.last_segment = offset
+        self.flushed_names = (len(self.label_names), len(self.tag_names))
+        self.new_blobs = {}
+        self.new_records = {}
+
+    def compact(self):
+        """
+        Merge the index segments into one
+        """
+        self.flush(merge=True)
+
+    def close(self):
+        """
+        Write the index, merged if it has `MERGE_SEGMENTS` segments, and
+        close the file
+        """
+        self.flush(merge=len(self.segments) + 1 >= MERGE_SEGMENTS)
+        for blobs, records in self.segments:
+            blobs.data = records.data = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self.file.close()
+
+    def labels(self):
+        """
+        The labels of the scans in the archive
+        """
+        return list(self.label_names)
+
+    def entries(self, label):
+        """
+        Function id => Entry of a scan
+        """
+        label_id = self.label_ids[label]
+        result = {}
+        for _, records in reversed(self.segments):
+            for record in records.rows((label_id,), (label_id + 1,)):
+                result[record[1]] = self._entry(record)
+        for (record_label, fun), record in self.new_records.items():
+            if record_label == label_id:
+                result[fun] = self._entry(record)
+        return result
+
+    def entry(self, label, fun):
+        """
+        The Entry of function `fun` in scan `label`
+        """
+        return self._entry(self._record(label, fun))
+
+    def content(self, label, fun):
+        """
+        The response body of function `fun` in scan `label`
+        """
+        offset, length = self._record(label, fun)[5:]
+        data = self._mapped(offset + length)
+        return zlib.decompress(data[offset:offset + length])
+
+    def diff(self, label_a, label_b):
+        """
+        Function id => (Entry in a, Entry in b) for the functions whose
+        responses differ between two scans; missing entries are None
+        """
+        entries_a, entries_b = self.entries(label_a), self.entries(label_b)
+        result = {}
+        for fun in set(entries_a) | set(entries_b):
+            entry_a, entry_b = entries_a.get(fun), entries_b.get(fun)
+            if entry_a != entry_b:
+                result[fun] = (entry_a, entry_b)
+        return result
@@ -0,0 +1,258 @@
+"""
+Scan a modem for the getter functions it implements.
+
+`FuncScanner` requests function ids one by one and records the root tag of
+every non-empty response. Long sweeps can be checkpointed and resumed, and
+their results written to a `compal.scan_archive.ScanArchive`.
+"""
+import bisect
+import io
+import itertools
+import logging
+import os
+
+from . import Get, _etree, _minidom, port_range
+
+LOGGER = logging.getLogger(__name__)
+
+
+def scan_ids(ids):
+    """
+    Sorted function ids from ints and (start, end) ranges (inclusive)
+    """
+    result = set()
+    for entry in ids:
+        if isinstance(entry, int):
+            result.add(entry)
+        else:
+            start, end = port_range(entry)
+            result.update(range(start, end + 1))
+    return sorted(result)
+
+
+class FuncScanner(object):
+    """
+    Scan the modem for existing function calls.
+
+    `ids` limits the scan to function ids and (start, end) ranges; without
+    it the scan goes on from `pos` until stopped. Ids in `skip` are not
+    requested. With a `checkpoint` path, the progress and the functions
+    found are saved to a JSON file every `checkpoint_every` ids and a new
+    scanner with the same path resumes from there.
+
+    Empty responses are normal for unused ids, but an expired session can
+    look the same. The session is only validated after `validate_after`
+    empty responses in a row; when it turns out to be expired, the scanner
+    logs in again, rescans that run and validates sooner from then on.
+    Redirects and error responses mean an expired session and cause an
+    immediate login.
+    """
+    MAX_VALIDATE_AFTER = 64
+
+    def __init__(self, modem, pos=0, key=None, ids=None, skip=(),
+                 checkpoint=None, checkpoint_every=10, validate_after=8):
+        self.modem = modem
+        self.current_pos = pos
+        self.key = key
+        self.last_login = -1
+        # Responses since the last login
+        self.since_login = 0
+
+        self.ids = scan_ids(ids) if ids is not None else None
+        self.skip = set(scan_ids(skip))
+        self.checkpoint = os.path.expanduser(checkpoint) \
+            if checkpoint else None
+        self.checkpoint_every = checkpoint_every
+        self.validate_after = validate_after
+
+        # function id => root tag of the response
+        self.found = {}
+        if self.checkpoint:
+            self.load_checkpoint()
+        self._sweep = None
+
+    def load_checkpoint(self):
+        """
+        Restore the progress from the checkpoint file, if there is one
+        """
+        # Imported on first use, like lxml and requests
+        import json
+        try:
+            with io.open(self.checkpoint, 'rt', encoding='utf-8') as f:  # noqa pylint: disable=invalid-name
+                state = json.load(f)
+        except (IOError, ValueError):
+            return
+        self.current_pos = max(self.current_pos, state['pos'])
+        self.found.update((int(fun), tag)
+                          for fun, tag in state['found'].items())
+        LOGGER.info("Resuming scan at func=%d, %d functions found",
+                    self.current_pos, len(self.found))
+
+    def save_checkpoint(self, pos=None):
+        """
+        Write the progress to the checkpoint file atomically; resume at
+        `pos` instead of `current_pos` if given
+        """
+        import json
+        import tempfile
+        directory = os.path.dirname(os.path.abspath(self.checkpoint))
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with io.open(tmp_fd, 'wt', encoding='utf-8') as f:  # noqa pylint: disable=invalid-name
+            json.dump({'pos': self.current_pos if pos is None else pos,
+                       'found': self.found}, f)
+        os.replace(tmp_path, self.checkpoint)
+
+    @property
+    def is_valid_session(self):
+        """
+        Is the current sesion valid?
+        """
+        LOGGER.debug("Last login %d", self.last_login)
+        # Bypasses the cache: the modem has to answer
+        res = self.modem.post('/xml/getter.xml', {'fun': Get.CM_SYSTEM_INFO})
+        return res.status_code == 200 and bool(res.content)
+
+    def pending(self):
+        """
+        The ids still to scan, from `current_pos` on
+        """
+        if self.ids is not None:
+            ids = iter(self.ids[bisect.bisect_left(self.ids,
+                                                   self.current_pos):])
+        else:
+            ids = itertools.count(self.current_pos)
+        return (fun for fun in ids if fun not in self.skip)
+
+    def relogin(self, fun):
+        """
+        Login again after the session expired at `fun`
+        """
+        if self.last_login >= 0 and self.since_login == 0:
+            raise ValueError("Session expired again at func={}".format(fun))
+        self.last_login = fun
+        self.since_login = 0
+        self.modem.login(self.key)
+        LOGGER.info("Had to login at index %s", fun)
+
+    @staticmethod
+    def session_expired(res):
+        """
+        Does the response show that the session has expired: a redirect (to
+        the login page), an error or an HTML page?
+        """
+        if res.status_code != 200:
+            return True
+        head = res.content.lstrip()[:9].lower()
+        return head.startswith(b'<!doctype') or head.startswith(b'<html')
+
+    def sweep(self, quiet=False):
+        """
+        Yield (function id, response) for the ids with a non-empty response
+        """
+        pending = self.pending()
+        # Ids with an empty response since the last non-empty one
+        empty = []
+        scanned = 0
+        while True:
+            fun = next(pending, None)
+            if empty and (fun is None or len(empty) >= self.validate_after):
+                if not self.is_valid_session:
+                    # Expired somewhere in this run: scan it again
+                    self.validate_after = max(self.validate_after // 2, 1)
+                    self.relogin(empty[0])
+                    self.current_pos = empty[0]
+                    pending = itertools.chain(
+                        empty, [] if fun is None else [fun], pending)
+                    empty = []
+                    continue
+                if fun is not None:
+                    self.validate_after = min(self.validate_after * 2,
+                                              self.MAX_VALIDATE_AFTER)
+                empty = []
+            if fun is None:
+                break
+
+            if not quiet:
+                LOGGER.info("func=%s", fun)
+            res = self.modem.xml_getter(fun, {})
+            if self.session_expired(res):
+                self.relogin(fun)
+                pending = itertools.chain([fun], pending)
+                continue
+
+            self.current_pos = fun + 1
+            self.since_login += 1
+            scanned += 1
+            if res.content:
+                empty = []
+                self.found[fun] = self.root_tag(res.content)
+            else:
+                empty.append(fun)
+            if self.checkpoint and (res.content or
+                                    scanned % self.checkpoint_every == 0):
+                # Empty responses are rescanned after a restart until the
+                # session has been validated for them
+                self.save_checkpoint(empty[0] if empty else None)
+            if res.content:
+                yield fun, res
+
+        if self.checkpoint:
+            self.save_checkpoint()
+
+    @staticmethod
+    def root_tag(content):
+        """
+        Tag of the root element of a response, None if it is not XML
+        """
+        root = _etree().fromstring(
+            content, parser=_etree().XMLParser(recover=True))
+        return root.tag if root is not None else None
+
+    def scan(self, quiet=False):
+        """
+        Scan the modem for functions and return the next non-empty response
+        """
+        if self._sweep is None:
+            self._sweep = self.sweep(quiet)
+        _, res = next(self._sweep)
+        return res
+
+    def scan_to_file(self):
+        """
+        Scan and write results to `func_i.xml` for all indices
+        """
+        for fun, res in self.sweep():
+            xmlstr = _minidom().parseString(res.content).toprettyxml(
+                indent="   ")
+            with io.open("func_%i.xml" % fun, "wt", encoding="utf-8") as f:  # noqa pylint: disable=invalid-name
+                f.write("===== HEADERS =====\n")
+                f.write(str(res.headers))
+                f.write("\n===== DATA ======\n")
+                f.write(xmlstr)
+
+    def scan_to_archive(self, archive, label):
+        """
+        Scan and record the results as scan `label` of a
+        `compal.scan_archive.ScanArchive`
+        """
+        # Found before an interruption (see `checkpoint`), but the archive
+        # was not flushed
+        recorded = archive.entries(label) \
+            if label in archive.labels() else {}
+        for fun in sorted(set(self.found) - set(recorded)):
+            res = self.modem.xml_getter(fun, {})
+            archive.add(label, fun, res.status_code, self.found[fun],
+                        res.content)
+
+        for fun, res in self.sweep(quiet=True):
+            archive.add(label, fun, res.status_code, self.found[fun],
+                        res.content)
+        archive.flush()
+
+    def enumerate(self):
+        """
+        Enumerate the function calls, outputting id <=> response tag name pairs
+        """
+        for fun, _ in self.sweep(quiet=True):
+            tag = self.found[fun]
+            LOGGER.info("%s = %d", tag.upper() if tag else '(not XML)', fun)
@@ -0,0 +1,330 @@
+"""
+Per-modem request scheduling.
+
+Every POST needs the token from the previous response, so concurrent use of
+one modem session breaks the token chain. The schedulers in this module
+funnel all calls for one modem through a single priority queue:
+ * interactive calls (setters, login) jump ahead of background polls,
+ * identical getters that are still queued are coalesced into one request.
+
+The schedulers expose the same calls as the modem object, so they can be
+passed to `PortForwards`, `WifiSettings`, etc. in place of the modem.
+"""
+import abc
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import queue
+import threading
+
+from enum import Enum
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Priority(Enum):
+    """
+    Scheduling priority, lower values are served first
+    """
+    interactive = 0
+    normal = 1
+    background = 2
+
+
+class _Job(object):
+    """
+    A queued call. A job can be queued more than once when a coalesced
+    duplicate arrives with a higher priority; it only runs once.
+    """
+    __slots__ = ('future', 'func', 'args', 'kwargs', 'key', 'started',
+                 'waiters', 'task')
+
+    def __init__(self, future, func, args, kwargs, key):
+        self.future = future
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.started = False
+        # Callers waiting for the result and the running call (asyncio)
+        self.waiters = 0
+        self.task = None
+
+
+def getter_key(fun, params):
+    """
+    Coalescing key for `xml_getter(fun, params)`, None if the parameters are
+    not hashable
+    """
+    try:
+        return ('getter', fun, frozenset(params.items()))
+    except TypeError:
+        return None
+
+
+class _BaseScheduler(abc.ABC):
+    """
+    Bookkeeping shared by the thread and asyncio schedulers
+    """
+    def __init__(self, modem):
+        self.modem = modem
+        # coalescing key => queued job
+        self.pending = {}
+        self.sequence = itertools.count()
+
+        self.submitted = 0
+        self.coalesced = 0
+
+    def _schedule(self, future_factory, func, args, kwargs, priority, key):
+        """
+        Queue a call, or attach to an identical queued call. Returns the job
+        """
+        self.submitted += 1
+        job = self.pending.get(key) if key is not None else None
+        if job is not None and not job.started and \
+                not job.future.cancelled():
+            self.coalesced += 1
+            LOGGER.debug("Coalesced %s", key)
+        else:
+            job = _Job(future_factory(), func, args, kwargs, key)
+            if key is not None:
+                self.pending[key] = job
+        job.waiters += 1
+        self._put((priority.value, next(self.sequence), job))
+        return job
+
+    def _start(self, job):
+        """
+        Mark the job as started. Returns False if it should be skipped
+        """
+        if job.started:
+            return False
+        job.started = True
+        if job.key is not None and self.pending.get(job.key) is job:
+            del self.pending[job.key]
+        return True
+
+    @abc.abstractmethod
+    def _put(self, item):
+        """
+        Queue a (priority, sequence, job) item
+        """
+
+
+class RequestScheduler(_BaseScheduler):
+    """
+    Serialise the calls of many threads to a single `Compal` session
+    """
+    def __init__(self, modem):
+        super().__init__(modem)
+        self.lock = threading.Lock()
+        self.queue = queue.PriorityQueue()
+        self.worker = threading.Thread(target=self._run,
+                                       name='compal-scheduler', daemon=True)
+        self.worker.start()
+
+    def _put(self, item):
+        self.queue.put(item)
+
+    def _run(self):
+        while True:
+            _, _, job = self.queue.get()
+            if job is None:
+                return
+
+            with self.lock:
+                if not self._start(job):
+                    continue
+            if not job.future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                job.future.set_result(job.func(*job.args, **job.kwargs))
+            except Exception as err:  # pylint: disable=broad-except
+                job.future.set_exception(err)
+
+    def submit(self, func, *args, priority=Priority.normal, key=None,
+               **kwargs):
+        """
+        Queue `func(*args, **kwargs)`, returns a `concurrent.futures.Future`.
+        Calls with the same (not None) `key` are coalesced while queued.
+        """
+        with self.lock:
+            return self._schedule(concurrent.futures.Future, func, args,
+                                  kwargs, priority, key).future
+
+    def close(self):
+        """
+        Stop the worker after the queued calls have been processed
+        """
+        # Sorts after all real priorities
+        self.queue.put((len(Priority), next(self.sequence), None))
+        self.worker.join()
+
+    def xml_getter(self, fun, params, priority=Priority.normal):
+        """
+        Queue a getter call and wait for the response
+        """
+        return self.submit(self.modem.xml_getter, fun, params,
+                           priority=priority,
+                           key=getter_key(fun, params)).result()
+
+    def xml_setter(self, fun, params=None, priority=Priority.interactive):
+        """
+        Queue a setter call and wait for the response
+        """
+        return self.submit(self.modem.xml_setter, fun, params,
+                           priority=priority).result()
+
+    def get(self, path, priority=Priority.normal, **kwargs):
+        """
+        Queue a GET request and wait for the response
+        """
+        return self.submit(self.modem.get, path, priority=priority,
+                           **kwargs).result()
+
+    def post(self, path, _data, priority=Priority.normal, **kwargs):
+        """
+        Queue a POST request and wait for the response
+        """
+        return self.submit(self.modem.post, path, _data, priority=priority,
+                           **kwargs).result()
+
+    def login(self, key=None):
+        """
+        Queue a login and wait for the response
+        """
+        return self.submit(self.modem.login, key,
+                           priority=Priority.interactive).result()
+
+    def logout(self):
+        """
+        Queue a logout and wait for the response
+        """
+        return self.submit(self.modem.logout,
+                           priority=Priority.interactive).result()
+
+
+class AsyncRequestScheduler(_BaseScheduler):
+    """
+    Serialise the calls of many tasks to a single `AsyncCompal` session.
+
+    The worker task is started on the first call, on the running loop.
+    Every caller waits on its own future: cancelling it (e.g. through
+    `asyncio.wait_for`) cancels the call only when no coalesced caller is
+    left waiting for it.
+    """
+    def __init__(self, modem):
+        super().__init__(modem)
+        self.queue = None
+        self.worker = None
+
+    def _put(self, item):
+        if self.worker is None:
+            self.queue = asyncio.PriorityQueue()
+            self.worker = asyncio.ensure_future(self._run())
+        self.queue.put_nowait(item)
+
+    async def _run(self):
+        while True:
+            _, _, job = await self.queue.get()
+            if job is None:
+                return
+            if not self._start(job) or job.future.cancelled():
+                continue
+
+            job.task = asyncio.ensure_future(
+                job.func(*job.args, **job.kwargs))
+            try:
+                # Unlike awaiting the task, waiting does not raise when
+                # the last waiter cancels it
+                await asyncio.wait([job.task])
+            except asyncio.CancelledError:
+                job.task.cancel()
+                raise
+            if job.future.done():
+                continue
+            if job.task.cancelled():
+                job.future.cancel()
+            elif job.task.exception() is not None:
+                job.future.set_exception(job.task.exception())
+            else:
+                job.future.set_result(job.task.result())
+
+    async def _wait(self, job):
+        """
+        Wait for the result of a job; cancels the job with its last waiter
+        """
+        try:
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            job.waiters -= 1
+            if not job.waiters:
+                job.future.cancel()
+                if job.task is not None:
+                    job.task.cancel()
+            raise
+
+    def submit(self, func, *args, priority=Priority.normal, key=None,
+               **kwargs):
+        """
+        Queue the coroutine function call `func(*args, **kwargs)`, returns
+        an `asyncio.Future` of this caller.
+        """
+        job = self._schedule(asyncio.get_event_loop().create_future, func,
+                             args, kwargs, priority, key)
+        return asyncio.ensure_future(self._wait(job))
+
+    async def close(self):
+        """
+        Stop the worker after the queued calls have been processed
+        """
+        if self.worker is not None:
+            self.queue.put_nowait((len(Priority), next(self.sequence), None))
+            await self.worker
+            self.worker = None
+
+    async def xml_getter(self, fun, params, priority=Priority.normal):
+        """
+        Queue a getter call and wait for the response
+        """
+        return await self.submit(self.modem.xml_getter, fun, params,
+                                 priority=priority,
+                                 key=getter_key(fun, params))
+
+    async def xml_setter(self, fun, params=None,
+                         priority=Priority.interactive):
+        """
+        Queue a setter call and wait for the response
+        """
+        return await self.submit(self.modem.xml_setter, fun, params,
+                                 priority=priority)
+
+    async def get(self, path, priority=Priority.normal, **kwargs):
+        """
+        Queue a GET request and wait for the response
+        """
+        return await self.submit(self.modem.get, path, priority=priority,
+                                 **kwargs)
+
+    async def post(self, path, _data, priority=Priority.normal, **kwargs):
+        """
+        Queue a POST request and wait for the response
+        """
+        return await self.submit(self.modem.post, path, _data,
+                                 priority=priority, **kwargs)
+
+    async def login(self, key=None):
+        """
+        Queue a login and wait for the response
+        """
+        return await self.submit(self.modem.login, key,
+                                 priority=Priority.interactive)
+
+    async def logout(self):
+        """
+        Queue a logout and wait for the response
+        """
+        return await self.submit(self.modem.logout,
+                                 priority=Priority.interactive)
@@ -0,0 +1,222 @@
+"""
+Declarative schemas for the getter responses.
+
+A `Schema` lists the fields of a response element: leaves (`Field`),
+repeated child elements (`Rows`) and single child elements (`Nested`). Tags
+are matched case-insensitively (the firmware mixes e.g. `SSID2G` and
+`SSID2g`); the lookup is resolved once per distinct tag and cached, and an
+element is decoded in a single walk over its children.
+
+`SCHEMAS` maps Get function ids to the schema of their response, use
+`decode` to apply it:
+
+    values = decode(Get.CM_SYSTEM_INFO, xml)
+    values['cm_docsis_mode']
+
+Adding a getter only takes a schema definition. Schemas whose tags were not
+checked against a response of a real modem are marked `verified=False`.
+"""
+from .functions import Get
+
+
+def text(value):
+    """
+    The text as-is
+    """
+    return value
+
+
+def integer(value):
+    """
+    Integer value; fails on non-numeric text
+    """
+    return int(value)
+
+
+def int_or_text(value):
+    """
+    Integer value if the text is a number, the text otherwise. Text that
+    does not round-trip (e.g. the key '00998877') is kept as-is.
+    """
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return value
+    return number if str(number) == value else value
+
+
+def flag(value):
+    """
+    '0'/'1' as a bool
+    """
+    return bool(int(value))
+
+
+class Field(object):
+    """
+    A leaf element, decoded with `coerce`
+    """
+    __slots__ = ('name', 'tag', 'coerce')
+
+    def __init__(self, name, tag=None, coerce=text):
+        self.name = name
+        self.tag = tag or name
+        self.coerce = coerce
+
+    def decode(self, element):
+        """
+        Value of the element
+        """
+        if element.text is None:
+            return None
+        return self.coerce(element.text)
+
+
+class Nested(object):
+    """
+    A single child element with its own schema
+    """
+    __slots__ = ('name', 'tag', 'schema')
+
+    def __init__(self, name, schema, tag=None):
+        self.name = name
+        self.tag = tag or name
+        self.schema = schema
+
+    def decode(self, element):
+        """
+        Decoded values of the child element
+        """
+        return self.schema.decode(element)
+
+
+class Rows(Nested):
+    """
+    Repeated child elements, decoded into a list
+    """
+    __slots__ = ()
+
+
+class Schema(object):
+    """
+    The fields of an element. `verified` is False when the tags are not
+    known from a response of a real modem.
+    """
+    def __init__(self, fields, verified=True):
+        self.fields = list(fields)
+        self.verified = verified
+        self.by_tag = {field.tag.lower(): field for field in self.fields}
+        # Exact tag => field, filled as tags are encountered
+        self.resolved = {}
+
+    def field(self, tag):
+        """
+        The field for a tag, None for unknown tags
+        """
+        try:
+            return self.resolved[tag]
+        except KeyError:
+            field = self.resolved[tag] = self.by_tag.get(tag.lower())
+            return field
+
+    def decode(self, element):
+        """
+        Decode the children of `element` into a dict of field name =>
+        value. Missing fields are None, missing rows an empty list.
+        """
+        values = {field.name: [] if isinstance(field, Rows) else None
+                  for field in self.fields}
+        for child in element:
+            # Skip comments and processing instructions
+            if not isinstance(child.tag, str):
+                continue
+            field = self.field(child.tag)
+            if field is None:
+                continue
+            if isinstance(field, Rows):
+                values[field.name].append(field.decode(child))
+            else:
+                values[field.name] = field.decode(child)
+        return values
+
+
+def decode(fun, element):
+    """
+    Decode the response element of getter `fun` with its schema
+    """
+    return SCHEMAS[fun].decode(element)
+
+
+BANDS = ('2g', '5g')
+
+# Per band fields of `Get.WIRELESSBASIC`, suffixed with the band. The SSID
+# and key are free text: '00998877' is a valid key, not the number 998877.
+WIFI_BAND_FIELDS = [
+    ('SSID', text), ('BssEnable', int_or_text), ('BandWidth', int_or_text),
+    ('TransmissionMode', int_or_text), ('MulticastRate', int_or_text),
+    ('HideNetwork', int_or_text), ('PreSharedKey', text),
+    ('TransmissionRate', int_or_text), ('GroupRekeyInterval', int_or_text),
+    ('CurrentChannel', int_or_text), ('SecurityMode', int_or_text),
+    ('WpaAlgorithm', int_or_text),
+]
+
+FORWARDING_RULE = Schema([
+    Field('local_IP'), Field('start_port', coerce=integer),
+    Field('end_port', coerce=integer), Field('start_portIn', coerce=integer),
+    Field('end_portIn', coerce=integer), Field('protocol', coerce=integer),
+    Field('enable', coerce=integer), Field('idd', coerce=integer),
+    Field('id', coerce=integer),
+])
+
+LAN_CLIENT = Schema([
+    Field('interface'), Field('IPv4Addr'), Field('index', coerce=integer),
+    Field('interfaceid', coerce=integer), Field('hostname'),
+    Field('MACAddr'), Field('method', coerce=integer), Field('leaseTime'),
+    Field('speed', coerce=int_or_text),
+])
+
+LOG_ENTRY = Schema([
+    Field('prior'), Field('text'), Field('time'), Field('t', coerce=integer),
+])
+
+SCHEMAS = {
+    Get.GLOBALSETTINGS: Schema([
+        Field('AccessLevel', coerce=integer), Field('SwVersion'),
+        Field('CmProvisionMode'), Field('GwProvisionMode'),
+        Field('OperatorId'), Field('Lang'), Field('ConfigVenderModel'),
+    ]),
+    Get.CM_SYSTEM_INFO: Schema([
+        Field('cm_docsis_mode'), Field('cm_hardware_version'),
+        Field('cm_mac_addr'), Field('cm_serial_number'),
+        Field('cm_system_uptime', coerce=int_or_text),
+        Field('cm_network_access'),
+    ]),
+    Get.FORWARDING: Schema([
+        Field('LanIP'), Field('subnetmask'),
+        Rows('instance', FORWARDING_RULE),
+    ]),
+    Get.WIRELESSBASIC: Schema([
+        Field('Bandmode', coerce=integer), Field('NvCountry', coerce=integer),
+        Field('ChannelRange', coerce=integer),
+        Field('BssCoexistence', coerce=flag),
+    ] + [Field(attr + band, coerce=coerce)
+         for band in BANDS for attr, coerce in WIFI_BAND_FIELDS]),
+    Get.LANUSERTABLE: Schema([
+        Nested('Ethernet', Schema([Rows('clientinfo', LAN_CLIENT)])),
+        Nested('WIFI', Schema([Rows('clientinfo', LAN_CLIENT)])),
+        Field('totalClient', coerce=integer), Field('Customer'),
+    ]),
+    # No responses of these getters were captured: the tags are guessed
+    # from the parameters of their setters (and the emulator serves the same
+    # guesses).
+    Get.LANSETTING: Schema([
+        Field('LanIP'), Field('subnetmask'), Field('UPnP', coerce=integer),
+        Field('DHCP_addr_s'), Field('DHCP_addr_e'),
+    ], verified=False),
+    Get.MTUSIZE: Schema([Field('MTUSize', coerce=integer)], verified=False),
+    Get.REMOTEACCESS: Schema([
+        Field('RemoteAccess', coerce=integer), Field('Port', coerce=integer),
+    ], verified=False),
+    Get.EVENTLOG_TABLE: Schema([Rows('eventlog', LOG_ENTRY)]),
+    Get.FIREWALLLOG_TABLE: Schema([Rows('firewalllog', LOG_ENTRY)]),
+}
@@ -0,0 +1,177 @@
+"""
+Persistent storage of modem sessions.
+
+Short-lived processes (e.g. cron-driven probes) spend most of their time on
+the initial redirect and the login. With a session store, `Compal` resumes
+the session of a previous process: it restores the `SID`, the last
+`sessionToken` and the Referer, validates the session with one getter, and
+only falls back to a full login when that fails.
+
+    store = FileSessionStore('~/.cache/compal-sessions.json')
+    modem = Compal('192.168.178.1', key, session_store=store)
+    modem.login()    # resumes the stored session when it is still valid
+    ...
+    modem.suspend()  # store the session instead of logging out
+
+The stores contain session ids: keep them private.
+"""
+import abc
+import collections
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+StoredSession = collections.namedtuple('StoredSession', [
+    'sid', 'token', 'referer', 'saved'])
+
+
+class SessionStore(abc.ABC):
+    """
+    Base class for session stores, keyed by router ip.
+
+    Sessions older than `max_age` seconds are not resumed; the modem drops
+    idle sessions after a few minutes.
+    """
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+
+    def load(self, router_ip):
+        """
+        The stored session for the router, None if there is no usable one
+        """
+        session = self._load(router_ip)
+        if session is None:
+            return None
+        if self.max_age is not None and \
+                time.time() - session.saved > self.max_age:
+            self.delete(router_ip)
+            return None
+        return session
+
+    def save(self, router_ip, sid, token, referer):
+        """
+        Store the session for the router
+        """
+        self._save(router_ip, StoredSession(sid, token, referer, time.time()))
+
+    @abc.abstractmethod
+    def _load(self, router_ip):
+        """
+        The StoredSession for the router, None if there is none
+        """
+
+    @abc.abstractmethod
+    def _save(self, router_ip, session):
+        """
+        Store a StoredSession for the router
+        """
+
+    @abc.abstractmethod
+    def delete(self, router_ip):
+        """
+        Remove the stored session of the router
+        """
+
+
+class FileSessionStore(SessionStore):
+    """
+    Sessions in a JSON file. Updates hold a lock on `<path>.lock`, so
+    processes can share the file (not on Windows: there is no fcntl, use a
+    SQLiteSessionStore).
+    """
+    def __init__(self, path, max_age=300):
+        super().__init__(max_age)
+        self.path = os.path.expanduser(path)
+
+    def _read(self):
+        try:
+            with io.open(self.path, 'rt', encoding='utf-8') as f:  # noqa pylint: disable=invalid-name
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _write(self, sessions):
+        """
+        Replace the file atomically, readable only by the current user
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with io.open(tmp_fd, 'wt', encoding='utf-8') as f:  # noqa pylint: disable=invalid-name
+            json.dump(sessions, f)
+        os.replace(tmp_path, self.path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Exclusive lock for a read-modify-write of the file
+        """
+        with io.open(self.path + '.lock', 'ab') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            # Closing the file releases the lock
+            yield
+
+    def _load(self, router_ip):
+        session = self._read().get(router_ip)
+        return StoredSession(*session) if session else None
+
+    def _save(self, router_ip, session):
+        with self._locked():
+            sessions = self._read()
+            sessions[router_ip] = list(session)
+            self._write(sessions)
+
+    def delete(self, router_ip):
+        with self._locked():
+            sessions = self._read()
+            if sessions.pop(router_ip, None) is not None:
+                self._write(sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a SQLite table, for stores shared by many processes
+    """
+    def __init__(self, path, max_age=300):
+        super().__init__(max_age)
+        self.path = os.path.expanduser(path)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                         "router_ip TEXT PRIMARY KEY, sid TEXT, token TEXT, "
+                         "referer TEXT, saved REAL)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _load(self, router_ip):
+        with self._connect() as conn:
+            row = conn.execute("SELECT sid, token, referer, saved "
+                               "FROM sessions WHERE router_ip = ?",
+                               (router_ip,)).fetchone()
+        return StoredSession(*row) if row else None
+
+    def _save(self, router_ip, session):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions VALUES "
+                         "(?, ?, ?, ?, ?)", (router_ip,) + tuple(session))
+
+    def delete(self, router_ip):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE router_ip = ?",
+                         (router_ip,))
@@ -0,0 +1,217 @@
+"""
+Multi-function snapshots with a single login.
+
+`Compal.snapshot` logs in once, fetches the requested getters back-to-back
+on the same connection, parses each response with the parser registered for
+the function and logs out:
+
+    snap = modem.snapshot([Get.STATUS, Get.CMSTATUS, Get.LANUSERTABLE])
+    snap[Get.LANUSERTABLE]
+
+Functions without a registered parser are decoded with their schema from
+`compal.schema`, or with `xml_value` when they have none. Register more
+parsers with `register_parser`, e.g. the DOCSIS tables:
+
+    register_parser(Get.UPSTREAM_TABLE, compal.docsis.parse_upstream)
+
+The parsed values are frozen (see `freeze`): records such as `PortForward`
+and `RadioSettings` become namedtuples with the same fields.
+"""
+import collections.abc
+import functools
+import time
+import types
+
+from lxml import etree
+
+from . import PortForwards, WifiSettings, schema
+from .functions import Get
+
+# The modem sometimes returns invalid XML, recover from it.
+PARSER = etree.XMLParser(recover=True)
+
+# Get function id => callable(content) returning the parsed value
+PARSERS = {}
+# recordclass => namedtuple with the same name and fields
+FROZEN_TYPES = {}
+
+
+def register_parser(fun, parser):
+    """
+    Use `parser(content)` to decode the responses of getter `fun`. Responses
+    without content are None, like with the default parsers.
+    """
+    @functools.wraps(parser)
+    def parse(content):
+        """
+        None without content, `parser(content)` otherwise
+        """
+        return parser(content) if content else None
+    PARSERS[fun] = parse
+
+
+def frozen_type(cls):
+    """
+    The namedtuple type for instances of the recordclass `cls`
+    """
+    try:
+        return FROZEN_TYPES[cls]
+    except KeyError:
+        frozen = FROZEN_TYPES[cls] = collections.namedtuple(cls.__name__,
+                                                            cls._fields)
+        return frozen
+
+
+def freeze(value):
+    """
+    Read-only version of a parsed value: records become namedtuples, lists
+    tuples, mappings read-only mappings and arrays read-only arrays
+    """
+    if isinstance(value, collections.abc.Mapping):
+        return types.MappingProxyType(collections.OrderedDict(
+            (key, freeze(item)) for key, item in value.items()))
+    if hasattr(value, '_fields'):
+        cls = type(value) if isinstance(value, tuple) else frozen_type(
+            type(value))
+        return cls(*(freeze(item) for item in value))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if hasattr(value, 'setflags'):
+        # numpy arrays, e.g. of `compal.docsis`
+        value.setflags(write=False)
+    return value
+
+
+def element_value(element):
+    """
+    Convert an element into nested dicts: leaves become their text, repeated
+    child tags become tuples.
+    """
+    children = list(element)
+    if not children:
+        return element.text
+
+    values = collections.OrderedDict()
+    for child in children:
+        value = element_value(child)
+        if child.tag not in values:
+            values[child.tag] = value
+        elif isinstance(values[child.tag], list):
+            values[child.tag].append(value)
+        else:
+            values[child.tag] = [values[child.tag], value]
+
+    return types.MappingProxyType(collections.OrderedDict(
+        (k, tuple(v) if isinstance(v, list) else v)
+        for k, v in values.items()))
+
+
+def xml_value(content):
+    """
+    Default parser: the response's root element as nested read-only dicts
+    """
+    if not content:
+        return None
+    root = etree.fromstring(content, parser=PARSER)
+    return element_value(root) if root is not None else None
+
+
+def schema_value(fun):
+    """
+    Parser decoding the response with the schema of `fun`, `xml_value` if
+    there is no schema for the function
+    """
+    if fun not in schema.SCHEMAS:
+        return xml_value
+
+    def parse(content):
+        """
+        Decode with the schema into a read-only dict
+        """
+        if not content:
+            return None
+        root = etree.fromstring(content, parser=PARSER)
+        if root is None:
+            return None
+        return types.MappingProxyType(schema.decode(fun, root))
+    return parse
+
+
+register_parser(Get.FORWARDING,
+                lambda content: tuple(PortForwards(None).parse_rules(content)))
+register_parser(Get.WIRELESSBASIC, lambda content: WifiSettings.radio_settings(
+    WifiSettings(None).parse_xml(content)))
+
+
+class Snapshot(collections.abc.Mapping):
+    """
+    Immutable set of parsed getter responses, indexed by Get function id.
+    The values are frozen with `freeze`.
+    """
+    __slots__ = ('_router_ip', '_timestamp', '_elapsed', '_values')
+
+    def __init__(self, router_ip, timestamp, elapsed, values):
+        self._router_ip = router_ip
+        self._timestamp = timestamp
+        self._elapsed = elapsed
+        # Set last: the snapshot is immutable from here on
+        self._values = {fun: freeze(value) for fun, value in values}
+
+    def __setattr__(self, name, value):
+        if hasattr(self, '_values'):
+            raise AttributeError("Snapshot is immutable")
+        object.__setattr__(self, name, value)
+
+    @property
+    def router_ip(self):
+        """
+        The modem the snapshot was taken from
+        """
+        return self._router_ip
+
+    @property
+    def timestamp(self):
+        """
+        Time (unix epoch) at which the snapshot was started
+        """
+        return self._timestamp
+
+    @property
+    def elapsed(self):
+        """
+        Time [s] that taking the snapshot took, including login/logout
+        """
+        return self._elapsed
+
+    def __getitem__(self, fun):
+        return self._values[fun]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return 'Snapshot({}, {})'.format(self._router_ip,
+                                         sorted(self._values))
+
+
+def take_snapshot(modem, funs, login=True):
+    """
+    Fetch and parse `funs` from the modem, see `Compal.snapshot`
+    """
+    timestamp, start = time.time(), time.monotonic()
+
+    if login:
+        modem.login()
+    try:
+        contents = [(fun, modem.xml_getter(fun, {}).content) for fun in funs]
+    finally:
+        if login:
+            modem.logout()
+
+    values = ((fun, PARSERS.get(fun, schema_value(fun))(content))
+              for fun, content in contents)
+    return Snapshot(modem.router_ip, timestamp, time.monotonic() - start,
+                    values)
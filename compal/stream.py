@@ -0,0 +1,113 @@
+"""
+Streaming parsing of large table responses.
+
+Busy modems return long event and firewall logs. Instead of buffering the
+whole body and parsing it at once, `TableStream` reads the response in
+chunks into an incremental lxml parser and yields a record as soon as its
+element is complete. Processed elements are cleared, so memory use does not
+grow with the length of the table.
+
+    for event in TableStream(modem).event_log():
+        print(event['time'], event['text'])
+"""
+import contextlib
+
+from lxml import etree
+
+from . import PortForwards
+from .functions import Get
+
+# Get function id => tag of the record elements
+RECORD_TAGS = {
+    Get.EVENTLOG_TABLE: 'eventlog',
+    Get.FIREWALLLOG_TABLE: 'firewalllog',
+    Get.LANUSERTABLE: 'clientinfo',
+    Get.FORWARDING: 'instance',
+}
+
+CHUNK_SIZE = 8192
+
+
+def iter_elements(chunks, tags):
+    """
+    Feed `chunks` of XML to an incremental parser and yield the elements
+    with one of the `tags` once they are complete.
+
+    An element is only valid until the next one is yielded: it is cleared
+    and removed from the tree afterwards.
+    """
+    # The modem sometimes returns invalid XML, recover from it.
+    parser = etree.XMLPullParser(events=('end',), tag=tags, recover=True)
+    for chunk in chunks:
+        parser.feed(chunk)
+        for _, element in parser.read_events():
+            yield element
+            element.clear()
+            # Drop the (cleared) siblings that were processed before
+            parent = element.getparent()
+            while parent is not None and element.getprevious() is not None:
+                del parent[0]
+    parser.close()
+
+
+def element_record(element):
+    """
+    The children of a record element as a dict of tag => text
+    """
+    return {child.tag: child.text for child in element}
+
+
+class TableStream(object):
+    """
+    Stream the records of table getters
+    """
+    def __init__(self, modem, chunk_size=CHUNK_SIZE):
+        self.modem = modem
+        self.chunk_size = chunk_size
+
+    @contextlib.contextmanager
+    def _chunks(self, fun):
+        """
+        The body of the getter's response, in chunks
+        """
+        res = self.modem.xml_getter(fun, {}, stream=True)
+        with contextlib.closing(res):
+            yield res.iter_content(self.chunk_size)
+
+    def records(self, fun):
+        """
+        Yield the records of getter `fun` as dicts
+        """
+        with self._chunks(fun) as chunks:
+            for element in iter_elements(chunks, RECORD_TAGS[fun]):
+                yield element_record(element)
+
+    def event_log(self):
+        """
+        Records of the event log (`Get.EVENTLOG_TABLE`)
+        """
+        return self.records(Get.EVENTLOG_TABLE)
+
+    def firewall_log(self):
+        """
+        Records of the firewall log (`Get.FIREWALLLOG_TABLE`)
+        """
+        return self.records(Get.FIREWALLLOG_TABLE)
+
+    def lan_users(self):
+        """
+        Connected clients (`Get.LANUSERTABLE`)
+        """
+        return self.records(Get.LANUSERTABLE)
+
+    def port_forwards(self):
+        """
+        Port forwarding rules (`Get.FORWARDING`) as PortForward records
+        """
+        router_ip = None
+        with self._chunks(Get.FORWARDING) as chunks:
+            for element in iter_elements(chunks, ('LanIP', 'instance')):
+                if element.tag == 'LanIP':
+                    router_ip = element.text
+                else:
+                    yield PortForwards.rule_from_element(element, router_ip)
@@ -0,0 +1,184 @@
+"""
+Tracing hooks for modem operations.
+
+The client opens spans for the phases of its operations:
+
+    compal.encode     building the ordered form data of a request
+    compal.network    the HTTP round trip
+    compal.parse      XML parsing and record construction (port forwards,
+                      WiFi settings, backup file name)
+
+A tracer is any object with the OpenTelemetry tracer method
+`start_as_current_span(name, attributes=None)` returning a context manager
+that yields a span with `set_attribute(key, value)`. An OpenTelemetry
+tracer can be used as-is, without this package depending on it:
+
+    from opentelemetry import trace
+    modem = Compal(ip, key, tracer=trace.get_tracer('compal'))
+
+or for all clients: `compal.tracing.set_tracer(tracer)`. `RecordingTracer`
+keeps the spans in memory to see where the time goes:
+
+    tracer = RecordingTracer()
+    modem = Compal(ip, key, tracer=tracer)
+    ...
+    tracer.totals()  # {'compal.network': 0.52, 'compal.parse': 0.03, ...}
+
+Without a tracer, spans are a shared no-op object.
+"""
+import collections
+import itertools
+import threading
+import time
+
+
+class _NullSpan(object):
+    """
+    No-op span and context manager
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_attribute(self, key, value):
+        """
+        Ignored
+        """
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullTracer(object):
+    """
+    Tracer that records nothing
+    """
+    def start_as_current_span(self, name, attributes=None):  # noqa pylint: disable=unused-argument
+        """
+        The no-op span
+        """
+        return _NULL_SPAN
+
+
+_TRACER = NullTracer()
+
+
+def set_tracer(tracer):
+    """
+    Tracer of the clients that have none of their own; None disables
+    tracing
+    """
+    global _TRACER  # pylint: disable=global-statement
+    _TRACER = tracer if tracer is not None else NullTracer()
+
+
+def get_tracer(modem=None):
+    """
+    The tracer of `modem`, or the global one
+    """
+    tracer = getattr(modem, 'tracer', None)
+    return tracer if tracer is not None else _TRACER
+
+
+def span(modem, name, attributes=None):
+    """
+    Context manager of a span on the tracer of `modem`
+    """
+    return get_tracer(modem).start_as_current_span(name,
+                                                   attributes=attributes)
+
+
+# `trace_id` is shared by a top-level span and the spans opened inside it
+SpanRecord = collections.namedtuple('SpanRecord', [
+    'name', 'parent', 'start', 'duration', 'attributes', 'trace_id'])
+
+
+class _RecordingSpan(object):
+    """
+    Span of a RecordingTracer
+    """
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.parent = None
+        self.trace_id = None
+        self.start = None
+
+    def set_attribute(self, key, value):
+        """
+        Set an attribute of the span
+        """
+        self.attributes[key] = value
+
+    def __enter__(self):
+        stack = self.tracer.stack()
+        if stack:
+            self.parent = stack[-1].name
+            self.trace_id = stack[-1].trace_id
+        else:
+            self.trace_id = next(self.tracer.trace_ids)
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start
+        self.tracer.stack().pop()
+        self.tracer.record(SpanRecord(self.name, self.parent, self.start,
+                                      duration, self.attributes,
+                                      self.trace_id))
+        return False
+
+
+class RecordingTracer(object):
+    """
+    Tracer keeping the last `max_spans` spans in memory
+    """
+    def __init__(self, max_spans=10000):
+        self.spans = collections.deque(maxlen=max_spans)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.trace_ids = itertools.count(1)
+
+    def stack(self):
+        """
+        The open spans of the current thread
+        """
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def start_as_current_span(self, name, attributes=None):
+        """
+        A span, to be used as a context manager
+        """
+        return _RecordingSpan(self, name, attributes)
+
+    def record(self, record):
+        """
+        Keep a finished span
+        """
+        with self.lock:
+            self.spans.append(record)
+
+    def totals(self):
+        """
+        Span name => total duration [s]
+        """
+        totals = collections.defaultdict(float)
+        with self.lock:
+            for record in self.spans:
+                totals[record.name] += record.duration
+        return dict(totals)
+
+    def clear(self):
+        """
+        Drop the recorded spans
+        """
+        with self.lock:
+            self.spans.clear()
@@ -0,0 +1,278 @@
+"""
+HTTP transports of `Compal`.
+
+`Compal` talks to the modem through a transport with the subset of the
+`requests.Session` interface it uses: `get(url, ...)` and
+`post(url, data=None, ...)` with the `params`, `headers`,
+`allow_redirects`, `timeout` and `stream` arguments, the `cookies` and
+`headers` mappings sent with every request, and `close()`. The default
+transport is a `requests.Session`. A transport lists the exceptions it
+raises when the modem does not answer in time in `timeout_errors`; those
+of `requests` are assumed when it has none.
+
+`HTTPClientTransport` implements the same interface on `http.client`: one
+persistent keep-alive connection per host, form bodies encoded straight to
+bytes and no hooks, adapters or cookie policies in between. The responses
+have the attributes of `requests` responses that the client uses. Its
+errors are raised as `TransportError`, `TransportTimeout` for timeouts;
+like those of `requests`, both derive from OSError. Use it where client
+CPU per request matters, e.g. for a fleet:
+
+    modem = Compal(router_ip, key, transport=HTTPClientTransport())
+
+The session token and SID are handled by `Compal` in the same way for both.
+"""
+import collections
+import http.client
+import socket
+import urllib.parse
+
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
+REDIRECT_CODES = frozenset([301, 302, 303, 307, 308])
+
+# The request of a response, as far as the client uses it
+Request = collections.namedtuple('Request', ['method', 'url', 'body'])
+
+
+class TransportError(OSError):
+    """
+    A request failed: connection or protocol error
+    """
+
+
+class TransportTimeout(TransportError):
+    """
+    The modem did not answer in time
+    """
+
+
+def replayable(method, path, data):
+    """
+    Whether a request can be sent twice without harm: GETs and getter
+    calls, but no uploads
+    """
+    if hasattr(data, 'read'):
+        return False
+    return method == 'GET' or path.partition('?')[0] == '/xml/getter.xml'
+
+
+def transport_error(error):
+    """
+    The TransportError for an error of `http.client` or the socket
+    """
+    if isinstance(error, socket.timeout):
+        return TransportTimeout(str(error) or 'timed out')
+    return TransportError('{}: {}'.format(type(error).__name__, error))
+
+
+class HTTPClientResponse(object):
+    """
+    Response of `HTTPClientTransport`, compatible with the parts of
+    `requests.Response` used by the client
+    """
+    def __init__(self, raw, connection, request, stream=False):
+        self.raw = raw
+        self.connection = connection
+        self.request = request
+        self.url = request.url
+        self.status_code = raw.status
+        self.headers = raw.msg
+        self.cookies = dict(parse_cookie(header) for header
+                            in raw.msg.get_all('Set-Cookie') or ())
+        self._content = None if stream else self._read()
+
+    def _read(self, size=None):
+        """
+        Read (up to `size` bytes of) the body
+        """
+        try:
+            return self.raw.read(size)
+        except (OSError, http.client.HTTPException) as err:
+            self.connection.close()
+            raise transport_error(err) from err
+
+    @property
+    def content(self):
+        """
+        The body, read on first access when streamed
+        """
+        if self._content is None:
+            self._content = self._read()
+        return self._content
+
+    @property
+    def text(self):
+        """
+        The body as text
+        """
+        return self.content.decode('utf-8', 'replace')
+
+    def iter_content(self, chunk_size=1):
+        """
+        The body in chunks of up to `chunk_size` bytes
+        """
+        if self._content is not None:
+            for pos in range(0, len(self._content), chunk_size):
+                yield self._content[pos:pos + chunk_size]
+            return
+        while True:
+            chunk = self._read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        """
+        Release the connection; it is closed if the body was not read
+        """
+        if not self.raw.isclosed():
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def parse_cookie(header):
+    """
+    (name, value) of a Set-Cookie header; attributes are ignored
+    """
+    name, _, value = header.split(';', 1)[0].partition('=')
+    return name.strip(), value.strip()
+
+
+class HTTPClientTransport(object):
+    """
+    Lean transport on `http.client` with keep-alive connections, see the
+    module documentation
+    """
+    timeout_errors = (TransportTimeout,)
+
+    def __init__(self, max_redirects=3):
+        self.max_redirects = max_redirects
+        # Sent with every request
+        self.cookies = {}
+        self.headers = {}
+        # host => (HTTPConnection, last response)
+        self.connections = {}
+
+    def get(self, url, **kwargs):
+        """
+        GET request, following redirects unless `allow_redirects=False`
+        """
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        """
+        POST request; a dict `data` is sent form-encoded
+        """
+        return self.request('POST', url, data=data, **kwargs)
+
+    def close(self):
+        """
+        Close all connections
+        """
+        for connection, _ in self.connections.values():
+            connection.close()
+        self.connections = {}
+
+    def request(self, method, url, params=None, data=None, headers=None,
+                allow_redirects=True, timeout=None, stream=False):
+        """
+        Send a request and follow up to `max_redirects` redirects
+        """
+        if params:
+            url += ('&' if '?' in url else '?') + \
+                urllib.parse.urlencode(params)
+        res = self._send(method, url, data, headers, timeout, stream)
+
+        redirects = 0
+        while allow_redirects and res.status_code in REDIRECT_CODES:
+            if redirects >= self.max_redirects:
+                res.close()
+                raise ValueError("Exceeded {} redirects".format(
+                    self.max_redirects))
+            redirects += 1
+            res.close()
+            url = urllib.parse.urljoin(url, res.headers['Location'])
+            res = self._send('GET', url, None, headers, timeout, stream)
+        return res
+
+    def connection(self, host, timeout):
+        """
+        The keep-alive connection to `host`, whether it was used before
+        """
+        connection, last = self.connections.get(host, (None, None))
+        if connection is None:
+            connection = http.client.HTTPConnection(host, timeout=timeout)
+        elif last is not None and not last.isclosed():
+            # The body of a streamed response was not read: start over
+            connection.close()
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        connection.timeout = timeout
+        return connection, connection.sock is not None
+
+    def _send(self, method, url, data, headers, timeout, stream):
+        host, _, path = url.partition('://')[2].partition('/')
+
+        request_headers = dict(self.headers)
+        if isinstance(data, dict):
+            data = urllib.parse.urlencode(data).encode('utf-8')
+            request_headers['Content-Type'] = FORM_CONTENT_TYPE
+        elif isinstance(data, str):
+            data = data.encode('utf-8')
+        elif hasattr(data, 'read') and hasattr(data, '__len__'):
+            # Sized file-like bodies (e.g. `UploadReader`): no chunked
+            # encoding
+            request_headers['Content-Length'] = str(len(data))
+        if headers:
+            request_headers.update(headers)
+        if self.cookies:
+            request_headers['Cookie'] = '; '.join(
+                '{}={}'.format(name, value)
+                for name, value in self.cookies.items())
+
+        connection, reused = self.connection(host, timeout)
+        try:
+            raw = self._round_trip(connection, reused, method, '/' + path,
+                                   data, request_headers)
+        except (OSError, http.client.HTTPException) as err:
+            # Do not leave a partial response on the connection
+            connection.close()
+            raise transport_error(err) from err
+        self.connections[host] = connection, raw
+
+        res = HTTPClientResponse(raw, connection,
+                                 Request(method, url, data), stream)
+        self.cookies.update(res.cookies)
+        return res
+
+    @staticmethod
+    def _round_trip(connection, reused, method, path, data, headers):
+        """
+        Send the request and read the response head. When the modem closed
+        a reused idle connection before answering, a `replayable` request
+        is sent once more on a new connection. Others are not: the modem
+        may have executed them, `requests` does not retry them either.
+        """
+        retry = reused and replayable(method, path, data)
+        try:
+            connection.request(method, path, data, headers)
+        except (ConnectionResetError, BrokenPipeError):
+            connection.close()
+            if not retry:
+                raise
+            return HTTPClientTransport._round_trip(
+                connection, False, method, path, data, headers)
+        try:
+            return connection.getresponse()
+        except http.client.RemoteDisconnected:
+            # Closed without a byte of the response
+            connection.close()
+            if not retry:
+                raise
+            return HTTPClientTransport._round_trip(
+                connection, False, method, path, data, headers)
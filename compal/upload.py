@@ -0,0 +1,73 @@
+"""
+Streamed configuration uploads.
+
+`open_upload` turns the source of `BackupRestore.restore` (bytes, a path or
+a file object) into an `UploadReader`: a sized file-like object that the
+transports send in chunks with a Content-Length. Files are memory-mapped,
+so a configuration is never copied into memory as a whole.
+"""
+import contextlib
+import io
+import mmap
+import os
+
+
+class UploadReader(object):
+    """
+    File-like view of an upload: read in chunks, with a length so that
+    `requests` sends a Content-Length instead of a chunked body.
+    `progress(sent, total)` is called after every chunk.
+    """
+    def __init__(self, fileobj, size, progress=None):
+        self.fileobj = fileobj
+        self.size = size
+        self.progress = progress
+        self.sent = 0
+
+    def __len__(self):
+        return self.size
+
+    def read(self, size=-1):
+        """
+        The next chunk of the upload
+        """
+        if size is None or size < 0:
+            size = self.size - self.sent
+        chunk = self.fileobj.read(min(size, self.size - self.sent))
+        self.sent += len(chunk)
+        if self.progress is not None:
+            self.progress(self.sent, self.size)
+        return chunk
+
+
+@contextlib.contextmanager
+def open_upload(source, progress=None):
+    """
+    An UploadReader for `source`: a path, a file object or bytes.
+
+    Files are memory-mapped where possible, so the upload is never copied
+    into memory as a whole. Other file objects are read from their current
+    position on.
+    """
+    with contextlib.ExitStack() as stack:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            yield UploadReader(io.BytesIO(source), len(source), progress)
+            return
+
+        if isinstance(source, (str, os.PathLike)):
+            source = stack.enter_context(io.open(source, 'rb'))
+
+        try:
+            fileno = source.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            fileno = None
+
+        position = source.tell()
+        size = source.seek(0, io.SEEK_END) - position
+        source.seek(position)
+        if fileno is not None and size > 0:
+            mapped = stack.enter_context(
+                mmap.mmap(fileno, 0, access=mmap.ACCESS_READ))
+            mapped.seek(position)
+            source = mapped
+        yield UploadReader(source, size, progress)
@@ -0,0 +1,177 @@
+"""
+WiFi settings of both radio bands
+"""
+from collections import OrderedDict
+
+# recordclass is a mutable variation on `collections.NamedTuple
+from recordclass import recordclass
+
+from . import _etree, schema, tracing
+from .functions import Set, Get
+
+RadioSettings = recordclass('RadioSettings', [  # pylint: disable=invalid-name
+    'bss_coexistence', 'radio_2g', 'radio_5g', 'nv_country', 'channel_range'])
+BandSetting = recordclass('BandSetting', [  # pylint: disable=invalid-name
+    'mode', 'ssid', 'bss_enable', 'radio', 'bandwidth', 'tx_mode',
+    'multicast_rate', 'hidden', 'pre_shared_key', 'tx_rate', 're_key',
+    'channel', 'security', 'wpa_algorithm'])
+
+
+class WifiSettings(object):
+    """
+    Configures the WiFi settings
+    """
+
+    def __init__(self, modem):
+        # The modem sometimes returns invalid XML when 'strange' values are
+        # present in the settings. The recovering parser from lxml is used to
+        # handle this.
+        self.parser = _etree().XMLParser(recover=True)
+
+        self.modem = modem
+
+    @property
+    def wifi_settings_xml(self):
+        """
+        Get the current wifi settings as XML
+        """
+        xml_content = self.modem.xml_getter(Get.WIRELESSBASIC, {}).content
+        return self.parse_xml(xml_content)
+
+    def parse_xml(self, content):
+        """
+        Parse the response to `Get.WIRELESSBASIC`
+        """
+        with tracing.span(self.modem, 'compal.parse',
+                          {'compal.function': Get.WIRELESSBASIC}):
+            return _etree().fromstring(content, parser=self.parser)
+
+    @staticmethod
+    def band_setting(xml, band, modem=None):
+        """
+        Get the wifi settings for the given band (2g, 5g). Traced with the
+        tracer of `modem`, the global one without.
+        """
+        return WifiSettings.traced_band(
+            modem, schema.decode(Get.WIRELESSBASIC, xml), band)
+
+    @staticmethod
+    def traced_band(modem, values, band):
+        """
+        `band_from_values` in a parse span on the tracer of `modem`
+        """
+        with tracing.span(modem, 'compal.parse', {
+                'compal.function': Get.WIRELESSBASIC, 'compal.band': band}):
+            return WifiSettings.band_from_values(values, band)
+
+    @staticmethod
+    def band_from_values(values, band):
+        """
+        Get the wifi settings for the given band (2g, 5g) from the decoded
+        `Get.WIRELESSBASIC` response
+        """
+        assert band in ('2g', '5g',)
+        band_number = int(band[0])
+
+        def band_xv(attr):
+            """
+            value for the given band
+            """
+            return values[attr + band]
+
+        def band_text(attr):
+            """
+            free text value for the given band, '' when empty
+            """
+            value = band_xv(attr)
+            return str(value) if value is not None else ''
+
+        return BandSetting(
+            radio=band,
+            mode=bool(values['Bandmode'] & band_number),
+            ssid=band_text('SSID'),
+            bss_enable=bool(band_xv('BssEnable')),
+            bandwidth=band_xv('BandWidth'),
+            tx_mode=band_xv('TransmissionMode'),
+            multicast_rate=band_xv('MulticastRate'),
+            hidden=band_xv('HideNetwork'),
+            pre_shared_key=band_text('PreSharedKey'),
+            tx_rate=band_xv('TransmissionRate'),
+            re_key=band_xv('GroupRekeyInterval'),
+            channel=band_xv('CurrentChannel'),
+            security=band_xv('SecurityMode'),
+            wpa_algorithm=band_xv('WpaAlgorithm')
+        )
+
+    @property
+    def wifi_settings(self):
+        """
+        Read the wifi settings
+        """
+        xml = self.wifi_settings_xml
+        with tracing.span(self.modem, 'compal.parse',
+                          {'compal.function': Get.WIRELESSBASIC}):
+            return WifiSettings.radio_settings(xml, self.modem)
+
+    @staticmethod
+    def radio_settings(xml, modem=None):
+        """
+        Wifi settings for both bands from the `Get.WIRELESSBASIC` XML. The
+        bands are traced with the tracer of `modem`, the global one without.
+        """
+        values = schema.decode(Get.WIRELESSBASIC, xml)
+
+        return RadioSettings(
+            radio_2g=WifiSettings.traced_band(modem, values, '2g'),
+            radio_5g=WifiSettings.traced_band(modem, values, '5g'),
+            nv_country=values['NvCountry'],
+            channel_range=values['ChannelRange'],
+            bss_coexistence=bool(values['BssCoexistence'])
+        )
+
+    def update_wifi_settings(self, settings):
+        """
+        Update the wifi settings
+        """
+        # Create the object.
+        def transform_radio(radio_settings):  # rs = radio_settings
+            """
+            Perpare radio settings object for the request.
+            Returns a OrderedDict with the correct keys for this band
+            """
+            # Create the dict
+            out = OrderedDict([
+                ('BandMode', int(radio_settings.mode)),
+                ('Ssid', radio_settings.ssid),
+                ('Bandwidth', radio_settings.bandwidth),
+                ('TxMode', radio_settings.tx_mode),
+                ('MCastRate', radio_settings.multicast_rate),
+                ('Hiden', int(radio_settings.hidden)),
+                ('PSkey', radio_settings.pre_shared_key),
+                ('Txrate', radio_settings.tx_rate),
+                ('Rekey', radio_settings.re_key),
+                ('Channel', radio_settings.channel),
+                ('Security', radio_settings.security),
+                ('Wpaalg', radio_settings.wpa_algorithm)
+            ])
+
+            # Prefix 'wl', Postfix the band
+            return OrderedDict([('wl{}{}'.format(k, radio_settings.radio), v)
+                                for (k, v) in out.items()])
+
+        # Alternate the two setting lists
+        out_s = []
+
+        for item_2g, item_5g in zip(
+                transform_radio(settings.radio_2g).items(),
+                transform_radio(settings.radio_5g).items()):
+            out_s.append(item_2g)
+            out_s.append(item_5g)
+
+            if item_2g[0] == 'wlHiden5g':
+                out_s.append(('wlCoexistence', settings.bss_coexistence))
+
+        # Join the settings
+        out_settings = OrderedDict(out_s)
+
+        return self.modem.xml_setter(Set.WIFI_SETTINGS, out_settings)
@@ -3,6 +3,7 @@ Provioning my Ziggo modem using the Compal/Ziggo Connect Box [web interface
 wrapper](https://github.com/ties/compal_CH7465LG_py).
 """
 import argparse
+import logging
 import time
 import sys
 import os
@@ -91,4 +92,6 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
+    logging.basicConfig(level=logging.INFO)
+
     modem_setup(args.host, args.password, args.wifi_pw, args.factory_reset)
@@ -6,6 +6,7 @@ The interface is quite permissive with what it accepts. When you use special
 
 """
 import argparse
+import logging
 import pprint
 import os
 import sys
@@ -61,4 +62,6 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
+    logging.basicConfig(level=logging.INFO)
+
     modem_setup(args.host, args.password, args.wifi_pw, args.factory_reset)
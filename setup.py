@@ -4,7 +4,7 @@ from setuptools import setup, find_packages
 REQUIREMENTS = [
     "requests==2.9.1",
     "recordclass==0.4",
-    "lxml==3.6.4",
+    "lxml==4.9.3",
 ]
 
 
@@ -16,11 +16,19 @@ setup(
     description=("Compal CH7465LG/Ziggo Connect Box client"),
     license="MIT",
     keywords="compal CH7465LG connect box cablemodem",
-    packages=find_packages(exclude=['examples', 'tests', 'tests.*']),
+    packages=find_packages(exclude=['examples', 'benchmarks', 'tests',
+                                    'tests.*']),
     classifiers=[
         "Development Status :: 4 - Beta",
         "Topic :: Software Development :: Libraries",
         "License :: OSI Approved :: MIT License",
+        "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
     ],
-    install_requires=REQUIREMENTS
+    # asyncio.run, http.server.ThreadingHTTPServer
+    python_requires='>=3.7',
+    install_requires=REQUIREMENTS,
+    extras_require={
+        'docsis': ['numpy>=1.11'],
+    }
 )
@@ -0,0 +1,37 @@
+"""
+Fixtures running the client against the local modem emulator
+"""
+import pytest
+
+from compal import Compal
+from compal.emulator import ModemEmulator
+from compal.transport import HTTPClientTransport
+
+KEY = 'password'
+
+TRANSPORTS = {
+    'requests': lambda: None,
+    'http': HTTPClientTransport,
+}
+
+
+@pytest.fixture
+def emulator():
+    """
+    A running emulator
+    """
+    with ModemEmulator(key=KEY) as emu:
+        yield emu
+
+
+@pytest.fixture(params=sorted(TRANSPORTS))
+def modem(request, emulator):
+    """
+    A logged in client, once per transport
+    """
+    modem = Compal(emulator.router_ip, KEY,
+                   transport=TRANSPORTS[request.param]())
+    modem.login()
+    yield modem
+    if emulator.state.sid is not None:
+        modem.logout()
@@ -0,0 +1,239 @@
+"""
+asyncio client against the emulator and a misbehaving stub server
+"""
+import asyncio
+import io
+
+import pytest
+
+from compal import Get, Proto
+from compal.aio import (
+    AsyncCompal, AsyncBackupRestore, AsyncPortForwards, AsyncWifiSettings,
+    HTTPConnection)
+from compal.emulator import ModemEmulator
+from compal.upload import UploadReader
+
+from .conftest import KEY
+
+
+class StubServer(object):
+    """
+    HTTP server answering each request with `respond(writer, count)`
+    """
+    def __init__(self, respond):
+        self.respond = respond
+        self.connections = 0
+        self.requests = 0
+        self.server = None
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = [int(line.split(b':')[1]) for line in head.split(
+                    b'\r\n') if line.lower().startswith(b'content-length')]
+                await reader.readexactly(length[0] if length else 0)
+                self.requests += 1
+                if not await self.respond(writer, self.requests):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def response(body):
+    """
+    A complete response with `body`
+    """
+    return (b'HTTP/1.1 200 OK\r\nContent-Length: ' +
+            str(len(body)).encode() + b'\r\n\r\n' + body)
+
+
+def test_login_getter_backup():
+    async def run(emulator):
+        async with AsyncCompal(emulator.router_ip, KEY) as modem:
+            await modem.login()
+            res = await modem.xml_getter(Get.CM_SYSTEM_INFO, {})
+            assert res.status_code == 200 and res.content
+            assert await AsyncBackupRestore(modem).backup() == \
+                emulator.state.config_blob
+            await modem.logout()
+
+    with ModemEmulator(key=KEY) as emulator:
+        asyncio.run(run(emulator))
+        assert emulator.state.rejected == 0
+
+
+def test_rules_wifi_backup():
+    async def run(emulator):
+        async with AsyncCompal(emulator.router_ip, KEY) as modem:
+            await modem.login()
+            rules = await AsyncPortForwards(modem).rules
+            assert [(rule.local_ip, rule.ext_port, rule.proto, rule.enabled)
+                    for rule in rules] == \
+                [('192.168.0.10', (8080, 8081), Proto.tcp, True)]
+
+            settings = await AsyncWifiSettings(modem).wifi_settings
+            assert settings.radio_2g.pre_shared_key == '00998877'
+            assert settings.radio_5g.ssid == '0123'
+
+            backup = AsyncBackupRestore(modem)
+            assert await backup.backup() == emulator.state.config_blob
+            assert await backup.backup('wrong-Cfg.bin') is None
+            await modem.logout()
+
+    with ModemEmulator(key=KEY) as emulator:
+        emulator.state.forwards.append({
+            'local_IP': '192.168.0.10', 'start_port': 8080,
+            'end_port': 8081, 'start_portIn': 80, 'end_portIn': 81,
+            'protocol': 1, 'enable': 1, 'idd': 0,
+            'id': next(emulator.state.forward_ids)})
+        emulator.state.wifi['PreSharedKey2g'] = '00998877'
+        emulator.state.wifi['SSID5g'] = '0123'
+        asyncio.run(run(emulator))
+        assert emulator.state.rejected == 0
+
+
+def test_concurrent_calls():
+    funs = [Get.CM_SYSTEM_INFO, Get.STATUS, Get.CMSTATUS, Get.MULTILANG,
+            Get.GLOBALSETTINGS] * 4
+
+    async def run(emulator):
+        async with AsyncCompal(emulator.router_ip, KEY) as modem:
+            await modem.login()
+            responses = await asyncio.gather(*(
+                modem.xml_getter(fun, {}) for fun in funs))
+            backup = AsyncBackupRestore(modem)
+            configs = await asyncio.gather(*(backup.backup()
+                                             for _ in range(3)))
+            await modem.logout()
+        return responses, configs
+
+    with ModemEmulator(key=KEY, latency=0.01) as emulator:
+        responses, configs = asyncio.run(run(emulator))
+        assert [res.status_code for res in responses] == [200] * len(funs)
+        assert all(res.content for res in responses)
+        assert configs == [emulator.state.config_blob] * 3
+        # Every request carried the token of the previous response
+        assert emulator.state.rejected == 0
+
+
+def test_calls_wait_for_the_connection():
+    sent = []
+
+    async def run(emulator):
+        modem = AsyncCompal(emulator.router_ip, KEY)
+        request = modem.connection.request
+
+        async def record(method, path, body=b'', headers=None):
+            sent.append((method, path))
+            return await request(method, path, body, headers)
+
+        modem.connection.request = record
+        # The login waits until the redirects to the login page are followed
+        connect = asyncio.ensure_future(modem.connect())
+        await asyncio.sleep(0)
+        await asyncio.gather(connect, modem.login())
+        res = await modem.xml_getter(Get.CM_SYSTEM_INFO, {})
+        await modem.logout()
+        modem.close()
+        return res
+
+    with ModemEmulator(key=KEY, latency=0.05) as emulator:
+        assert asyncio.run(run(emulator)).content
+        assert emulator.state.rejected == 0
+    assert sent[:3] == [('GET', '/'), ('GET', '/common_page/login.html'),
+                        ('POST', '/xml/setter.xml')]
+
+
+def test_concurrent_first_calls_connect_once():
+    async def run(emulator):
+        modem = AsyncCompal(emulator.router_ip, KEY)
+        await asyncio.gather(*(modem.ensure_connected() for _ in range(4)))
+        modem.close()
+        return modem
+
+    with ModemEmulator(key=KEY, latency=0.05) as emulator:
+        modem = asyncio.run(run(emulator))
+        assert modem.connected and modem.session_token is not None
+        # '/' and the login page it redirects to
+        assert emulator.state.requests == 2
+
+
+def test_only_async_methods():
+    # No inherited blocking methods that would call coroutines
+    assert not hasattr(AsyncPortForwards, 'update_rules')
+    assert not hasattr(AsyncWifiSettings, 'update_wifi_settings')
+    assert not hasattr(AsyncBackupRestore, 'backup_to')
+
+
+def test_first_installation():
+    async def run(emulator):
+        async with AsyncCompal(emulator.router_ip, KEY) as modem:
+            assert modem.initial_res.url.endswith(
+                'common_page/FirstInstallation.html')
+            assert not emulator.state.first_install
+            await modem.login()
+            assert emulator.state.sid is not None
+
+    with ModemEmulator(key='factory', first_install=True) as emulator:
+        asyncio.run(run(emulator))
+        assert emulator.state.key == KEY
+
+
+def test_timeout_discards_connection():
+    async def respond(writer, count):
+        if count == 1:
+            # Headers and part of the body, then nothing
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nabc')
+        else:
+            writer.write(response(b'second'))
+        await writer.drain()
+        return True
+
+    async def run():
+        server = StubServer(respond)
+        connection = HTTPConnection('127.0.0.1', await server.start())
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(connection.request('GET', '/'), 0.2)
+        # On the old connection, this would wait for the rest of the first
+        # body
+        _, _, content = await asyncio.wait_for(
+            connection.request('GET', '/'), 2)
+        assert content == b'second'
+        assert server.connections == 2
+        connection.close()
+        await server.stop()
+
+    asyncio.run(run())
+
+
+def test_no_retry_of_consumed_upload():
+    async def respond(writer, count):
+        writer.write(response(b'first'))
+        await writer.drain()
+        # Drop the keep-alive connection after the first response
+        return count != 1
+
+    async def run():
+        server = StubServer(respond)
+        connection = HTTPConnection('127.0.0.1', await server.start())
+        await connection.request('GET', '/')
+        await asyncio.sleep(0.1)
+
+        upload = UploadReader(io.BytesIO(b'x' * 1000), 1000, None)
+        with pytest.raises((ConnectionError, asyncio.IncompleteReadError)):
+            await connection.request('POST', '/upload', upload)
+        assert server.requests == 1
+        await server.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,123 @@
+"""
+Content-addressed backup store
+"""
+import os
+import random
+
+import pytest
+
+from compal.backup_store import BackupStore
+
+
+@pytest.fixture
+def store(tmpdir):
+    """
+    An empty store
+    """
+    return BackupStore(str(tmpdir))
+
+
+def blobs(store):
+    """
+    The paths of the stored blobs
+    """
+    root = os.path.join(store.root, 'objects')
+    return sorted(os.path.join(directory, name)
+                  for directory, _, names in os.walk(root) for name in names)
+
+
+def naive_diff(blob_a, blob_b):
+    """
+    The differing byte ranges, one byte at a time
+    """
+    ranges = []
+    for idx in range(max(len(blob_a), len(blob_b))):
+        if blob_a[idx:idx + 1] == blob_b[idx:idx + 1]:
+            continue
+        if ranges and sum(ranges[-1]) == idx:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + 1)
+        else:
+            ranges.append((idx, 1))
+    return ranges
+
+
+def test_dedupe(store):
+    config = bytes(range(256)) * 100
+    first = store.add('192.168.178.1', [config[:1000], config[1000:]])
+    second = store.add('192.168.179.1', [config])
+    assert first.digest == second.digest and first.size == len(config)
+    assert len(blobs(store)) == 1
+
+    with store.open(first.digest) as blob:
+        assert blob.read() == config
+    # No temporary files are left behind
+    store.add('192.168.178.1', [config])
+    assert blobs(store) == [store.object_path(first.digest)]
+
+
+def test_history_per_router(store):
+    records = [store.add(router_ip, [config], filename='Cfg.bin')
+               for router_ip, config in [('192.168.178.1', b'a'),
+                                         ('192.168.179.1', b'x'),
+                                         ('192.168.178.1', b'a'),
+                                         ('192.168.178.1', b'b'),
+                                         ('192.168.178.1', b'a')]]
+
+    history = store.history('192.168.178.1')
+    assert history == [records[0], records[2], records[3], records[4]]
+    assert [record.timestamp for record in history] == \
+        sorted(record.timestamp for record in history)
+    assert store.history('192.168.179.1') == [records[1]]
+    assert store.history('10.0.0.1') == []
+
+    # Each change of the configuration, including back to an earlier one
+    assert store.versions('192.168.178.1') == \
+        [records[0], records[3], records[4]]
+    assert store.modems() == ['192.168.178.1', '192.168.179.1']
+
+
+def test_diff_equal(store):
+    digest, _ = store.put([b'same config'])
+    assert store.diff(digest, digest) == []
+
+    # Different blobs with equal blocks
+    other, _ = store.put([b'same config '])
+    assert store.diff(digest, other, block_size=4) == [(11, 1)]
+
+
+def test_diff(store):
+    rand = random.Random(3)
+    config = bytes(rand.getrandbits(8) for _ in range(5000))
+    changed = bytearray(config)
+    # One byte, a run across a block boundary and a run across a slice
+    changed[10] ^= 1
+    for idx in range(1020, 1030):
+        changed[idx] ^= 0xff
+    for idx in range(2300, 2310, 2):
+        changed[idx] ^= 0xff
+    changed = bytes(changed)
+
+    digest_a, _ = store.put([config])
+    digest_b, _ = store.put([changed])
+    expected = naive_diff(config, changed)
+    assert expected[:2] == [(10, 1), (1020, 10)]
+    assert store.diff(digest_a, digest_b, block_size=1024) == expected
+    assert store.diff(digest_a, digest_b) == expected
+
+
+def test_diff_sizes(store):
+    config = bytes(range(256)) * 20
+    longer = config[:100] + b'\x00' + config[101:] + b'more'
+    digest_a, _ = store.put([config])
+    digest_b, _ = store.put([longer])
+
+    expected = [(100, 1), (len(config), 4)]
+    assert naive_diff(config, longer) == expected
+    for block_size in (64, 1000, len(config)):
+        assert store.diff(digest_a, digest_b, block_size) == expected
+        assert store.diff(digest_b, digest_a, block_size) == expected
+
+    # A size difference at a block boundary merges with the changed tail
+    shorter, _ = store.put([config[:-10] + b'\xff'])
+    assert store.diff(digest_a, shorter, block_size=len(config) - 10) == \
+        naive_diff(config, config[:-10] + b'\xff')
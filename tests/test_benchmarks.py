@@ -0,0 +1,36 @@
+"""
+Smoke test of the benchmark scripts, so that they keep running in CI
+"""
+import os
+import subprocess
+import sys
+
+from benchmarks import bench_client, bench_transport
+
+# Imported on first use only, they dominate the startup of short CLI runs
+LAZY_MODULES = ('requests', 'lxml', 'json', 'tempfile', 'mmap', 'sqlite3',
+                'numpy')
+
+
+def test_bench_client(capsys):
+    results = bench_client.run(iterations=3, latency=0.0, num_forwards=2)
+    assert results and all(timings.samples for timings in results)
+    assert 'calls/s' in capsys.readouterr().out
+
+
+def test_bench_transport(capsys):
+    results, cpu = bench_transport.run(iterations=3, latency=0.0,
+                                       num_forwards=2)
+    assert len(results) == len(cpu) == 6
+    assert 'CPU [us]' in capsys.readouterr().out
+
+
+def test_import_is_lazy():
+    # In a fresh interpreter: the tests import all of these
+    imported = subprocess.check_output([sys.executable, '-c', (
+        'import sys; before = set(sys.modules); import compal; '
+        'print(" ".join(set(sys.modules) - before))')],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ).decode().split()
+    assert not [name for name in imported
+                if name.split('.')[0] in LAZY_MODULES]
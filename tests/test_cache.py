@@ -0,0 +1,109 @@
+"""
+Getter response cache
+"""
+import collections
+
+from compal import Compal, Get, Set
+from compal.cache import ResponseCache
+
+from .conftest import KEY
+
+Response = collections.namedtuple('Response', ['status_code', 'content'])
+
+
+class Clock(object):
+    """
+    Clock advanced by hand
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def cached(cache, router_ip, fun, params=None):
+    """
+    The cached response of a getter, None on a miss
+    """
+    return cache.get(cache.key(router_ip, fun, params or {}))
+
+
+def store(cache, router_ip, fun, content, params=None):
+    """
+    Cache a response to a getter
+    """
+    cache.put(cache.key(router_ip, fun, params or {}),
+              Response(200, content))
+
+
+def test_ttl():
+    clock = Clock()
+    cache = ResponseCache(ttls={Get.MTUSIZE: 5}, clock=clock)
+    store(cache, 'a', Get.MTUSIZE, b'1500')
+    # Not cached at all
+    store(cache, 'a', Get.PING_RESULT, b'result')
+    # Not stored: an expired session
+    cache.put(cache.key('a', Get.LANSETTING, {}), Response(200, b''))
+
+    clock.now = 4.9
+    assert cached(cache, 'a', Get.MTUSIZE).content == b'1500'
+    assert cached(cache, 'a', Get.PING_RESULT) is None
+    assert cached(cache, 'a', Get.LANSETTING) is None
+    clock.now = 5
+    assert cached(cache, 'a', Get.MTUSIZE) is None
+    assert not cache.entries
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2, clock=Clock())
+    store(cache, 'a', Get.MTUSIZE, b'1')
+    store(cache, 'a', Get.LANSETTING, b'2')
+    # Used recently, so it outlives LANSETTING
+    assert cached(cache, 'a', Get.MTUSIZE) is not None
+    store(cache, 'a', Get.REMOTEACCESS, b'3')
+
+    assert cached(cache, 'a', Get.LANSETTING) is None
+    assert cached(cache, 'a', Get.MTUSIZE).content == b'1'
+    assert cached(cache, 'a', Get.REMOTEACCESS).content == b'3'
+
+
+def test_invalidates():
+    cache = ResponseCache(clock=Clock())
+    for router_ip in ('a', 'b'):
+        for fun in (Get.MTUSIZE, Get.LANSETTING, Get.BASICDHCP):
+            store(cache, router_ip, fun, router_ip.encode())
+
+    cache.setter_called('a', Set.UPNP_STATUS)
+    assert cached(cache, 'a', Get.LANSETTING) is None
+    assert cached(cache, 'a', Get.MTUSIZE) is not None
+    # Other modems are not affected
+    assert cached(cache, 'b', Get.LANSETTING).content == b'b'
+
+    cache.setter_called('a', Set.LOGIN)
+    assert cached(cache, 'a', Get.MTUSIZE) is not None
+
+    # Not listed: all responses of the modem
+    cache.setter_called('a', Set.REBOOT)
+    assert cached(cache, 'a', Get.MTUSIZE) is None
+    assert cached(cache, 'a', Get.BASICDHCP) is None
+    assert cached(cache, 'b', Get.BASICDHCP) is not None
+
+
+def test_shared_by_modems(emulator):
+    cache = ResponseCache()
+    modem = Compal(emulator.router_ip, KEY, cache=cache)
+    modem.login()
+    first = modem.xml_getter(Get.MTUSIZE, {})
+    requests = emulator.state.requests
+    assert modem.xml_getter(Get.MTUSIZE, {}) is first
+    assert emulator.state.requests == requests
+
+    # Same cache, another modem: not served the first one's response
+    other = Compal('127.0.0.1:1', KEY, cache=cache, lazy=True)
+    assert cached(cache, other.router_ip, Get.MTUSIZE) is None
+
+    modem.xml_setter(Set.MTU_SIZE, {'MTUSize': 1400})
+    assert b'1400' in modem.xml_getter(Get.MTUSIZE, {}).content
+    modem.logout()
@@ -0,0 +1,88 @@
+"""
+Login, getter, setter, backup and restore flows against the emulator
+"""
+from lxml import etree
+
+from compal import (
+    BackupRestore, Compal, Get, PortForwards, Proto, Set, WifiSettings)
+
+from .conftest import KEY
+
+
+def test_login_logout(emulator):
+    modem = Compal(emulator.router_ip, KEY)
+    assert modem.initial_res.url.endswith('common_page/login.html')
+
+    modem.login()
+    assert emulator.state.sid is not None
+    assert modem.session.cookies.get('SID') == emulator.state.sid
+
+    modem.logout()
+    assert emulator.state.sid is None
+    assert emulator.state.rejected == 0
+
+
+def test_wrong_key(emulator):
+    modem = Compal(emulator.router_ip, 'wrong')
+    try:
+        modem.login()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Login with a wrong key succeeded")
+    assert emulator.state.sid is None
+
+
+def test_getter(modem, emulator):
+    res = modem.xml_getter(Get.CM_SYSTEM_INFO, {})
+    assert res.status_code == 200
+    root = etree.fromstring(res.content)
+    assert root.tag == 'cm_system_info'
+    assert emulator.state.rejected == 0
+
+
+def test_getter_needs_session(emulator):
+    modem = Compal(emulator.router_ip, KEY)
+    res = modem.xml_getter(Get.CM_SYSTEM_INFO, {})
+    assert res.status_code == 302
+    assert res.headers['Location'].endswith('common_page/login.html')
+
+
+def test_port_forward_setters(modem, emulator):
+    forwards = PortForwards(modem)
+    forwards.add_forward('192.168.178.10', 8080, 80, Proto.tcp)
+    forwards.add_forward('192.168.178.11', 8443, 443, Proto.both)
+
+    rules = list(forwards.rules)
+    assert [(rule.local_ip, rule.ext_port, rule.int_port, rule.proto)
+            for rule in rules] == [
+                ('192.168.178.10', (8080, 8080), (80, 80), Proto.tcp),
+                ('192.168.178.11', (8443, 8443), (443, 443), Proto.both)]
+
+    rules[0].delete = True
+    forwards.update_rules(rules)
+    assert [rule.local_ip for rule in forwards.rules] == ['192.168.178.11']
+
+
+def test_wifi_settings(modem):
+    settings = WifiSettings(modem).wifi_settings
+    assert settings.radio_2g.ssid == 'Ziggo2g'
+    assert settings.radio_5g.ssid == 'Ziggo5g'
+
+
+def test_backup_restore(modem, emulator):
+    backup = BackupRestore(modem)
+    config = backup.backup()
+    assert config == emulator.state.config_blob
+
+    restored = config[::-1]
+    res = backup.restore(restored)
+    assert res.status_code == 200
+    assert emulator.state.config_blob == restored
+    # The modem reboots after a restore
+    assert emulator.state.sid is None
+
+
+def test_reboot(modem, emulator):
+    modem.xml_setter(Set.REBOOT, {})
+    assert emulator.state.sid is None
@@ -0,0 +1,102 @@
+"""
+Ring buffers of the channel collector
+"""
+import threading
+import time
+
+import pytest
+
+# compal.collector needs the `docsis` extra
+np = pytest.importorskip('numpy')
+from compal.collector import ChannelCollector  # noqa
+from compal.docsis import DOWNSTREAM_DTYPE, MISSING, UPSTREAM_DTYPE  # noqa
+
+
+def downstream(channels, corrected):
+    table = np.zeros(len(channels), dtype=DOWNSTREAM_DTYPE)
+    table['channel_id'] = channels
+    table['power'] = [float(channel) for channel in channels]
+    table['corrected'] = corrected
+    return table
+
+
+def test_record():
+    collector = ChannelCollector(None, capacity=3, max_channels=2)
+    upstream = np.zeros(0, dtype=UPSTREAM_DTYPE)
+    collector.record(1.0, downstream([5, 6], [10, 20]), upstream)
+    collector.record(2.0, downstream([5, 6], [15, 20]), upstream)
+    # Counter reset on 5, no room for 7, 6 missing
+    collector.record(3.0, downstream([5, 7], [3, 100]), upstream)
+    collector.record(4.0, downstream([5, 6], [4, 25]), upstream)
+
+    timestamps, channels, corrected = collector.series('corrected')
+    assert list(timestamps) == [2.0, 3.0, 4.0]
+    assert list(channels) == [5, 6]
+    assert corrected.tolist() == [[5, 0], [3, MISSING], [1, 5]]
+    _, _, power = collector.series('power')
+    assert power[1, 0] == 5.0
+    assert np.isnan(power[1, 1])
+
+    # A value that was not reported is no reading of zero
+    collector.record(5.0, downstream([5, 6], [MISSING, 30]), upstream)
+    collector.record(6.0, downstream([5, 6], [6, 30]), upstream)
+    _, _, corrected = collector.series('corrected')
+    assert corrected.tolist() == [[1, 5], [MISSING, 5], [2, 0]]
+
+
+def test_missing_counters_are_masked():
+    collector = ChannelCollector(None, capacity=4, max_channels=1)
+    upstream = np.zeros(0, dtype=UPSTREAM_DTYPE)
+    for idx, corrected in enumerate([10, 12, MISSING, 20]):
+        collector.record(float(idx), downstream([5], [corrected]), upstream)
+
+    _, _, corrected = collector.series('corrected')
+    assert corrected[:, 0].tolist() == [10, 2, MISSING, 8]
+    totals = np.ma.masked_equal(corrected, MISSING).cumsum(axis=0)
+    assert totals[-1, 0] == 20
+
+
+def test_missing_channel_id_is_dropped():
+    collector = ChannelCollector(None, capacity=2, max_channels=4)
+    upstream = np.zeros(0, dtype=UPSTREAM_DTYPE)
+    collector.record(1.0, downstream([5, MISSING, 6], [1, 2, 3]), upstream)
+
+    _, channels, corrected = collector.series('corrected')
+    assert channels.tolist() == [5, 6]
+    assert corrected.tolist() == [[1, 3]]
+    # Not taken for channel 255
+    assert collector.downstream.slot_of[255] == collector.downstream.overflow
+
+
+def test_out_of_range_channel_id_is_dropped():
+    collector = ChannelCollector(None, capacity=2, max_channels=4)
+    upstream = np.zeros(0, dtype=UPSTREAM_DTYPE)
+    # 261 and 512 would alias channels 5 and 0
+    collector.record(1.0, downstream([5, 261, 512, 6], [1, 2, 3, 4]),
+                     upstream)
+
+    _, channels, corrected = collector.series('corrected')
+    assert channels.tolist() == [5, 6]
+    assert corrected.tolist() == [[1, 4]]
+    assert collector.downstream.slot_of[0] == collector.downstream.overflow
+
+
+def test_run_skips_missed_ticks():
+    collector = ChannelCollector(None, interval=0.05)
+    stop = threading.Event()
+    times = []
+
+    def sample():
+        times.append(time.monotonic())
+        if len(times) == 1:
+            # Miss a few ticks
+            time.sleep(0.18)
+        elif len(times) == 4:
+            stop.set()
+
+    collector.sample = sample
+    collector.run(stop)
+    gaps = np.diff(times)
+    assert gaps[0] >= 0.18
+    # No burst to catch up
+    assert min(gaps[1:]) > 0.025
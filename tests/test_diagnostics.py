@@ -0,0 +1,210 @@
+"""
+Ping and traceroute parsing and the polling diagnostics runner
+"""
+import collections
+
+from compal.diagnostics import (
+    DiagnosticsRunner, PingReply, parse_ping, parse_traceroute, ping_loss)
+from compal import diagnostics
+
+PING = b'''<Ping_Result><Result>PING 8.8.8.8 (8.8.8.8): 64 data bytes
+72 bytes from 8.8.8.8: seq=0 ttl=117 time=10.500 ms
+72 bytes from 8.8.8.8: seq=2 ttl=117 time=11.250 ms
+{}</Result></Ping_Result>'''
+PING_STATISTICS = b'''
+--- 8.8.8.8 ping statistics ---
+4 packets transmitted, 2 packets received, 50% packet loss
+'''
+
+TRACEROUTE = b'''<Traceroute_Result><Result>traceroute to 1.1.1.1 (1.1.1.1), \
+30 hops max, 32 byte packets
+ 1  10.0.1.1 (10.0.1.1)  2.000 ms  2.100 ms  2.200 ms
+ 2  * * *
+ 3  router.example (10.0.3.1)  6.000 ms *  6.600 ms
+{}</Result></Traceroute_Result>'''
+
+
+def test_parse_ping():
+    result = parse_ping(PING.replace(b'{}', b''), '8.8.8.8', 4)
+    assert result.replies == [PingReply(0, 117, 10.5),
+                              PingReply(2, 117, 11.25)]
+    assert (result.transmitted, result.received, result.done) == \
+        (None, 2, False)
+    assert ping_loss(result) is None
+
+    result = parse_ping(PING.replace(b'{}', PING_STATISTICS), '8.8.8.8', 4)
+    assert (result.transmitted, result.received, result.done) == \
+        (4, 2, True)
+    assert ping_loss(result) == 0.5
+
+    # Not started yet
+    assert parse_ping(b'', '8.8.8.8', 4).replies == []
+
+
+def test_parse_ping_other_target():
+    # The finished output of the previous job
+    stale = PING.replace(b'{}', PING_STATISTICS)
+    result = parse_ping(stale, '8.8.4.4', 4)
+    assert result.target == '8.8.4.4'
+    assert (result.replies, result.transmitted, result.done) == \
+        ([], None, False)
+
+
+def test_parse_traceroute():
+    result = parse_traceroute(TRACEROUTE.replace(b'{}', b''), '1.1.1.1', 30)
+    assert not result.done
+    assert [(hop.hop, hop.host, hop.address) for hop in result.hops] == [
+        (1, '10.0.1.1', '10.0.1.1'), (2, None, None),
+        (3, 'router.example', '10.0.3.1')]
+    assert result.hops[1].rtts == [None] * 3
+    assert result.hops[2].rtts == [6.0, 6.6, None]
+
+    done = TRACEROUTE.replace(b'{}', b' 4  1.1.1.1 (1.1.1.1)  8.000 ms')
+    assert parse_traceroute(done, '1.1.1.1', 30).done
+    # Stopped at the hop limit
+    assert parse_traceroute(TRACEROUTE.replace(b'{}', b''), '1.1.1.1',
+                            3).done
+    # Output of a traceroute to another target
+    assert parse_traceroute(done, '8.8.8.8', 30) == \
+        diagnostics.TracerouteResult('8.8.8.8', [], False)
+
+
+def test_parse_traceroute_hostname():
+    content = TRACEROUTE.replace(
+        b'to 1.1.1.1 (1.1.1.1)', b'to one.one.one.one (1.1.1.1)')
+    assert not parse_traceroute(content.replace(b'{}', b''),
+                                'one.one.one.one', 30).done
+
+    done = content.replace(b'{}', b' 4  1.1.1.1 (1.1.1.1)  8.000 ms')
+    result = parse_traceroute(done, 'one.one.one.one', 30)
+    assert result.done and result.hops[-1].address == '1.1.1.1'
+
+
+def runner(modem):
+    """
+    A runner polling at the speed of the emulator
+    """
+    return DiagnosticsRunner(modem, min_poll=0.01, max_poll=0.2,
+                             interval_seconds=0.01)
+
+
+def test_runner(modem, emulator):
+    with runner(modem) as diag:
+        pings = diag.ping_all(['8.8.8.8', '8.8.4.4'], num_ping=3)
+        trace = diag.traceroute('1.1.1.1', max_hops=10)
+
+        for target, future in zip(['8.8.8.8', '8.8.4.4'], pings):
+            result = future.result(timeout=10)
+            assert result.done and result.target == target
+            assert result.received == 3 and ping_loss(result) == 0
+
+        result = trace.result(timeout=10)
+        assert result.done
+        assert [hop.address for hop in result.hops] == \
+            ['10.0.1.1', '10.0.2.1', None, '1.1.1.1']
+    assert emulator.state.rejected == 0
+
+
+def test_runner_hostname(modem, emulator):
+    emulator.state.hosts['one.one.one.one'] = '1.1.1.1'
+    with runner(modem) as diag:
+        result = diag.traceroute('one.one.one.one', max_hops=10,
+                                 timeout=5).result(timeout=10)
+    assert result.done
+    assert [hop.address for hop in result.hops] == \
+        ['10.0.1.1', '10.0.2.1', None, '1.1.1.1']
+    # Finished without being stopped
+    assert emulator.state.traceroute is not None
+
+
+class StaleDiagnostics(object):
+    """
+    Serves the finished output of the previous ping test until the next
+    one has run for a while
+    """
+    def __init__(self, previous, current):
+        # Read before the start and twice while the modem has not started
+        self.outputs = [previous, previous, previous, current]
+        self.started = []
+
+    def start_pingtest(self, target, *args):
+        self.started.append(target)
+
+    def get_pingtest_result(self):
+        return Response(self.outputs.pop(0))
+
+    def stop_pingtest(self):
+        raise AssertionError("The ping test was stopped")
+
+
+def test_runner_skips_stale_ping():
+    previous = PING.replace(b'{}', PING_STATISTICS)
+    current = previous.replace(b'8.8.8.8', b'8.8.4.4')
+    with runner(None) as diag:
+        diag.diagnostics = StaleDiagnostics(previous, current)
+        result = diag.ping('8.8.4.4', num_ping=4).result(timeout=10)
+    assert diag.diagnostics.outputs == []
+    assert result.target == '8.8.4.4' and result.done
+    assert (result.transmitted, result.received) == (4, 2)
+
+
+def test_runner_skips_stale_ping_of_same_target():
+    previous = PING.replace(b'{}', PING_STATISTICS)
+    current = previous.replace(b'time=10.500', b'time=20.000')
+    with runner(None) as diag:
+        diag.diagnostics = StaleDiagnostics(previous, current)
+        result = diag.ping('8.8.8.8', num_ping=4).result(timeout=10)
+    assert diag.diagnostics.outputs == []
+    assert result.replies[0].rtt == 20.0 and result.done
+
+
+def test_parse_ping_stale():
+    previous = PING.replace(b'{}', PING_STATISTICS)
+    stale = diagnostics.result_text(previous)
+    assert parse_ping(previous, '8.8.8.8', 4, stale) == \
+        diagnostics.PingResult('8.8.8.8', [], None, 0, False)
+    # The new test started
+    assert parse_ping(PING.replace(b'{}', b''), '8.8.8.8', 4,
+                      stale).received == 2
+
+
+def test_runner_timeout(modem, emulator):
+    # A ping every 10 s
+    emulator.state.diag_scale = 1
+    with runner(modem) as diag:
+        result = diag.ping('8.8.8.8', num_ping=3, timeout=0.3).result(
+            timeout=10)
+    assert not result.done and result.received < 3
+    # The ping test was stopped
+    assert emulator.state.ping is None
+
+
+Response = collections.namedtuple('Response', ['content'])
+Result = collections.namedtuple('Result', ['target', 'items', 'done'])
+
+
+def test_poll_backoff(monkeypatch):
+    clock = [0.0]
+    delays = []
+
+    def sleep(delay):
+        delays.append(delay)
+        clock[0] += delay
+
+    monkeypatch.setattr(diagnostics.time, 'sleep', sleep)
+    monkeypatch.setattr(diagnostics.time, 'monotonic', lambda: clock[0])
+
+    # One item after 1 s, then nothing
+    def fetch():
+        return Response(1 if clock[0] >= 1 else 0)
+
+    stopped = []
+    with DiagnosticsRunner(None, min_poll=0.5, max_poll=4, backoff=2) as diag:
+        result = diag._poll(  # pylint: disable=protected-access
+            fetch, lambda content: Result('host', content, False),
+            lambda result: result.items, 3, 1, 10, lambda: stopped.append(1))
+
+    assert not result.done and stopped == [1]
+    # The first item came after 1 s: 2 more are due in 2 s. Then the polls
+    # back off up to `max_poll`, the last one right after the timeout.
+    assert delays == [1, 2, 4, 3.5]
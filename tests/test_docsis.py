@@ -0,0 +1,164 @@
+"""
+DOCSIS table parsers
+"""
+import pytest
+
+from compal import Compal
+
+from .conftest import KEY
+
+# compal.docsis needs the `docsis` extra
+np = pytest.importorskip('numpy')
+from compal.docsis import (MISSING, DocsisTables, parse_downstream,  # noqa
+                           parse_signal, parse_upstream)
+
+DOWNSTREAM = b"""<downstream_table><ds_num>2</ds_num>
+<downstream><freq>114000000</freq><pow>3</pow><snr>38</snr><mod>256qam</mod>
+<chid>1</chid><RxMER>38.500</RxMER><PreRs>10</PreRs><PostRs>1</PostRs>
+<IsQamLocked>1</IsQamLocked></downstream>
+<downstream><freq>122000000</freq><pow></pow><mod>256qam</mod>
+<chid>2</chid><RxMER>39.500</RxMER><PreRs>20</PreRs>
+<IsQamLocked>1</IsQamLocked></downstream>
+</downstream_table>"""
+
+SIGNAL = b"""<signal_table><sig_num>1</sig_num>
+<signal><unerrored>100</unerrored><correctable>0</correctable>
+<uncorrectable>0</uncorrectable></signal>
+</signal_table>"""
+
+
+def downstream_table(*chids):
+    """
+    A downstream table response with a channel per id, None leaves the
+    channel id out
+    """
+    return '<downstream_table>{}</downstream_table>'.format(''.join(
+        '<downstream><freq>{}</freq><pow>{}</pow>{}</downstream>'.format(
+            100000000 + pos, pos,
+            '' if chid is None else '<chid>{}</chid>'.format(chid))
+        for pos, chid in enumerate(chids))).encode()
+
+
+def signal_table(*unerrored):
+    """
+    A signal table response with a channel per unerrored count
+    """
+    return '<signal_table>{}</signal_table>'.format(''.join(
+        '<signal><unerrored>{}</unerrored><correctable>{}</correctable>'
+        '<uncorrectable>0</uncorrectable></signal>'.format(count, pos)
+        for pos, count in enumerate(unerrored))).encode()
+
+
+def test_missing_values():
+    table = parse_downstream(DOWNSTREAM, SIGNAL)
+    assert table['power'][0] == 3.0
+    assert np.isnan(table['power'][1])
+    assert np.isnan(table['snr'][1])
+    assert table['post_rs'].tolist() == [1, MISSING]
+    # The signal table only reports the first channel
+    assert table['unerrored'].tolist() == [100, MISSING]
+    assert table['corrected'].tolist() == [0, MISSING]
+
+
+def test_emulator_tables(emulator):
+    modem = Compal(emulator.router_ip, KEY)
+    modem.login()
+    tables = DocsisTables(modem)
+    downstream = tables.downstream
+    assert len(downstream) == emulator.state.num_downstream
+    assert not np.isnan(downstream['power']).any()
+    assert (downstream['unerrored'] != MISSING).all()
+    assert len(tables.upstream) == emulator.state.num_upstream
+    modem.logout()
+
+
+def test_batch():
+    contents = [DOWNSTREAM, None, b'', downstream_table(5, None, 7)]
+    table = parse_downstream(contents)
+    assert table['modem'].tolist() == [0, 0, 3, 3, 3]
+    assert table['channel_id'].tolist() == [1, 2, 5, MISSING, 7]
+    assert table['frequency'].tolist() == [114000000, 122000000, 100000000,
+                                           100000001, 100000002]
+    # The missing values of each response end up in its own rows
+    assert np.isnan(table['power']).tolist() == [False, True, False, False,
+                                                 False]
+    assert table['post_rs'].tolist() == [1] + [MISSING] * 4
+
+    # The same rows as parsing the responses one by one
+    for idx, content in enumerate(contents):
+        single = parse_downstream(content)
+        rows = table[table['modem'] == idx]
+        assert len(rows) == len(single)
+        for column in ('channel_id', 'frequency', 'locked', 'modulation'):
+            assert rows[column].tolist() == single[column].tolist()
+
+
+def test_batch_integers_as_floats():
+    upstream = [b'<upstream_table><upstream><usid>1</usid>'
+                b'<t1Timeouts>1.000</t1Timeouts></upstream></upstream_table>',
+                b'<upstream_table><upstream><usid>2</usid>'
+                b'<t1Timeouts>3</t1Timeouts></upstream>'
+                b'<upstream><usid>3</usid></upstream></upstream_table>']
+    table = parse_upstream(upstream)
+    assert table['modem'].tolist() == [0, 1, 1]
+    assert table['t1_timeouts'].tolist() == [1, 3, MISSING]
+    assert table['t2_timeouts'].tolist() == [MISSING] * 3
+
+
+def test_long_text_values(caplog):
+    upstream = (b'<upstream_table><upstream><usid>1</usid>'
+                b'<mod>256QAM/OFDMA</mod>'
+                b'<channeltype>ATDMA+SCDMA</channeltype></upstream>'
+                b'<upstream><usid>2</usid><mod>64qam</mod>'
+                b'<channeltype>ATDMA</channeltype></upstream>'
+                b'</upstream_table>')
+    table = parse_upstream(upstream)
+    assert table['modulation'].tolist() == ['256QAM/OFDMA', '64qam']
+    assert table['channel_type'].tolist() == ['ATDMA+SCDMA', 'ATDMA']
+    assert not caplog.records
+
+    table = parse_downstream(downstream_table(1).replace(
+        b'</downstream>', b'<mod>' + b'x' * 20 + b'</mod></downstream>'))
+    assert table['modulation'].tolist() == ['x' * 16]
+    assert 'modulation' in caplog.text
+
+
+def test_batch_empty():
+    assert len(parse_downstream([None, b''])) == 0
+    assert len(parse_downstream([], [signal_table(1)])) == 0
+
+
+def test_signal_positions():
+    signal = parse_signal([signal_table(10, 11), None, signal_table(30)])
+    assert signal['modem'].tolist() == [0, 0, 2]
+    assert signal['channel'].tolist() == [0, 1, 0]
+
+
+def test_signal_merge():
+    # Channel ids are neither sorted nor complete, the signal table is
+    # matched by the position of the channel within its modem's table
+    downstream = [downstream_table(9, 3, None),
+                  downstream_table(4),
+                  downstream_table(1, 2),
+                  downstream_table(6, 8)]
+    signal = [signal_table(100, 101, 102),
+              None,
+              # More channels than the downstream table
+              signal_table(300, 301, 302),
+              # Fewer channels than the downstream table
+              signal_table(400)]
+    table = parse_downstream(downstream, signal)
+    assert table['modem'].tolist() == [0, 0, 0, 1, 2, 2, 3, 3]
+    assert table['channel_id'].tolist() == [9, 3, MISSING, 4, 1, 2, 6, 8]
+    assert table['unerrored'].tolist() == [100, 101, 102, MISSING, 300, 301,
+                                           400, MISSING]
+    assert table['corrected'].tolist() == [0, 1, 2, MISSING, 0, 1, 0,
+                                           MISSING]
+
+    # Responses missing from the end of the signal batch
+    table = parse_downstream(downstream, signal[:1])
+    assert table['unerrored'].tolist() == [100, 101, 102] + [MISSING] * 5
+
+    # No signal rows at all
+    table = parse_downstream(downstream, [None, b''])
+    assert (table['unerrored'] == MISSING).all()
@@ -0,0 +1,185 @@
+"""
+Fleet jobs against the emulator
+"""
+import collections
+import concurrent.futures
+import pickle
+import threading
+import time
+
+from compal import Get, Proto
+from compal.backup_store import BackupStore
+from compal.emulator import ModemEmulator
+from compal.fleet import (
+    BackupJob, Fleet, PortForwardJob, StoreBackupJob, Target, run_job)
+from compal.recovery import SessionRecovery
+
+from .conftest import KEY
+
+
+class ThreadFleet(Fleet):
+    """
+    Fleet on a thread pool, the emulator runs in the test process
+    """
+    def executor(self):
+        return concurrent.futures.ThreadPoolExecutor(self.max_workers)
+
+
+def defaultvalue_job(modem):
+    """
+    A getter without content on the emulator
+    """
+    return modem.xml_getter(Get.DEFAULTVALUE, {}).content
+
+
+def test_job_repr(tmpdir):
+    assert repr(BackupJob(str(tmpdir))) == 'BackupJob({!r})'.format(
+        str(tmpdir))
+    assert repr(StoreBackupJob(str(tmpdir))) == \
+        'StoreBackupJob({!r})'.format(str(tmpdir))
+    assert repr(PortForwardJob([])) == 'PortForwardJob(0 forwards)'
+
+
+def round_trip(obj):
+    """
+    `obj` after pickling, as sent to a worker process
+    """
+    return pickle.loads(pickle.dumps(obj))
+
+
+def test_jobs_pickle(tmpdir):
+    forwards = [('192.168.178.10', 8080, 80, Proto.tcp),
+                ('192.168.178.11', (9000, 9010), (9000, 9010), Proto.both)]
+    job = round_trip(PortForwardJob(forwards, delete_existing=True))
+    assert job.forwards == forwards and job.delete_existing
+
+    assert round_trip(BackupJob(str(tmpdir))).directory == str(tmpdir)
+    assert round_trip(StoreBackupJob(str(tmpdir))).root == str(tmpdir)
+
+
+def test_recovery_pickles_with_closed_circuits():
+    recovery = SessionRecovery(failure_threshold=1, cooldown=60)
+    recovery.breaker('192.168.178.1').failure()
+    assert recovery.breaker('192.168.178.1').state == 'open'
+
+    copy = round_trip(recovery)
+    assert (copy.failure_threshold, copy.cooldown) == (1, 60)
+    assert copy.breaker('192.168.178.1').state == 'closed'
+
+
+def test_run_job_uses_recovery(emulator):
+    recovery = SessionRecovery()
+    value, error = run_job(lambda modem: modem.recovery,
+                           Target(emulator.router_ip, KEY), 10, recovery)
+    assert error is None and value is recovery
+
+
+def test_process_pool(emulator, tmpdir):
+    # The workers connect to the emulator of the test process
+    fleet = Fleet([(emulator.router_ip, KEY)], max_workers=2)
+    results = list(fleet.run(PortForwardJob([
+        ('192.168.178.10', 8080, 80, Proto.tcp),
+        ('192.168.178.11', 8443, 443, Proto.both)])))
+    assert [(result.value, result.error) for result in results] == \
+        [(2, None)]
+    assert [rule['local_IP'] for rule in emulator.state.forwards] == \
+        ['192.168.178.10', '192.168.178.11']
+
+    results = list(fleet.run(StoreBackupJob(str(tmpdir))))
+    assert results[0].error is None
+    with BackupStore(str(tmpdir)).open(results[0].value.digest) as config:
+        assert config.read() == emulator.state.config_blob
+    assert emulator.state.sid is None and emulator.state.rejected == 0
+
+
+def test_store_backup_job(emulator, tmpdir):
+    fleet = ThreadFleet([(emulator.router_ip, KEY)], max_workers=1)
+    results = list(fleet.run(StoreBackupJob(str(tmpdir))))
+    assert [result.error for result in results] == [None]
+
+    store = BackupStore(str(tmpdir))
+    with store.open(results[0].value.digest) as config:
+        assert config.read() == emulator.state.config_blob
+    assert emulator.state.sid is None
+
+
+def test_empty_getter_job(emulator):
+    fleet = ThreadFleet([(emulator.router_ip, KEY)], max_workers=1)
+    results = list(fleet.run(defaultvalue_job))
+    assert [(result.value, result.error) for result in results] == \
+        [(b'', None)]
+
+
+def system_info_job(modem):
+    """
+    The status code of a getter
+    """
+    return modem.xml_getter(Get.CM_SYSTEM_INFO, {}).status_code
+
+
+class FailingJob(object):
+    """
+    Fails on one host only
+    """
+    def __init__(self, router_ip):
+        self.router_ip = router_ip
+
+    def __call__(self, modem):
+        if modem.router_ip == self.router_ip:
+            raise RuntimeError("job failed")
+        return system_info_job(modem)
+
+
+def test_failing_hosts_are_isolated(emulator):
+    with ModemEmulator(key=KEY) as failing:
+        fleet = ThreadFleet([
+            (emulator.router_ip, KEY),
+            # Wrong key, unreachable, failing job
+            (emulator.router_ip.split(':')[0] + ':1', KEY),
+            (failing.router_ip, 'wrong'),
+            (failing.router_ip, KEY),
+        ], max_workers=4, timeout=1)
+        results = list(fleet.run(FailingJob(failing.router_ip)))
+
+    errors = collections.Counter(type(result.error).__name__
+                                 for result in results)
+    assert len(results) == 4 and errors['NoneType'] == 1
+    assert errors['ValueError'] == 1 and errors['RuntimeError'] == 1
+    assert [result.value for result in results if result.error is None] \
+        == [200]
+    # Logged out after the failing job
+    assert failing.state.sid is None and emulator.state.sid is None
+
+
+class ConcurrencyJob(object):
+    """
+    Records the maximum number of jobs running at once per host
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = collections.Counter()
+        self.max_running = collections.Counter()
+
+    def __call__(self, modem):
+        with self.lock:
+            self.running[modem.router_ip] += 1
+            self.max_running[modem.router_ip] = max(
+                self.max_running[modem.router_ip],
+                self.running[modem.router_ip])
+        time.sleep(0.1)
+        with self.lock:
+            self.running[modem.router_ip] -= 1
+        return system_info_job(modem)
+
+
+def test_jobs_per_host_are_serialized(emulator):
+    with ModemEmulator(key=KEY) as other:
+        fleet = ThreadFleet([(emulator.router_ip, KEY)] * 3 +
+                            [(other.router_ip, KEY)] * 2, max_workers=5)
+        job = ConcurrencyJob()
+        results = list(fleet.run(job))
+
+    assert [result.value for result in results] == [200] * 5
+    # One session per modem at a time, the modems in parallel
+    assert job.max_running == {emulator.router_ip: 1, other.router_ip: 1}
+    assert emulator.state.rejected == 0 and other.state.rejected == 0
@@ -0,0 +1,199 @@
+"""
+Indexed port forwarding tables and plans
+"""
+import random
+
+import pytest
+
+from compal import PortForward, PortForwards, Proto, Set
+from compal.forwarding import IntervalIndex, PortForwardTable
+
+
+def rule(local_ip, ext_port, int_port, proto=Proto.tcp, enabled=True,
+         rule_id=None):
+    """
+    A PortForward, with an id when it is on the modem
+    """
+    return PortForward(local_ip, ext_port, int_port, proto, enabled,
+                       id=rule_id)
+
+
+def test_interval_index_matches_scan():
+    rand = random.Random(7)
+    intervals = []
+    for idx in range(200):
+        start = rand.randint(0, 1000)
+        intervals.append(((start, start + rand.randint(0, 50)), idx))
+    index = IntervalIndex(intervals)
+
+    for _ in range(200):
+        start = rand.randint(0, 1100)
+        end = start + rand.randint(0, 20)
+        expected = sorted(value for (low, high), value in intervals
+                          if low <= end and high >= start)
+        assert sorted(index.overlapping(start, end)) == expected
+        assert index.overlaps(start, end) == bool(expected)
+
+    assert not IntervalIndex([]).overlaps(0, 10)
+
+
+def test_conflicts():
+    web = rule('192.168.0.10', (8080, 8090), 80)
+    dns = rule('192.168.0.11', 53, 53, Proto.udp)
+    table = PortForwardTable([web, dns])
+
+    assert table.is_forwarded(8085, Proto.tcp)
+    assert not table.is_forwarded(8085, Proto.udp)
+    assert table.is_forwarded(53) and not table.is_forwarded(53, Proto.tcp)
+
+    # External overlap, on any host
+    assert table.conflicts(rule('192.168.0.12', 8090, 22)) == [web]
+    # Internal overlap on the same host only
+    assert table.conflicts(rule('192.168.0.10', 9000, 80)) == [web]
+    assert table.conflicts(rule('192.168.0.12', 9000, 80)) == []
+    # Different transport
+    assert table.conflicts(rule('192.168.0.12', 8080, 80, Proto.udp)) == []
+    assert table.conflicts(rule('192.168.0.12', 53, 53, Proto.both)) == [dns]
+    # A rule does not conflict with itself
+    assert table.conflicts(web) == []
+
+
+def test_plan_does_not_change_the_table():
+    keep = rule('192.168.0.10', 8080, 80, rule_id=1)
+    toggle = rule('192.168.0.10', 8443, 443, rule_id=2)
+    drop = rule('192.168.0.11', 22, 22, rule_id=3)
+    table = PortForwardTable([keep, toggle, drop])
+
+    plan = table.plan([
+        rule('192.168.0.10', 8080, 80),
+        rule('192.168.0.10', 8443, 443, enabled=False),
+        rule('192.168.0.12', 2222, 22),
+    ])
+
+    assert [(r.local_ip, r.ext_port) for r in plan.add] == \
+        [('192.168.0.12', (2222, 2222))]
+    assert [(r.id, r.delete) for r in plan.delete] == [(3, True)]
+    assert [(r.id, r.enabled) for r in plan.toggle] == [(2, False)]
+    assert not drop.delete and toggle.enabled
+
+
+def test_conflicting_plan():
+    existing = rule('192.168.0.10', 8080, 80, rule_id=1)
+    table = PortForwardTable([existing])
+
+    with pytest.raises(ValueError):
+        table.plan([rule('192.168.0.10', 8080, 80, enabled=False),
+                    rule('192.168.0.11', (8000, 8100), 8000)])
+    # The failed plan left the rules alone
+    assert existing.enabled and not existing.delete
+
+    # Replacing a rule is no conflict: the old one is deleted
+    plan = table.plan([rule('192.168.0.11', 8080, 80)])
+    assert [r.id for r in plan.delete] == [1]
+    assert not existing.delete
+
+
+def port_forwarding_calls(emulator, accept=lambda values: True):
+    """
+    Record the `Set.PORT_FORWARDING` calls to the emulator; calls for which
+    `accept(values)` is false are answered but ignored
+    """
+    calls = []
+    handler = emulator.setters[Set.PORT_FORWARDING]
+
+    def record(params):
+        values = dict(params)
+        calls.append(values)
+        if accept(values):
+            return handler(params)
+        return 200, {}, b''
+
+    emulator.setters[Set.PORT_FORWARDING] = record
+    return calls
+
+
+def new_rules(count):
+    """
+    `count` non-conflicting rules to add
+    """
+    return [rule('192.168.0.{}'.format(10 + idx), 8000 + idx, 80)
+            for idx in range(count)]
+
+
+def test_bulk_update_batches(modem, emulator):
+    forwards = PortForwards(modem)
+    forwards.bulk_update(add=new_rules(2))
+    existing = list(forwards.rules)
+
+    calls = port_forwarding_calls(emulator)
+    rules = forwards.bulk_update(add=new_rules(7)[2:], delete=existing[:1],
+                                 toggle=existing[1:], batch_size=2)
+    # The deletes and toggles in one request, 5 new rules in 3 batches.
+    # The emulator only knows single adds: the 4 rules of the '*'-joined
+    # batches are added one by one.
+    assert [call['action'] for call in calls] == ['apply'] + ['add'] * 7
+    assert [call['local_IP'].count('*') for call in calls[1:]] == \
+        [1, 1, 0, 0, 0, 0, 0]
+
+    assert sorted(r.local_ip for r in rules) == \
+        ['192.168.0.{}'.format(idx) for idx in range(11, 17)]
+    assert [r.enabled for r in rules if r.local_ip == '192.168.0.11'] == \
+        [True]
+    # The caller's rules are left alone
+    assert not existing[0].delete
+
+
+def test_add_forwards_encoding(modem, emulator):
+    # The unverified encoding of several adds in one request
+    calls = port_forwarding_calls(emulator)
+    PortForwards(modem).add_forwards([
+        rule('192.168.0.10', 8080, 80),
+        rule('192.168.0.11', (9000, 9010), (9000, 9010), Proto.both,
+             enabled=False)])
+    assert calls == [{
+        'action': 'add', 'instance': '*',
+        'local_IP': '192.168.0.10*192.168.0.11',
+        'start_port': '8080*9000', 'end_port': '8080*9010',
+        'start_portIn': '80*9000', 'end_portIn': '80*9010',
+        'protocol': '1*3', 'enable': '1*0', 'delete': '0*0', 'idd': '*'}]
+    # The emulator does not accept it
+    assert emulator.state.forwards == []
+
+
+def test_bulk_update_falls_back_to_single_adds(modem, emulator):
+    calls = port_forwarding_calls(emulator)
+
+    rules = PortForwards(modem).bulk_update(add=new_rules(3))
+    # The '*'-joined add changes nothing, the rules are added one by one
+    assert [call['local_IP'].count('*') for call in calls] == [2, 0, 0, 0]
+    assert [call['local_IP'] for call in calls[1:]] == \
+        [r.local_ip for r in new_rules(3)]
+    assert len(rules) == 3 and len(emulator.state.forwards) == 3
+
+
+def test_bulk_update_deletes_duplicate(modem, emulator):
+    forwards = PortForwards(modem)
+    for _ in range(2):
+        forwards.add_forward('192.168.0.10', 8080, 80, Proto.tcp)
+    first, second = forwards.rules
+
+    rules = forwards.bulk_update(delete=[second])
+    assert [r.id for r in rules] == [first.id]
+    assert len(emulator.state.forwards) == 1
+
+
+def test_bulk_update_verifies(modem, emulator):
+    forwards = PortForwards(modem)
+    forwards.bulk_update(add=new_rules(2))
+    existing = list(forwards.rules)
+
+    # Firmware that ignores deletes
+    port_forwarding_calls(emulator, lambda values: values['action'] != 'apply')
+    with pytest.raises(ValueError, match='not deleted'):
+        forwards.bulk_update(delete=existing[:1])
+    assert len(emulator.state.forwards) == 2
+
+    # and single adds
+    port_forwarding_calls(emulator, lambda values: False)
+    with pytest.raises(ValueError, match='not added'):
+        forwards.bulk_update(add=new_rules(3)[2:])
@@ -0,0 +1,110 @@
+"""
+Lazy connection mode of Compal
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from compal import Compal, Get
+from compal.emulator import ModemEmulator
+
+from .conftest import KEY
+
+
+def count_connects(modem):
+    """
+    Record the calls of `modem.connect`
+    """
+    calls = []
+    connect = modem.connect
+
+    def record():
+        calls.append(threading.current_thread())
+        return connect()
+
+    modem.connect = record
+    return calls
+
+
+def test_no_io_in_constructor(emulator):
+    modem = Compal(emulator.router_ip, KEY, lazy=True)
+    assert not modem.connected and modem.initial_res is None
+    assert emulator.state.requests == 0
+
+
+def test_connect_on_first_call(emulator):
+    modem = Compal(emulator.router_ip, KEY, lazy=True)
+    connects = count_connects(modem)
+
+    modem.login()
+    assert modem.connected and len(connects) == 1
+    assert modem.initial_res.url.endswith('common_page/login.html')
+    assert emulator.state.sid is not None
+
+    modem.xml_getter(Get.CM_SYSTEM_INFO, {})
+    modem.logout()
+    assert len(connects) == 1
+    assert emulator.state.rejected == 0
+
+
+def test_concurrent_first_calls_connect_once():
+    with ModemEmulator(key=KEY, latency=0.1) as emulator:
+        modem = Compal(emulator.router_ip, KEY, lazy=True)
+        connects = count_connects(modem)
+        barrier = threading.Barrier(4)
+        tokens = []
+
+        def first_call():
+            barrier.wait()
+            modem.ensure_connected()
+            # Returns once the connection is set up
+            tokens.append(modem.session_token)
+
+        threads = [threading.Thread(target=first_call) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(connects) == 1
+        assert len(tokens) == 4 and None not in tokens
+        # '/' and the login page it redirects to
+        assert emulator.state.requests == 2
+
+
+def test_retry_after_failed_connect(emulator):
+    modem = Compal(emulator.router_ip, KEY, lazy=True)
+    connects = count_connects(modem)
+
+    # The modem drops the connection
+    emulator.state.down_until = time.time() + 60
+    with pytest.raises(Exception):
+        modem.login()
+    assert not modem.connected and not modem.connecting
+
+    emulator.state.down_until = 0
+    modem.login()
+    assert modem.connected and len(connects) == 2
+    assert emulator.state.sid is not None
+    modem.logout()
+
+
+def test_connect_modems_from_asyncio():
+    with ModemEmulator(key=KEY, latency=0.3) as emulator:
+        modems = [Compal(emulator.router_ip, KEY, lazy=True)
+                  for _ in range(4)]
+
+        async def connect_all():
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(None, modem.connect)
+                                   for modem in modems))
+
+        start = time.monotonic()
+        asyncio.run(connect_all())
+        elapsed = time.monotonic() - start
+
+    assert all(modem.connected for modem in modems)
+    # One after the other this takes 4 * 0.3 s
+    assert elapsed < 0.9
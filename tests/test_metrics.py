@@ -0,0 +1,34 @@
+"""
+Request and login metrics
+"""
+from compal import Compal, Get
+from compal.metrics import Metrics
+from compal.recovery import SessionRecovery
+
+from .conftest import KEY
+
+
+def test_login_logout_cycles(emulator):
+    metrics = Metrics()
+    modem = Compal(emulator.router_ip, KEY, metrics=metrics)
+    for _ in range(3):
+        modem.login()
+        modem.logout()
+    assert metrics.logins == 3
+    assert metrics.relogins == 0
+
+
+def test_relogin_after_expiry(emulator):
+    metrics = Metrics()
+    modem = Compal(emulator.router_ip, KEY, metrics=metrics,
+                   recovery=SessionRecovery())
+    modem.login()
+    emulator.state.sid = None
+    assert modem.xml_getter(Get.CM_SYSTEM_INFO, {}).content
+    assert metrics.logins == 2
+    assert metrics.relogins == 1
+
+    stats = metrics.snapshot()[('get', 'CM_SYSTEM_INFO')]
+    assert stats.login_redirects == 1
+    assert stats.count == 2
+    modem.logout()
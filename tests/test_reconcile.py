@@ -0,0 +1,158 @@
+"""
+Desired-state reconciliation against the emulator
+"""
+import pytest
+
+from compal import PortForwards, Proto, Set
+from compal.reconcile import Reconciler
+
+FORWARDS = [
+    {'local_ip': '192.168.178.17', 'ext_port': 443, 'proto': 'tcp'},
+    {'local_ip': '192.168.178.17', 'ext_port': 1022, 'int_port': 22,
+     'proto': 'tcp'},
+]
+
+DESIRED = {
+    'port_forwards': FORWARDS,
+    'dhcp_leases': [{'ip': '192.168.178.17', 'mac': 'D0:50:99:0A:65:52'}],
+    'upnp': False,
+    'mtu': 1400,
+    'remote_access': {'enabled': True, 'port': 9443},
+    'wifi': {'2g': {'ssid': 'home'}},
+}
+
+
+@pytest.fixture
+def setters(modem, monkeypatch):
+    """
+    The functions of the setters that the modem is sent
+    """
+    funs = []
+    xml_setter = modem.xml_setter
+
+    def record(fun, params=None):
+        funs.append(fun)
+        return xml_setter(fun, params)
+
+    monkeypatch.setattr(modem, 'xml_setter', record)
+    return funs
+
+
+def test_apply(modem, emulator, setters):
+    changes = Reconciler(modem).apply(DESIRED)
+    assert [change.section for change in changes] == [
+        'port_forwards', 'dhcp_leases', 'upnp', 'mtu', 'remote_access',
+        'wifi']
+    assert Set.PORT_FORWARDING in setters
+
+    state = emulator.state
+    assert [(rule['local_IP'], rule['start_port'], rule['start_portIn'])
+            for rule in state.forwards] == [
+                ('192.168.178.17', '443', '443'),
+                ('192.168.178.17', '1022', '22')]
+    assert state.static_leases == [('192.168.178.17', 'D0:50:99:0A:65:52')]
+    assert state.upnp == 2
+    assert state.mtu == 1400
+    assert (state.remote_access, state.remote_port) == (1, 9443)
+    assert state.wifi['SSID2g'] == 'home'
+
+
+def test_apply_is_idempotent(modem, setters):
+    assert Reconciler(modem).apply(DESIRED)
+    del setters[:]
+
+    assert Reconciler(modem).apply(DESIRED) == []
+    assert setters == []
+
+
+def test_dry_run(modem, emulator, setters):
+    changes = Reconciler(modem).apply(DESIRED, dry_run=True)
+    assert len(changes) == len(DESIRED)
+    assert setters == []
+
+    assert emulator.state.forwards == []
+    assert emulator.state.mtu == 1500
+    assert emulator.state.wifi['SSID2g'] == 'Ziggo2g'
+
+
+def test_port_forwards_deletes_unlisted(modem, emulator):
+    forwards = PortForwards(modem)
+    forwards.add_forward('192.168.178.17', 443, 443, Proto.tcp)
+    forwards.add_forward('192.168.178.30', 8080, 80, Proto.both)
+
+    changes = Reconciler(modem).apply({'port_forwards': FORWARDS})
+    assert [change.description for change in changes] == \
+        ['add 1, delete 1, toggle 0 rules']
+    assert sorted(int(rule['start_port'])
+                  for rule in emulator.state.forwards) == [443, 1022]
+
+
+def test_port_forwards_deletes_duplicate(modem, emulator):
+    forwards = PortForwards(modem)
+    for _ in range(2):
+        forwards.add_forward('192.168.178.17', 443, 443, Proto.tcp)
+
+    changes = Reconciler(modem).apply({'port_forwards': FORWARDS[:1]})
+    assert [change.description for change in changes] == \
+        ['add 0, delete 1, toggle 0 rules']
+    assert len(emulator.state.forwards) == 1
+    assert Reconciler(modem).apply({'port_forwards': FORWARDS[:1]}) == []
+
+
+def test_dhcp_leases_only_adds_missing(modem, emulator):
+    emulator.state.static_leases.append(
+        ('192.168.178.17', 'd0:50:99:0a:65:52'))
+
+    changes = Reconciler(modem).apply({'dhcp_leases': [
+        {'ip': '192.168.178.17', 'mac': 'D0:50:99:0A:65:52'},
+        {'ip': '192.168.178.18', 'mac': 'd0:50:99:0a:65:53'}]})
+    assert [change.description for change in changes] == \
+        ['add lease 192.168.178.18 => d0:50:99:0a:65:53']
+    assert len(emulator.state.static_leases) == 2
+
+
+def test_upnp(modem, emulator):
+    assert Reconciler(modem).apply({'upnp': True}) == []
+    assert len(Reconciler(modem).apply({'upnp': False})) == 1
+    assert emulator.state.upnp == 2
+
+
+def test_mtu(modem, emulator):
+    assert Reconciler(modem).apply({'mtu': 1500}) == []
+    changes = Reconciler(modem).apply({'mtu': 1400})
+    assert [change.description for change in changes] == \
+        ['set MTU 1500 => 1400']
+    assert emulator.state.mtu == 1400
+
+
+def test_remote_access(modem, emulator):
+    # Disabled; the port does not matter
+    assert Reconciler(modem).apply(
+        {'remote_access': {'enabled': False, 'port': 1}}) == []
+
+    assert len(Reconciler(modem).apply(
+        {'remote_access': {'enabled': True}})) == 1
+    assert (emulator.state.remote_access, emulator.state.remote_port) == \
+        (1, 8443)
+    # Enabled on another port
+    assert len(Reconciler(modem).apply(
+        {'remote_access': {'enabled': True, 'port': 9443}})) == 1
+    assert emulator.state.remote_port == 9443
+
+
+def test_firewall_is_always_applied(modem, setters):
+    for _ in range(2):
+        changes = Reconciler(modem).apply({'firewall': {'enabled': True}})
+        assert [change.section for change in changes] == ['firewall']
+    assert setters == [Set.FIREWALL] * 2
+
+
+def test_unknown_section(modem, setters):
+    with pytest.raises(ValueError, match='dmz'):
+        Reconciler(modem).apply({'mtu': 1400, 'dmz': True})
+    assert setters == []
+
+
+def test_unknown_wifi_setting(modem):
+    with pytest.raises(ValueError):
+        Reconciler(modem).plan({'wifi': {'2g': {'colour': 'blue'}}})
@@ -0,0 +1,115 @@
+"""
+Session recovery and circuit breaker
+"""
+import pytest
+
+from compal import Compal, Get, Set
+from compal.metrics import Metrics
+from compal.recovery import (CircuitOpenError, SessionLostError,
+                             SessionRecovery)
+
+from .conftest import KEY
+
+
+@pytest.fixture
+def recovering(emulator):
+    """
+    A logged in client with session recovery and metrics
+    """
+    modem = Compal(emulator.router_ip, KEY, metrics=Metrics(),
+                   recovery=SessionRecovery(failure_threshold=2,
+                                            cooldown=60))
+    modem.login()
+    return modem
+
+
+def test_empty_getter_keeps_session(recovering, emulator):
+    sid = emulator.state.sid
+    # Not implemented by the emulator: a legitimately empty body
+    res = recovering.xml_getter(Get.DEFAULTVALUE, {})
+    assert res.status_code == 200 and res.content == b''
+    assert emulator.state.sid == sid
+    assert recovering.metrics.relogins == 0
+
+
+def test_empty_known_getter_checks_session(recovering, emulator):
+    sid = emulator.state.sid
+    # A stale token makes the modem answer with an empty body
+    recovering.session_token = 'stale'
+    recovering.xml_getter(Get.CM_SYSTEM_INFO, {})
+    assert emulator.state.sid == sid
+    assert recovering.metrics.relogins == 0
+
+
+def test_expired_session_is_recovered(recovering, emulator):
+    emulator.state.sid = None
+    res = recovering.xml_getter(Get.CM_SYSTEM_INFO, {})
+    assert res.status_code == 200 and res.content
+    assert recovering.metrics.relogins == 1
+
+
+def test_setter_is_not_replayed(recovering, emulator):
+    calls = []
+    handler = emulator.setters[Set.MTU_SIZE]
+
+    def record(params):
+        calls.append(params)
+        return handler(params)
+
+    emulator.setters[Set.MTU_SIZE] = record
+    emulator.state.sid = None
+    with pytest.raises(SessionLostError):
+        recovering.xml_setter(Set.MTU_SIZE, {'MTUSize': 1400})
+    assert calls == [] and recovering.metrics.relogins == 1
+
+    # The session is back for the next call
+    recovering.xml_setter(Set.MTU_SIZE, {'MTUSize': 1400})
+    assert len(calls) == 1 and emulator.state.mtu == 1400
+
+
+def test_circuit_opens_when_denied(recovering, emulator):
+    # Another session holds the modem
+    emulator.state.sid = 'other'
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            recovering.xml_getter(Get.CM_SYSTEM_INFO, {})
+    requests = emulator.state.requests
+    with pytest.raises(CircuitOpenError):
+        recovering.xml_getter(Get.CM_SYSTEM_INFO, {})
+    assert emulator.state.requests == requests
+
+
+def test_factory_reset(recovering, emulator):
+    recovering.factory_reset()
+    assert emulator.state.sid is None
+    assert recovering.metrics.relogins == 0
+
+
+def test_unexpected_errors_end_the_trial(emulator):
+    now = [0.0]
+    recovery = SessionRecovery(failure_threshold=1, cooldown=10,
+                               clock=lambda: now[0])
+    modem = Compal(emulator.router_ip, KEY, recovery=recovery)
+    modem.login()
+    breaker = recovery.breaker(modem.router_ip)
+    post = modem.post
+
+    def failing_post(path, params, **kwargs):
+        raise KeyError(path)
+
+    modem.post = failing_post
+    with pytest.raises(KeyError):
+        modem.xml_getter(Get.CM_SYSTEM_INFO, {})
+    assert breaker.state == 'open'
+
+    # The failed trial backs off
+    now[0] = 10
+    with pytest.raises(KeyError):
+        modem.xml_getter(Get.CM_SYSTEM_INFO, {})
+    assert breaker.state == 'open' and not breaker.trial_running
+    assert breaker.cooldown == 20
+
+    now[0] = 30
+    modem.post = post
+    assert modem.xml_getter(Get.CM_SYSTEM_INFO, {}).content
+    assert breaker.state == 'closed'
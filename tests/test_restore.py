@@ -0,0 +1,98 @@
+"""
+Streamed configuration restores
+"""
+import asyncio
+import io
+import mmap
+import time
+
+import pytest
+
+from compal import BackupRestore
+from compal.aio import AsyncBackupRestore, AsyncCompal, wait_for_reboot
+from compal.emulator import ModemEmulator
+from compal.upload import open_upload
+
+from .conftest import KEY
+
+CONFIG = bytes(range(256)) * 1024
+
+
+def test_open_upload(tmp_path):
+    path = tmp_path / 'config.bin'
+    path.write_bytes(CONFIG)
+
+    # Files are memory-mapped
+    with open_upload(str(path)) as upload:
+        assert isinstance(upload.fileobj, mmap.mmap)
+        assert len(upload) == len(CONFIG)
+        assert upload.read(10) == CONFIG[:10]
+        assert upload.read() == CONFIG[10:]
+        assert upload.read() == b''
+
+    # From the current position on
+    with io.open(str(path), 'rb') as f:  # pylint: disable=invalid-name
+        f.seek(1000)
+        with open_upload(f) as upload:
+            assert len(upload) == len(CONFIG) - 1000
+            assert upload.read() == CONFIG[1000:]
+
+    source = io.BytesIO(b'header' + CONFIG)
+    source.seek(6)
+    with open_upload(source) as upload:
+        assert upload.read() == CONFIG
+
+
+def test_restore_from_path(modem, emulator, tmp_path):
+    path = tmp_path / 'config.bin'
+    path.write_bytes(CONFIG)
+    progress = []
+
+    res = BackupRestore(modem).restore(
+        path, progress=lambda sent, total: progress.append((sent, total)))
+    assert res.status_code == 200
+    assert emulator.state.config_blob == CONFIG
+
+    # Sent in chunks
+    assert len(progress) > 1
+    assert [sent for sent, _ in progress] == \
+        sorted(sent for sent, _ in progress)
+    assert progress[-1] == (len(CONFIG), len(CONFIG))
+
+
+def test_restore_from_file_object(modem, emulator):
+    source = io.BytesIO(b'header' + CONFIG)
+    source.seek(6)
+    assert BackupRestore(modem).restore(source).status_code == 200
+    assert emulator.state.config_blob == CONFIG
+
+
+def test_restore_timeout(modem, emulator):
+    emulator.latency = 1
+    with pytest.raises(modem.timeout_errors):
+        BackupRestore(modem).restore(CONFIG, timeout=0.2)
+    emulator.latency = 0
+
+
+def test_aio_restore_waits_for_reboot():
+    async def run(emulator):
+        async with AsyncCompal(emulator.router_ip, KEY) as modem:
+            await modem.login()
+            start = time.monotonic()
+            res = await AsyncBackupRestore(modem).restore(
+                CONFIG, reboot_timeout=10)
+            assert res.status_code == 200
+            assert time.monotonic() - start >= 0.5
+
+    with ModemEmulator(key=KEY, reboot_time=0.5) as emulator:
+        asyncio.run(run(emulator))
+        assert emulator.state.config_blob == CONFIG
+        assert emulator.state.sid is None
+
+
+def test_wait_for_reboot_timeout():
+    with ModemEmulator(key=KEY, reboot_time=5) as emulator:
+        emulator.state.reboot()
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(wait_for_reboot(emulator.router_ip, timeout=0.5,
+                                        interval=0.1, down_timeout=0.2))
@@ -0,0 +1,105 @@
+"""
+ScanArchive against its own file format and the emulator
+"""
+import os
+
+from compal import FuncScanner, Get
+from compal.scan_archive import MERGE_SEGMENTS, RECORD, ScanArchive
+
+from .conftest import KEY
+
+
+def test_add_and_reopen(tmpdir):
+    path = str(tmpdir.join('scans.archive'))
+    with ScanArchive(path) as archive:
+        archive.add('a', 1, 200, 'one', b'<one/>')
+        archive.add('a', 2, 200, None, b'')
+        archive.add('b', 1, 200, 'one', b'<one/>')
+        archive.add('b', 3, 200, 'three', b'<three/>')
+        # Unflushed entries are visible
+        assert archive.content('b', 3) == b'<three/>'
+
+    with ScanArchive(path) as archive:
+        assert archive.labels() == ['a', 'b']
+        assert archive.content('a', 1) == b'<one/>'
+        assert archive.entry('a', 2).tag is None
+        assert archive.entry('a', 1) == archive.entry('b', 1)
+        assert sorted(archive.diff('a', 'b')) == [2, 3]
+
+        # A newer entry replaces the flushed one
+        archive.add('a', 1, 200, 'uno', b'<uno/>')
+        archive.flush()
+        assert archive.content('a', 1) == b'<uno/>'
+        assert archive.entries('a')[1].tag == 'uno'
+
+    with ScanArchive(path) as archive:
+        assert archive.content('a', 1) == b'<uno/>'
+        assert archive.entries('b')[1].tag == 'one'
+
+
+def test_flush_appends_new_entries_only(tmpdir):
+    path = str(tmpdir.join('scans.archive'))
+    sizes = []
+    with ScanArchive(path) as archive:
+        for label in range(20):
+            for fun in range(50):
+                # Same payloads in every scan: only the index grows
+                archive.add(str(label), fun, 200, 'tag',
+                            str(fun).encode())
+            archive.flush()
+            sizes.append(os.path.getsize(path))
+
+    growth = [after - before for before, after in zip(sizes, sizes[1:])]
+    assert max(growth) < 50 * RECORD.size + 200
+    assert max(growth) - min(growth) < 16
+
+    with ScanArchive(path) as archive:
+        assert len(archive.labels()) == 20
+        assert archive.content('19', 42) == b'42'
+
+
+def test_merge_segments(tmpdir):
+    path = str(tmpdir.join('scans.archive'))
+    with ScanArchive(path) as archive:
+        for idx in range(MERGE_SEGMENTS):
+            archive.add('scan{}'.format(idx % 3), 1, 200, 'tag{}'.format(idx),
+                        str(idx).encode())
+            archive.add('scan{}'.format(idx % 3), idx, 200, 'tag', b'same')
+            archive.flush()
+        assert len(archive.segments) == MERGE_SEGMENTS
+
+    with ScanArchive(path) as archive:
+        # Merged on close
+        assert len(archive.segments) == 1
+        assert archive.labels() == ['scan0', 'scan1', 'scan2']
+        # The newest entries won
+        assert archive.content('scan1', 1) == b'7'
+        assert archive.entry('scan1', 1).tag == 'tag7'
+        assert archive.content('scan2', 5) == b'same'
+        assert sorted(archive.entries('scan0')) == [0, 1, 3, 6]
+
+        archive.add('scan3', 1, 200, 'new', b'new')
+        archive.flush()
+        assert len(archive.segments) == 2
+        archive.compact()
+        assert len(archive.segments) == 1
+        assert archive.content('scan3', 1) == b'new'
+        assert archive.content('scan1', 1) == b'7'
+
+    with ScanArchive(path) as archive:
+        assert archive.labels() == ['scan0', 'scan1', 'scan2', 'scan3']
+        assert archive.entry('scan3', 1).tag == 'new'
+        assert archive.entries('scan0')[1].tag == 'tag6'
+
+
+def test_scan_to_archive(modem, tmpdir):
+    path = str(tmpdir.join('scans.archive'))
+    scanner = FuncScanner(modem, key=KEY, ids=[(0, 5), Get.CM_SYSTEM_INFO])
+    with ScanArchive(path) as archive:
+        scanner.scan_to_archive(archive, 'emulator')
+
+    with ScanArchive(path) as archive:
+        entries = archive.entries('emulator')
+        assert set(entries) == set(scanner.found)
+        assert b'cm_docsis_mode' in archive.content('emulator',
+                                                    Get.CM_SYSTEM_INFO)
@@ -0,0 +1,73 @@
+"""
+FuncScanner checkpoints and session checks
+"""
+import json
+import logging
+
+import pytest
+
+from compal import Compal, FuncScanner, Get
+from compal.cache import ResponseCache
+
+from .conftest import KEY
+
+
+class Response(object):
+    def __init__(self, content):
+        self.status_code = 200
+        self.content = content
+
+
+class ScriptedModem(object):
+    """
+    Answers with the body in `responses` for an id, an empty body
+    otherwise, and raises at `crash_at`
+    """
+    def __init__(self, responses, crash_at=None):
+        self.responses = responses
+        self.crash_at = crash_at
+
+    def xml_getter(self, fun, params):
+        if fun == self.crash_at:
+            raise RuntimeError("crashed at {}".format(fun))
+        return Response(self.responses.get(fun, b''))
+
+    def post(self, path, params):
+        return Response(b'<cm_system_info/>')
+
+
+def test_checkpoint_at_unchecked_empty(tmpdir):
+    checkpoint = str(tmpdir.join('scan.json'))
+    scanner = FuncScanner(ScriptedModem({0: b'<zero/>'}, crash_at=6),
+                          ids=[(0, 20)], checkpoint=checkpoint,
+                          checkpoint_every=1, validate_after=8)
+    with pytest.raises(RuntimeError):
+        list(scanner.sweep(quiet=True))
+
+    with open(checkpoint) as f:
+        state = json.load(f)
+    # 1-5 were empty but the session was not checked yet
+    assert state['pos'] == 1
+    assert FuncScanner(None, checkpoint=checkpoint).current_pos == 1
+
+
+def test_enumerate_without_tag(caplog):
+    scanner = FuncScanner(ScriptedModem({1: b'<one/>', 2: b'not xml'}),
+                          ids=[(0, 3)])
+    with caplog.at_level(logging.INFO, 'compal'):
+        scanner.enumerate()
+    assert 'ONE = 1' in caplog.text
+    assert '(not XML) = 2' in caplog.text
+
+
+def test_session_check_bypasses_cache(emulator):
+    modem = Compal(emulator.router_ip, KEY, cache=ResponseCache())
+    modem.login()
+    scanner = FuncScanner(modem, key=KEY)
+    assert scanner.is_valid_session
+    assert modem.xml_getter(Get.CM_SYSTEM_INFO, {}).content
+
+    # The session expires on the modem, the cached response stays
+    emulator.state.sid = None
+    assert modem.xml_getter(Get.CM_SYSTEM_INFO, {}).content
+    assert not scanner.is_valid_session
@@ -0,0 +1,210 @@
+"""
+Priorities and coalescing of the schedulers, cancellation of the asyncio one
+"""
+import asyncio
+import threading
+
+import pytest
+
+from compal import Get, Set
+from compal.scheduler import (
+    AsyncRequestScheduler, Priority, RequestScheduler, _BaseScheduler,
+    getter_key)
+
+
+class BlockingModem(object):
+    """
+    Records its calls; the calls wait until `gate` is set. `busy` is set
+    once a call is running.
+    """
+    def __init__(self):
+        self.gate = threading.Event()
+        self.busy = threading.Event()
+        self.calls = []
+
+    def xml_getter(self, fun, params):
+        self.busy.set()
+        self.gate.wait(10)
+        self.calls.append(('get', fun))
+        return fun
+
+    def xml_setter(self, fun, params=None):
+        self.busy.set()
+        self.gate.wait(10)
+        self.calls.append(('set', fun))
+        return fun
+
+
+def queue_getter(scheduler, fun, priority=Priority.normal):
+    """
+    Queue a getter without waiting for it
+    """
+    return scheduler.submit(scheduler.modem.xml_getter, fun, {},
+                            priority=priority, key=getter_key(fun, {}))
+
+
+def test_interactive_calls_jump_ahead():
+    modem = BlockingModem()
+    scheduler = RequestScheduler(modem)
+    # Keeps the worker busy while the others are queued
+    busy = queue_getter(scheduler, Get.STATUS)
+    assert modem.busy.wait(10)
+    polls = [queue_getter(scheduler, fun, Priority.background)
+             for fun in (Get.DOWNSTREAM_TABLE, Get.UPSTREAM_TABLE)]
+    setter = scheduler.submit(modem.xml_setter, Set.REBOOT, {},
+                              priority=Priority.interactive)
+    normal = queue_getter(scheduler, Get.CMSTATUS)
+
+    modem.gate.set()
+    assert [future.result(10) for future in [busy, setter, normal] + polls] \
+        == [Get.STATUS, Set.REBOOT, Get.CMSTATUS, Get.DOWNSTREAM_TABLE,
+            Get.UPSTREAM_TABLE]
+    scheduler.close()
+    assert modem.calls == [
+        ('get', Get.STATUS), ('set', Set.REBOOT), ('get', Get.CMSTATUS),
+        ('get', Get.DOWNSTREAM_TABLE), ('get', Get.UPSTREAM_TABLE)]
+
+
+def test_coalesce_queued_getters():
+    modem = BlockingModem()
+    scheduler = RequestScheduler(modem)
+    busy = queue_getter(scheduler, Get.STATUS)
+    assert modem.busy.wait(10)
+    first = queue_getter(scheduler, Get.CMSTATUS, Priority.background)
+    second = queue_getter(scheduler, Get.CMSTATUS, Priority.interactive)
+    # Different parameters are separate calls
+    other = scheduler.submit(modem.xml_getter, Get.CMSTATUS, {'a': 1},
+                             key=getter_key(Get.CMSTATUS, {'a': 1}))
+    assert second is first
+
+    modem.gate.set()
+    assert busy.result(10) == Get.STATUS
+    assert first.result(10) == other.result(10) == Get.CMSTATUS
+    scheduler.close()
+    assert (scheduler.submitted, scheduler.coalesced) == (4, 1)
+    assert modem.calls.count(('get', Get.CMSTATUS)) == 2
+    # The coalesced call ran at the priority of its most urgent caller
+    assert modem.calls[1] == ('get', Get.CMSTATUS)
+
+    # Started calls are not coalesced into
+    modem.calls = []
+    scheduler = RequestScheduler(modem)
+    for _ in range(2):
+        assert scheduler.xml_getter(Get.CMSTATUS, {}) == Get.CMSTATUS
+    scheduler.close()
+    assert scheduler.coalesced == 0 and len(modem.calls) == 2
+
+
+def test_exception_reaches_future():
+    def fail():
+        raise ValueError("No key/password available")
+
+    scheduler = RequestScheduler(BlockingModem())
+    scheduler.modem.gate.set()
+    with pytest.raises(ValueError, match='password'):
+        scheduler.submit(fail).result(10)
+    # The worker survives
+    assert scheduler.xml_getter(Get.STATUS, {}) == Get.STATUS
+    scheduler.close()
+
+
+def test_close_drains_queue():
+    modem = BlockingModem()
+    scheduler = RequestScheduler(modem)
+    futures = [queue_getter(scheduler, fun, Priority.background)
+               for fun in (Get.STATUS, Get.CMSTATUS, Get.SIGNAL_TABLE)]
+    threading.Timer(0.05, modem.gate.set).start()
+
+    scheduler.close()
+    assert not scheduler.worker.is_alive()
+    assert [future.result(0) for future in futures] == \
+        [Get.STATUS, Get.CMSTATUS, Get.SIGNAL_TABLE]
+    assert len(modem.calls) == 3
+
+
+class SlowModem(object):
+    """
+    Getters that take `delay` seconds; records started and cancelled calls
+    """
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = 0
+
+    async def xml_getter(self, fun, params):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return fun
+
+
+def test_cancel_one_waiter():
+    async def run():
+        modem = SlowModem(0.2)
+        scheduler = AsyncRequestScheduler(modem)
+        first = asyncio.ensure_future(asyncio.wait_for(
+            scheduler.xml_getter(Get.CM_SYSTEM_INFO, {}), 0.05))
+        second = asyncio.ensure_future(
+            scheduler.xml_getter(Get.CM_SYSTEM_INFO, {}))
+        with pytest.raises(asyncio.TimeoutError):
+            await first
+        assert await second == Get.CM_SYSTEM_INFO
+        await scheduler.close()
+        return modem, scheduler
+
+    modem, scheduler = asyncio.run(run())
+    assert scheduler.coalesced == 1
+    assert modem.calls == 1
+    assert modem.cancelled == 0
+
+
+def test_cancel_all_waiters():
+    async def run():
+        modem = SlowModem(10)
+        scheduler = AsyncRequestScheduler(modem)
+        waiters = [asyncio.ensure_future(asyncio.wait_for(
+            scheduler.xml_getter(Get.CM_SYSTEM_INFO, {}), 0.05))
+                   for _ in range(2)]
+        for waiter in waiters:
+            with pytest.raises(asyncio.TimeoutError):
+                await waiter
+        # The worker is free again
+        modem.delay = 0
+        assert await scheduler.xml_getter(Get.STATUS, {}) == Get.STATUS
+        await scheduler.close()
+        return modem
+
+    modem = asyncio.run(run())
+    assert modem.calls == 2
+    assert modem.cancelled == 1
+
+
+def test_cancel_queued_call():
+    async def run():
+        modem = SlowModem(0.1)
+        scheduler = AsyncRequestScheduler(modem)
+        busy = scheduler.submit(modem.xml_getter, Get.STATUS, {})
+        queued = scheduler.submit(modem.xml_getter, Get.CMSTATUS, {},
+                                  key='cmstatus')
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.sleep(0)
+        # Not coalesced into the cancelled call
+        again = scheduler.submit(modem.xml_getter, Get.CMSTATUS, {},
+                                 key='cmstatus')
+        assert await busy == Get.STATUS
+        assert await again == Get.CMSTATUS
+        await scheduler.close()
+        return modem, scheduler
+
+    modem, scheduler = asyncio.run(run())
+    assert scheduler.coalesced == 0
+    assert modem.calls == 2
+
+
+def test_base_scheduler_is_abstract():
+    with pytest.raises(TypeError):
+        _BaseScheduler(None)  # pylint: disable=abstract-class-instantiated
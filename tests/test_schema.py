@@ -0,0 +1,91 @@
+"""
+Declarative response schemas
+"""
+import logging
+
+from lxml import etree
+
+from compal import Get, schema
+from compal.reconcile import Reconciler
+from compal.schema import Field, Rows, Schema, decode, int_or_text
+
+
+def test_int_or_text():
+    assert int_or_text('12') == 12
+    assert int_or_text('0') == 0
+    assert int_or_text('-3') == -3
+    # Keys and other text that only look numeric
+    assert int_or_text('00998877') == '00998877'
+    assert int_or_text('0x10') == '0x10'
+    assert int_or_text(' 7') == ' 7'
+    assert int_or_text('Ziggo') == 'Ziggo'
+    assert int_or_text(None) is None
+
+
+def test_tags_are_case_insensitive():
+    values = decode(Get.WIRELESSBASIC, etree.fromstring(
+        '<WirelessBasic><SSID2G>upper</SSID2G><ssid5g>lower</ssid5g>'
+        '<PreSharedKey2g>00998877</PreSharedKey2g>'
+        '<bssCOEXISTENCE>0</bssCOEXISTENCE></WirelessBasic>'))
+    assert (values['SSID2g'], values['SSID5g']) == ('upper', 'lower')
+    assert values['PreSharedKey2g'] == '00998877'
+    assert values['BssCoexistence'] is False
+
+    # The lookup of each spelling is cached
+    resolved = schema.SCHEMAS[Get.WIRELESSBASIC].resolved
+    assert resolved['SSID2G'].name == 'SSID2g'
+    assert resolved['ssid5g'].name == 'SSID5g'
+
+
+def test_missing_fields_and_rows():
+    values = decode(Get.FORWARDING, etree.fromstring(
+        '<Forwarding><LanIP>192.168.178.1</LanIP><unknown>1</unknown>'
+        '</Forwarding>'))
+    assert values == {'LanIP': '192.168.178.1', 'subnetmask': None,
+                      'instance': []}
+
+    # Empty elements are missing values too
+    values = decode(Get.CM_SYSTEM_INFO, etree.fromstring(
+        '<cm_system_info><cm_docsis_mode/></cm_system_info>'))
+    assert set(values.values()) == {None}
+
+
+def test_rows():
+    table = Schema([Field('count', coerce=schema.integer),
+                    Rows('row', Schema([Field('name')]))])
+    values = table.decode(etree.fromstring(
+        '<table><count>2</count><!-- comment --><row><name>a</name></row>'
+        '<ROW><name>b</name></ROW></table>'))
+    assert values == {'count': 2, 'row': [{'name': 'a'}, {'name': 'b'}]}
+
+
+def test_unverified_schemas():
+    assert {fun for fun, getter in schema.SCHEMAS.items()
+            if not getter.verified} == \
+        {Get.LANSETTING, Get.MTUSIZE, Get.REMOTEACCESS}
+
+
+class Response(object):
+    """
+    A response with a body
+    """
+    def __init__(self, content):
+        self.content = content
+
+
+class Modem(object):
+    """
+    Answers every getter with `content`
+    """
+    def __init__(self, content):
+        self.content = content
+
+    def xml_getter(self, _fun, _params):
+        return Response(self.content)
+
+
+def test_unverified_mismatch_is_logged(caplog):
+    modem = Modem(b'<mtu><MTU>1500</MTU></mtu>')
+    with caplog.at_level(logging.WARNING, logger='compal.reconcile'):
+        assert Reconciler(modem).current(Get.MTUSIZE) == {'MTUSize': None}
+    assert 'unverified schema' in caplog.text
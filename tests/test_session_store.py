@@ -0,0 +1,142 @@
+"""
+Session stores and resuming sessions against the emulator
+"""
+import threading
+
+import pytest
+
+from compal import Compal, Get
+from compal.metrics import Metrics
+from compal.session_store import (
+    FileSessionStore, SQLiteSessionStore, SessionStore)
+
+from .conftest import KEY, TRANSPORTS
+
+STORES = {
+    'file': lambda path, **kwargs: FileSessionStore(
+        str(path / 'sessions.json'), **kwargs),
+    'sqlite': lambda path, **kwargs: SQLiteSessionStore(
+        str(path / 'sessions.db'), **kwargs),
+}
+
+
+@pytest.fixture(params=sorted(STORES))
+def make_store(request, tmp_path):
+    """
+    Create a store of each kind in a temporary directory
+    """
+    return lambda **kwargs: STORES[request.param](tmp_path, **kwargs)
+
+
+def test_round_trip(make_store):
+    store = make_store()
+    assert store.load('10.0.0.1') is None
+
+    store.save('10.0.0.1', 'sid', 'token', 'http://10.0.0.1/')
+    store.save('10.0.0.2', 'other', 'token2', None)
+    # Another instance on the same file
+    session = make_store().load('10.0.0.1')
+    assert (session.sid, session.token, session.referer) == \
+        ('sid', 'token', 'http://10.0.0.1/')
+
+    store.delete('10.0.0.1')
+    assert store.load('10.0.0.1') is None
+    assert store.load('10.0.0.2').sid == 'other'
+
+
+def test_expired(make_store):
+    store = make_store(max_age=-1)
+    store.save('10.0.0.1', 'sid', 'token', None)
+    assert store.load('10.0.0.1') is None
+    # Expired sessions are removed
+    store.max_age = None
+    assert store.load('10.0.0.1') is None
+
+
+def test_concurrent_saves(make_store):
+    def save(idx):
+        store = make_store()
+        for num in range(20):
+            store.save('10.0.{}.{}'.format(idx, num), 'sid', 'token', None)
+
+    threads = [threading.Thread(target=save, args=(idx,))
+               for idx in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    store = make_store()
+    # No client lost the sessions of another
+    assert all(store.load('10.0.{}.{}'.format(idx, num)) is not None
+               for idx in range(8) for num in range(20))
+
+
+@pytest.mark.parametrize('transport', sorted(TRANSPORTS))
+def test_resume(make_store, emulator, transport):
+    store = make_store()
+    modem = Compal(emulator.router_ip, KEY, session_store=store,
+                   transport=TRANSPORTS[transport]())
+    modem.login()
+    modem.suspend()
+    sid = emulator.state.sid
+
+    requests = emulator.state.requests
+    modem = Compal(emulator.router_ip, KEY, session_store=store,
+                   transport=TRANSPORTS[transport]())
+    modem.login()
+    # One getter validates the session, no redirect or login
+    assert emulator.state.requests == requests + 1
+    assert emulator.state.sid == sid
+    assert modem.logged_in
+
+    modem.logout()
+    assert store.load(emulator.router_ip) is None
+    assert emulator.state.rejected == 0
+
+
+@pytest.mark.parametrize('transport', sorted(TRANSPORTS))
+def test_resume_expired(make_store, emulator, transport):
+    store = make_store()
+    modem = Compal(emulator.router_ip, KEY, session_store=store,
+                   transport=TRANSPORTS[transport]())
+    modem.login()
+    modem.suspend()
+    # The modem dropped the session
+    emulator.state.sid = None
+
+    modem = Compal(emulator.router_ip, KEY, session_store=store,
+                   transport=TRANSPORTS[transport]())
+    modem.login()
+    assert not modem.resumed
+    # Only the cookies of the new session are left
+    assert modem.session.cookies.get('SID') == emulator.state.sid
+    assert modem.session.cookies.get('sessionToken') == modem.session_token
+    assert modem.xml_getter(Get.CM_SYSTEM_INFO, {}).status_code == 200
+    assert store.load(emulator.router_ip) is None
+
+    modem.logout()
+    assert emulator.state.rejected == 0
+
+
+def test_login_after_resume_is_a_relogin(make_store, emulator):
+    store = make_store()
+    modem = Compal(emulator.router_ip, KEY, session_store=store)
+    modem.login()
+    modem.suspend()
+
+    modem = Compal(emulator.router_ip, KEY, session_store=store,
+                   metrics=Metrics())
+    modem.login()
+    assert modem.metrics.logins == 0
+    # The resumed session is lost: logging in again is a re-login
+    emulator.state.sid = None
+    modem.login()
+    assert (modem.metrics.logins, modem.metrics.relogins) == (1, 1)
+    modem.logout()
+    assert not modem.logged_in
+
+
+def test_session_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()  # pylint: disable=abstract-class-instantiated
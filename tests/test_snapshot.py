@@ -0,0 +1,98 @@
+"""
+Multi-function snapshots
+"""
+import collections
+
+import pytest
+
+from compal import Compal, Get, PortForward, Proto, RadioSettings
+from compal.snapshot import freeze
+
+from .conftest import KEY
+
+# A response without content
+Response = collections.namedtuple('Response', ['content'])
+
+
+def test_snapshot_logs_out(emulator):
+    modem = Compal(emulator.router_ip, KEY)
+    snap = modem.snapshot([Get.CM_SYSTEM_INFO, Get.FORWARDING,
+                           Get.WIRELESSBASIC, Get.DEFAULTVALUE])
+    assert emulator.state.sid is None
+    assert emulator.state.rejected == 0
+
+    assert sorted(snap) == sorted([Get.CM_SYSTEM_INFO, Get.FORWARDING,
+                                   Get.WIRELESSBASIC, Get.DEFAULTVALUE])
+    assert snap[Get.FORWARDING] == ()
+    radio = snap[Get.WIRELESSBASIC]
+    assert radio._fields == RadioSettings._fields
+    assert radio.radio_2g.ssid == emulator.state.wifi['SSID2g']
+    # No content
+    assert snap[Get.DEFAULTVALUE] is None
+    assert snap.router_ip == emulator.router_ip and snap.elapsed > 0
+
+    with pytest.raises(AttributeError):
+        snap.router_ip = 'other'
+    with pytest.raises(TypeError):
+        snap[Get.FORWARDING] = None
+    # The values are frozen too
+    with pytest.raises(AttributeError):
+        radio.radio_2g.ssid = 'other'
+    with pytest.raises(TypeError):
+        snap[Get.CM_SYSTEM_INFO]['cm_docsis_mode'] = 'other'
+
+
+def test_freeze():
+    forward = PortForward(local_ip='192.168.178.17', ext_port=(443, 443),
+                          int_port=(443, 443), proto=Proto.tcp,
+                          enabled=True, delete=False, idd=1, id=1,
+                          lan_ip='192.168.178.1')
+    frozen = freeze([forward, {'ports': [1, 2]}])
+    assert frozen[0] == tuple(forward)
+    assert frozen[0].local_ip == forward.local_ip
+    assert frozen[1]['ports'] == (1, 2)
+    with pytest.raises(AttributeError):
+        frozen[0].enabled = False
+    with pytest.raises(TypeError):
+        frozen[1]['ports'] = ()
+    # The original is not affected
+    forward.enabled = False
+    assert frozen[0].enabled
+
+
+def test_snapshot_empty_responses(emulator):
+    modem = Compal(emulator.router_ip, KEY)
+    getter = modem.xml_getter
+
+    def empty_getter(fun, params):
+        if fun in (Get.FORWARDING, Get.WIRELESSBASIC):
+            return Response(b'')
+        return getter(fun, params)
+
+    modem.xml_getter = empty_getter
+    snap = modem.snapshot([Get.CM_SYSTEM_INFO, Get.FORWARDING,
+                           Get.WIRELESSBASIC])
+    assert snap[Get.FORWARDING] is None and snap[Get.WIRELESSBASIC] is None
+    assert snap[Get.CM_SYSTEM_INFO] is not None
+
+
+def test_snapshot_logs_out_on_error(emulator):
+    modem = Compal(emulator.router_ip, KEY)
+    getter = modem.xml_getter
+
+    def failing_getter(fun, params):
+        if fun == Get.WIRELESSBASIC:
+            raise ValueError("failed")
+        return getter(fun, params)
+
+    modem.xml_getter = failing_getter
+    with pytest.raises(ValueError):
+        modem.snapshot([Get.CM_SYSTEM_INFO, Get.WIRELESSBASIC])
+    assert emulator.state.sid is None
+
+
+def test_snapshot_in_session(modem, emulator):
+    snap = modem.snapshot([Get.CM_SYSTEM_INFO], login=False)
+    assert len(snap) == 1
+    # Still logged in
+    assert emulator.state.sid is not None
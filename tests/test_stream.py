@@ -0,0 +1,67 @@
+"""
+Streaming table parsing against the emulator
+"""
+from compal import PortForwards, Proto
+from compal.stream import TableStream, iter_elements
+
+
+def test_event_log(modem, emulator):
+    events = list(TableStream(modem, chunk_size=256).event_log())
+    assert len(events) == emulator.state.num_events
+    assert events[0]['text'] == 'Emulated event 0'
+    assert events[-1]['t'] == str(1514764800 + emulator.state.num_events - 1)
+    assert set(events[0]) == {'prior', 'text', 'time', 't'}
+
+
+def test_firewall_log(modem, emulator):
+    records = list(TableStream(modem, chunk_size=256).firewall_log())
+    assert len(records) == emulator.state.num_events
+    assert records[1]['text'] == 'Blocked port scan from 10.0.0.1'
+    assert records[1]['prior'] == 'Warning'
+
+
+def test_lan_users(modem, emulator):
+    emulator.state.static_leases.append(
+        ('192.168.178.99', '00:00:00:00:00:99'))
+
+    users = list(TableStream(modem).lan_users())
+    assert len(users) == emulator.state.num_clients + 1
+    assert users[0]['IPv4Addr'] == '192.168.178.10/24'
+    assert users[-1]['MACAddr'] == '00:00:00:00:00:99'
+    assert users[-1]['method'] == '2'
+
+
+def test_port_forwards(modem, emulator):
+    emulator.state.lan_ip = '192.168.178.254'
+    forwards = PortForwards(modem)
+    forwards.add_forward('192.168.178.10', 8080, 80, Proto.tcp)
+    forwards.add_forward('192.168.178.11', (9000, 9010), (9000, 9010),
+                         Proto.both)
+
+    rules = list(TableStream(modem, chunk_size=64).port_forwards())
+    assert rules == list(forwards.rules)
+    assert [rule.lan_ip for rule in rules] == ['192.168.178.254'] * 2
+    assert rules[1].ext_port == (9000, 9010)
+    assert rules[1].proto == Proto.both
+
+
+def test_port_forwards_empty(modem):
+    assert list(TableStream(modem).port_forwards()) == []
+
+
+def test_yielded_elements_are_dropped():
+    body = '<table>{}</table>'.format(''.join(
+        '<row><a>{0}</a><b>{0}</b></row>'.format(idx) for idx in range(10)))
+    chunks = [body[idx:idx + 7].encode() for idx in range(0, len(body), 7)]
+
+    seen = []
+    for element in iter_elements(chunks, 'row'):
+        assert element.findtext('a') == str(len(seen))
+        if seen:
+            # The previous element is cleared, the ones before it are gone
+            assert len(seen[-1]) == 0
+            assert seen[-1].getparent() is element.getparent()
+            assert all(old.getparent() is None for old in seen[:-1])
+            assert element.getparent().index(element) == 1
+        seen.append(element)
+    assert len(seen) == 10
@@ -0,0 +1,94 @@
+"""
+Tracing hooks
+"""
+import pytest
+
+from compal import BackupRestore, Get, PortForwards, WifiSettings, tracing
+from compal.tracing import NullTracer, RecordingTracer
+
+
+def test_nested_spans():
+    tracer = RecordingTracer()
+    with tracer.start_as_current_span('outer', {'a': 1}) as outer:
+        with tracer.start_as_current_span('inner') as inner:
+            inner.set_attribute('b', 2)
+            with tracer.start_as_current_span('innermost'):
+                pass
+        assert inner.parent == 'outer'
+    with tracer.start_as_current_span('second'):
+        pass
+
+    spans = {record.name: record for record in tracer.spans}
+    assert [record.name for record in tracer.spans] == \
+        ['innermost', 'inner', 'outer', 'second']
+    assert (spans['outer'].parent, spans['inner'].parent,
+            spans['innermost'].parent) == (None, 'outer', 'inner')
+    assert spans['outer'].attributes == {'a': 1}
+    assert spans['inner'].attributes == {'b': 2}
+    # One trace per top-level span
+    assert spans['inner'].trace_id == spans['innermost'].trace_id == \
+        outer.trace_id
+    assert spans['second'].trace_id != outer.trace_id
+    assert spans['outer'].duration >= spans['inner'].duration
+    assert tracer.stack() == []
+
+
+def test_modem_spans(modem):
+    tracer = RecordingTracer()
+    modem.tracer = tracer
+    list(PortForwards(modem).rules)
+
+    names = [record.name for record in tracer.spans]
+    assert names == ['compal.encode', 'compal.network', 'compal.parse']
+    assert tracer.spans[1].attributes['http.status_code'] == 200
+    assert set(tracer.totals()) == set(names)
+
+    tracer.clear()
+    wifi = WifiSettings(modem)
+    wifi.wifi_settings
+    bands = [(record.parent, record.attributes.get('compal.band'))
+             for record in tracer.spans if record.name == 'compal.parse']
+    # parse_xml, both bands inside the settings span, the settings span
+    assert bands == [(None, None), ('compal.parse', '2g'),
+                     ('compal.parse', '5g'), (None, None)]
+
+    tracer.clear()
+    WifiSettings.band_setting(wifi.wifi_settings_xml, '5g', modem)
+    assert tracer.spans[-1].attributes == {
+        'compal.function': Get.WIRELESSBASIC, 'compal.band': '5g'}
+
+    tracer.clear()
+    assert BackupRestore(modem).backup()
+    backup = tracer.spans[-1]
+    assert backup.name == 'compal.backup' and backup.parent is None
+    children = [record for record in tracer.spans if record is not backup]
+    assert [record.name for record in children] == [
+        'compal.encode', 'compal.network', 'compal.parse', 'compal.network']
+    assert {(record.parent, record.trace_id) for record in children} == \
+        {('compal.backup', backup.trace_id)}
+    assert 'compal.backup' in tracer.totals()
+
+
+def test_null_tracer(modem):
+    assert isinstance(tracing.get_tracer(modem), NullTracer)
+    with tracing.span(modem, 'compal.parse', {'a': 1}) as span:
+        span.set_attribute('b', 2)
+    # The shared no-op span keeps nothing
+    assert span is tracing.span(None, 'other')
+    assert not hasattr(span, '__dict__')
+    # and does not swallow exceptions
+    with pytest.raises(KeyError):
+        with tracing.span(modem, 'compal.parse'):
+            raise KeyError('a')
+
+
+def test_set_tracer():
+    tracer = RecordingTracer()
+    tracing.set_tracer(tracer)
+    try:
+        with tracing.span(None, 'global'):
+            pass
+    finally:
+        tracing.set_tracer(None)
+    assert [record.name for record in tracer.spans] == ['global']
+    assert isinstance(tracing.get_tracer(), NullTracer)
@@ -0,0 +1,162 @@
+"""
+Errors of the transports
+"""
+import http.client
+import socket
+import threading
+import time
+
+import pytest
+
+from compal import Compal, Get
+from compal.recovery import SessionRecovery
+from compal.transport import (HTTPClientTransport, TransportError,
+                              TransportTimeout)
+
+from .conftest import KEY
+
+
+@pytest.fixture
+def garbage_server():
+    """
+    A server answering every connection with an invalid status line
+    """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            conn.recv(4096)
+            conn.sendall(b'garbage\r\n\r\n')
+            conn.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield '{}:{}'.format(*server.getsockname())
+    server.close()
+
+
+@pytest.fixture
+def closing_server():
+    """
+    A keep-alive server that closes its first connection when the second
+    request arrives on it, without answering. Records the request lines.
+    """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(2)
+    requests = []
+
+    def handle(conn, first):
+        reader = conn.makefile('rb')
+        while True:
+            head = []
+            line = reader.readline()
+            while line not in (b'\r\n', b''):
+                head.append(line)
+                line = reader.readline()
+            if not head:
+                break
+            length = [int(header.split(b':')[1]) for header in head
+                      if header.lower().startswith(b'content-length')]
+            reader.read(length[0] if length else 0)
+            requests.append(head[0].split()[:2])
+            if first and len(requests) > 1:
+                break
+            conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+        reader.close()
+        conn.close()
+
+    def serve():
+        first = True
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn, first),
+                             daemon=True).start()
+            first = False
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield 'http://{}:{}'.format(*server.getsockname()), requests
+    server.close()
+
+
+def test_timeout(emulator):
+    modem = Compal(emulator.router_ip, KEY, timeout=0.2,
+                   transport=HTTPClientTransport())
+    modem.login()
+    emulator.latency = 0.5
+    with pytest.raises(TransportTimeout):
+        modem.xml_getter(Get.CM_SYSTEM_INFO, {})
+    emulator.latency = 0.0
+    time.sleep(0.5)
+
+    # The late response is not read as the answer to the next request
+    res = modem.session.get(modem.url('/'), timeout=1)
+    assert res.status_code == 200
+    assert b'cm_docsis_mode' not in res.content
+
+
+def test_reboot_timeout(modem, emulator):
+    modem.timeout = 0.2
+    emulator.latency = 0.5
+    assert modem.reboot() is None
+    emulator.latency = 0.0
+    # Let the emulator finish the reboot
+    time.sleep(0.5)
+    assert emulator.state.sid is None
+
+
+def test_protocol_error(garbage_server):
+    transport = HTTPClientTransport()
+    with pytest.raises(TransportError) as err:
+        transport.get('http://{}/'.format(garbage_server), timeout=1)
+    assert isinstance(err.value, OSError)
+    assert isinstance(err.value.__cause__, http.client.HTTPException)
+
+
+class FailingModem(object):
+    router_ip = '192.168.178.1'
+
+    def post(self, path, params, **kwargs):
+        raise http.client.BadStatusLine('garbage')
+
+
+def test_recovery_counts_protocol_errors():
+    recovery = SessionRecovery()
+    with pytest.raises(http.client.HTTPException):
+        recovery.call(FailingModem(), '/xml/getter.xml',
+                      {'fun': Get.CM_SYSTEM_INFO})
+    assert recovery.breaker(FailingModem.router_ip).failures == 1
+
+
+@pytest.mark.parametrize('method, path, replayed', [
+    ('GET', '/', True),
+    ('POST', '/xml/getter.xml', True),
+    ('POST', '/xml/setter.xml', False),
+])
+def test_retry_on_closed_idle_connection(closing_server, method, path,
+                                         replayed):
+    url, requests = closing_server
+    transport = HTTPClientTransport()
+    assert transport.get(url + '/', timeout=1).content == b'ok'
+
+    if replayed:
+        res = transport.request(method, url + path, data={'fun': 1},
+                                timeout=1)
+        assert res.content == b'ok'
+    else:
+        # The modem may have executed it
+        with pytest.raises(TransportError):
+            transport.request(method, url + path, data={'fun': 1}, timeout=1)
+    assert [line[1].decode() for line in requests] == \
+        ['/'] + [path] * (2 if replayed else 1)
+    transport.close()
@@ -0,0 +1,52 @@
+"""
+WiFi settings round trips
+"""
+import pytest
+
+from compal import Set, WifiSettings
+from compal.reconcile import Reconciler
+
+
+def test_update_round_trip(modem, emulator):
+    emulator.state.wifi['PreSharedKey2g'] = '00998877'
+    emulator.state.wifi['SSID5g'] = '0123'
+
+    wifi = WifiSettings(modem)
+    settings = wifi.wifi_settings
+    assert settings.radio_2g.pre_shared_key == '00998877'
+    assert settings.radio_5g.ssid == '0123'
+
+    wifi.update_wifi_settings(settings)
+    assert emulator.state.wifi['PreSharedKey2g'] == '00998877'
+    assert emulator.state.wifi['SSID5g'] == '0123'
+    assert wifi.wifi_settings == settings
+
+
+def test_reconcile_keeps_other_band(modem, emulator):
+    emulator.state.wifi['PreSharedKey2g'] = '00998877'
+
+    changes = Reconciler(modem).apply({'wifi': {'5g': {'ssid': 'new5g'}}})
+    assert len(changes) == 1
+    assert emulator.state.wifi['SSID5g'] == 'new5g'
+    assert emulator.state.wifi['PreSharedKey2g'] == '00998877'
+
+    assert Reconciler(modem).apply({'wifi': {'5g': {'ssid': 'new5g'}}}) == []
+
+
+def test_update_field_order(modem):
+    sent = []
+    modem.xml_setter = lambda fun, params: sent.append((fun, list(params)))
+
+    wifi = WifiSettings(modem)
+    wifi.update_wifi_settings(wifi.wifi_settings)
+    # The order of the baseline setter, the bands alternate
+    assert sent == [(Set.WIFI_SETTINGS, [
+        'wl{}{}'.format(name, band) for name in (
+            'BandMode', 'Ssid', 'Bandwidth', 'TxMode', 'MCastRate', 'Hiden',
+            'PSkey', 'Txrate', 'Rekey', 'Channel', 'Security', 'Wpaalg')
+        for band in ('2g', '5g')])]
+
+
+def test_reconcile_rejects_bss_coexistence(modem):
+    with pytest.raises(ValueError):
+        Reconciler(modem).plan({'wifi': {'bss_coexistence': True}})